@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import UserProfile, Account, Category, Transaction, Budget, Goal
+from .models import UserProfile, Account, ExchangeRate, Category, Transaction, RecurringRule, MonthlyRollup, BalanceCheckpoint, Budget, BudgetAlert, Goal, Job
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
@@ -7,10 +7,16 @@ class UserProfileAdmin(admin.ModelAdmin):
 
 @admin.register(Account)
 class AccountAdmin(admin.ModelAdmin):
-    list_display = ('name', 'user', 'account_type', 'balance', 'created_at')
-    list_filter = ('account_type', 'created_at')
+    list_display = ('name', 'user', 'account_type', 'currency', 'balance', 'opening_balance', 'created_at')
+    list_filter = ('account_type', 'currency', 'created_at')
     search_fields = ('name', 'user__username')
 
+@admin.register(ExchangeRate)
+class ExchangeRateAdmin(admin.ModelAdmin):
+    list_display = ('currency', 'date', 'rate')
+    list_filter = ('currency',)
+    date_hierarchy = 'date'
+
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ('name', 'user', 'category_type')
@@ -24,14 +30,58 @@ class TransactionAdmin(admin.ModelAdmin):
     search_fields = ('description', 'notes')
     date_hierarchy = 'date'
 
+@admin.register(RecurringRule)
+class RecurringRuleAdmin(admin.ModelAdmin):
+    list_display = ('description', 'user', 'account', 'amount', 'frequency', 'interval', 'next_date', 'is_active')
+    list_filter = ('frequency', 'is_active', 'transaction_type')
+    search_fields = ('description', 'user__username')
+    readonly_fields = ('occurrences', 'next_date')
+
+class DerivedDataAdmin(admin.ModelAdmin):
+    """View-only: rows derived from transactions, which hand edits would silently put out of step"""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(MonthlyRollup)
+class MonthlyRollupAdmin(DerivedDataAdmin):
+    list_display = ('month', 'user', 'account', 'category', 'transaction_type', 'amount', 'count')
+    list_filter = ('transaction_type', 'month')
+    search_fields = ('user__username',)
+
+@admin.register(BalanceCheckpoint)
+class BalanceCheckpointAdmin(DerivedDataAdmin):
+    list_display = ('month', 'account', 'net_before', 'created_at')
+    list_filter = ('month',)
+    search_fields = ('account__name', 'account__user__username')
+
 @admin.register(Budget)
 class BudgetAdmin(admin.ModelAdmin):
-    list_display = ('category', 'user', 'amount', 'start_date', 'end_date')
+    list_display = ('category', 'user', 'amount', 'spent_counter', 'start_date', 'end_date')
     list_filter = ('start_date', 'end_date')
     search_fields = ('category__name',)
 
+@admin.register(BudgetAlert)
+class BudgetAlertAdmin(admin.ModelAdmin):
+    list_display = ('budget', 'user', 'threshold', 'spent_amount', 'budget_amount', 'created_at')
+    list_filter = ('threshold', 'created_at')
+    search_fields = ('user__username', 'budget__category__name')
+
 @admin.register(Goal)
 class GoalAdmin(admin.ModelAdmin):
     list_display = ('name', 'user', 'target_amount', 'current_amount', 'target_date', 'get_percentage_complete')
     list_filter = ('target_date',)
     search_fields = ('name',)
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'user', 'status', 'progress', 'total', 'attempts', 'worker', 'created_at', 'finished_at')
+    list_filter = ('kind', 'status', 'created_at')
+    search_fields = ('user__username', 'worker')
+    readonly_fields = ('attempts', 'worker', 'heartbeat_at', 'started_at', 'finished_at')
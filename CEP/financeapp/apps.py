@@ -1,6 +1,23 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
+
+
+def create_search_index(sender, using='default', **kwargs):
+    from .search import install_search_index
+    install_search_index(using)
 
 
 class FinanceappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'financeapp'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        # The full-text index is backend specific, so it is created outside the model schema
+        post_migrate.connect(create_search_index, sender=self)
+        # Before any connection opens, so every connection can count queries for MetricsMiddleware
+        if settings.METRICS_ENABLED:
+            from .metrics import install_query_recorder
+            connection_created.connect(install_query_recorder, dispatch_uid='financeapp.metrics')
@@ -0,0 +1,124 @@
+import asyncio
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from rest_framework.exceptions import APIException, AuthenticationFailed, NotAuthenticated
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+from .cache import dashboard_cache_key, dashboard_etag, get_dashboard_version
+from .dashboard import assemble_dashboard_summary, get_dashboard_sections
+
+# Bounded pool shared by all requests; each thread keeps its own DB connection
+section_executor = ThreadPoolExecutor(
+    max_workers=settings.DASHBOARD_ASYNC_WORKERS,
+    thread_name_prefix='dashboard-section'
+)
+
+
+def get_authenticators():
+    return [auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+
+
+def authenticate(request):
+    """Resolve the user with the same authenticators the DRF views use
+
+    Raises AuthenticationFailed for an invalid or expired token.
+    """
+    return Request(request, authenticators=get_authenticators()).user
+
+
+def error_response(request, exc):
+    """The response DRF's exception handler gives an API view raising `exc`"""
+    response = JsonResponse({'detail': exc.detail}, status=exc.status_code, encoder=JSONEncoder)
+    if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
+        # As APIView.permission_denied: 401 with a challenge if the first authenticator has one, else 403
+        header = get_authenticators()[0].authenticate_header(request)
+        if header:
+            response['WWW-Authenticate'] = header
+        else:
+            response.status_code = 403
+    return response
+
+
+def run_section(compute):
+    """Run one dashboard section in a pool thread, returning (result, seconds)"""
+    started = time.perf_counter()
+    try:
+        return compute(), time.perf_counter() - started
+    finally:
+        # Pool threads never see request_finished, so honour CONN_MAX_AGE here
+        close_old_connections()
+
+
+async def compute_dashboard(user, today):
+    """Run every dashboard section concurrently and assemble the payload"""
+    loop = asyncio.get_running_loop()
+    sections = get_dashboard_sections(user, today)
+    # Each section runs in a copy of the request's context, so e.g. its queries count towards the request metrics
+    outcomes = await asyncio.gather(*(
+        loop.run_in_executor(section_executor, contextvars.copy_context().run, run_section, compute)
+        for compute in sections.values()
+    ))
+
+    results = {}
+    timings = {}
+    for name, (result, seconds) in zip(sections, outcomes):
+        results[name] = result
+        timings[name] = seconds
+    return assemble_dashboard_summary(results, today), timings
+
+
+async def dashboard_summary_async(request):
+    """Dashboard summary with its independent sections computed concurrently
+
+    Returns the same payload as dashboard_summary. On a cache miss the
+    per-section durations are reported in a Server-Timing header, so the
+    slowest section rather than the sum of all of them sets the latency.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+
+    try:
+        return await build_dashboard_response(request)
+    except APIException as exc:
+        # e.g. a bad token, or MissingExchangeRate from one of the sections
+        return error_response(request, exc)
+
+
+async def build_dashboard_response(request):
+    user = await sync_to_async(authenticate)(request)
+    if not user.is_authenticated:
+        raise NotAuthenticated
+
+    today = timezone.now().date()
+    version = await sync_to_async(get_dashboard_version)(user.pk)
+    etag = dashboard_etag(user.pk, version, today)
+
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponse(status=304)
+    else:
+        key = dashboard_cache_key(user.pk, version, today)
+        data = await cache.aget(key)
+        timings = {}
+        if data is None:
+            data, timings = await compute_dashboard(user, today)
+            await cache.aset(key, data, timeout=settings.DASHBOARD_CACHE_TIMEOUT)
+
+        response = JsonResponse(data, encoder=JSONEncoder)
+        if timings:
+            response['Server-Timing'] = ', '.join(
+                f'{name};dur={seconds * 1000:.1f}' for name, seconds in timings.items()
+            )
+
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
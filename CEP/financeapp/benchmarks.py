@@ -0,0 +1,268 @@
+import statistics
+import threading
+import time
+import tracemalloc
+from datetime import date
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import CommandError
+from django.db import OperationalError, close_old_connections, connection, connections, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .cache import dashboard_cache_key, get_dashboard_version
+from .fastpath import orjson, render_json, values_serializer
+from .fx import forget_currency_context
+from .models import Account, Category, Transaction
+from .serializers import TransactionSerializer
+
+# name -> callable(client, user) returning a response; registered with @scenario
+SCENARIOS = {}
+
+
+class Rollback(Exception):
+    """Raised to undo the writes of a benchmark iteration"""
+
+
+def scenario(name, writes=False):
+    """Register a benchmark scenario; writes are rolled back after every iteration"""
+    def register(func):
+        func.scenario = name
+        func.writes = writes
+        SCENARIOS[name] = func
+        return func
+    return register
+
+
+@scenario('dashboard')
+def dashboard_cold(client, user):
+    # Only this user's entries: the cache may be shared with a running site
+    version = get_dashboard_version(user.pk)
+    cache.delete(dashboard_cache_key(user.pk, version, timezone.now().date()))
+    forget_currency_context(user.pk)
+    return client.get('/api/dashboard/summary/')
+
+
+@scenario('dashboard_cached')
+def dashboard_cached(client, user):
+    return client.get('/api/dashboard/summary/')
+
+
+@scenario('transactions_list')
+def transactions_list(client, user):
+    return client.get('/api/transactions/', {'type': 'expense', 'date_range': 'year', 'page_size': 100})
+
+
+@scenario('transactions_page_500')
+def transactions_large_page(client, user):
+    return client.get('/api/transactions/', {'page_size': 500})
+
+
+@scenario('budgets_list')
+def budgets_list(client, user):
+    return client.get('/api/budgets/')
+
+
+@scenario('budgets_status')
+def budgets_status(client, user):
+    return client.get('/api/budgets/status/')
+
+
+@scenario('bulk_create', writes=True)
+def bulk_create(client, user, rows=1000):
+    account = Account.objects.filter(user=user).values_list('pk', flat=True).first()
+    category = Category.objects.filter(user=user).values_list('pk', flat=True).first()
+    today = date.today().isoformat()
+    return client.post('/api/transactions/bulk/', [
+        {
+            'account': account, 'category': category, 'amount': '12.34', 'transaction_type': 'expense',
+            'description': f'Benchmark row {i}', 'date': today
+        }
+        for i in range(rows)
+    ], format='json')
+
+
+def run_once(func, client, user):
+    """Run one iteration, returning (seconds, query count, status code)
+
+    Raises CommandError unless the response is a success, so an error page is never timed as a result.
+    """
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        if func.writes:
+            try:
+                with transaction.atomic():
+                    response = func(client, user)
+                    raise Rollback
+            except Rollback:
+                pass
+        else:
+            response = func(client, user)
+        elapsed = time.perf_counter() - started
+    if not 200 <= response.status_code < 300:
+        raise CommandError(f'Scenario {func.scenario} got a {response.status_code} response')
+    return elapsed, len(queries), response.status_code
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_scenario(name, user, iterations=20, warmup=2):
+    """Time a scenario and measure its peak traced memory in a separate pass"""
+    # The test client sends requests as "testserver"
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+        return measure_scenario(name, user, iterations, warmup)
+
+
+def measure_scenario(name, user, iterations, warmup):
+    func = SCENARIOS[name]
+    client = APIClient()
+    client.force_authenticate(user)
+
+    for _ in range(warmup):
+        run_once(func, client, user)
+
+    timings = []
+    query_counts = []
+    statuses = set()
+    for _ in range(iterations):
+        elapsed, queries, status_code = run_once(func, client, user)
+        timings.append(elapsed)
+        query_counts.append(queries)
+        statuses.add(status_code)
+
+    # tracemalloc slows everything down, so it is kept out of the timed runs
+    tracemalloc.start()
+    try:
+        run_once(func, client, user)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'scenario': name,
+        'iterations': iterations,
+        'p50_ms': round(percentile(timings, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(timings, 0.95) * 1000, 3),
+        'mean_ms': round(statistics.mean(timings) * 1000, 3),
+        'queries': max(query_counts),
+        'peak_memory_kb': round(peak / 1024, 1),
+        'status_codes': sorted(statuses),
+    }
+
+
+def run_serialization(user, rows=10000, iterations=5):
+    """Time listing `rows` transactions through TransactionSerializer and through the .values() fast path
+
+    Both include their database query and JSON rendering, as a list request
+    would. Times are medians scaled to 10k rows, and the two outputs are
+    compared byte for byte.
+    """
+    queryset = Transaction.objects.filter(user=user).order_by('-date', '-id')
+    fast = values_serializer(TransactionSerializer)
+
+    def regular():
+        instances = queryset.select_related('account', 'category')[:rows]
+        return JSONRenderer().render(TransactionSerializer(instances, many=True).data)
+
+    def fast_path():
+        return render_json(fast.serialize(queryset.values(*fast.lookups)[:rows]))
+
+    results = {}
+    for name, func in (('regular', regular), ('fast', fast_path)):
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        results[name] = statistics.median(timings)
+
+    count = min(rows, queryset.count())
+    scale = 10000 / count if count else 0
+    return {
+        'scenario': 'serialization',
+        'rows': count,
+        'renderer': 'orjson' if orjson is not None else 'json',
+        'regular_ms_per_10k': round(results['regular'] * scale * 1000, 3),
+        'fast_ms_per_10k': round(results['fast'] * scale * 1000, 3),
+        'speedup': round(results['regular'] / results['fast'], 2) if results['fast'] else None,
+        'identical': regular() == fast_path(),
+    }
+
+
+def run_concurrent_writes(writers=8, writes_per_writer=100, accounts=2):
+    """Throughput of `writers` threads creating transactions at the same time
+
+    Every writer has its own database connection and goes through
+    Transaction.save(), so all of them contend for the same account rows the
+    way concurrent API workers do. The data lives under a throwaway user that
+    is deleted afterwards. Writes that fail (e.g. "database is locked") are
+    counted rather than retried.
+    """
+    user = User.objects.create_user(username=f'__write_benchmark_{time.time_ns()}__')
+    account_ids = [
+        Account.objects.create(user=user, name=f'Benchmark {i}', account_type='checking').pk
+        for i in range(accounts)
+    ]
+    category_id = Category.objects.create(user=user, name='Benchmark', category_type='expense').pk
+    today = date.today()
+    latencies = []
+    failures = []
+    start = threading.Barrier(writers + 1)
+
+    def writer(index):
+        own_latencies = []
+        own_failures = 0
+        try:
+            start.wait()
+            for i in range(writes_per_writer):
+                started = time.perf_counter()
+                try:
+                    Transaction.objects.create(
+                        user_id=user.pk, account_id=account_ids[(index + i) % len(account_ids)],
+                        category_id=category_id, amount=Decimal('1.00'), transaction_type='expense',
+                        description=f'Writer {index} #{i}', date=today
+                    )
+                except OperationalError:
+                    own_failures += 1
+                else:
+                    own_latencies.append(time.perf_counter() - started)
+        finally:
+            latencies.extend(own_latencies)
+            failures.append(own_failures)
+            connections.close_all()
+
+    threads = [threading.Thread(target=writer, args=(index,)) for index in range(writers)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    close_old_connections()
+    expected = -len(latencies)
+    balances = sum(Account.objects.filter(user=user).values_list('balance', flat=True))
+    user.delete()
+
+    return {
+        'scenario': 'concurrent_writes',
+        'writers': writers,
+        'writes': len(latencies),
+        'failed': sum(failures),
+        'seconds': round(elapsed, 3),
+        'writes_per_second': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3) if latencies else None,
+        # Lost updates would show up as a balance that disagrees with the writes that succeeded
+        'balances_consistent': balances == expected,
+    }
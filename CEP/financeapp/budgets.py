@@ -0,0 +1,85 @@
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import Sum
+
+from .models import Transaction
+from .utils import CENT
+
+WARNING_THRESHOLD = 80
+
+
+def load_daily_spending(user, budgets):
+    """Daily expense totals per category over the union of all budget windows
+
+    Returns ``{category_id: (dates, prefix_sums)}`` where ``prefix_sums[i]``
+    is the total spent before ``dates[i]``, built from a single grouped query.
+    """
+    start = min(budget.start_date for budget in budgets)
+    ends = [budget.end_date for budget in budgets]
+
+    rows = Transaction.objects.filter(
+        user=user,
+        transaction_type='expense',
+        category_id__in={budget.category_id for budget in budgets},
+        date__gte=start
+    )
+    if None not in ends:
+        rows = rows.filter(date__lte=max(ends))
+
+    rows = rows.values('category_id', 'date').annotate(total=Sum('amount')).order_by('category_id', 'date')
+
+    series = defaultdict(lambda: ([], [Decimal(0)]))
+    for row in rows.iterator():
+        dates, prefix = series[row['category_id']]
+        dates.append(row['date'])
+        prefix.append(prefix[-1] + Decimal(row['total']))
+    return series
+
+
+def evaluate_budgets(user, budgets):
+    """Compute the spent amount of every budget in one pass
+
+    Each budget window becomes two binary searches over its category's
+    sorted daily series. The result is memoized on the budget instances, so
+    get_spent_amount()/get_remaining() and the serializer issue no queries.
+    """
+    budgets = list(budgets)
+    if not budgets:
+        return budgets
+
+    series = load_daily_spending(user, budgets)
+    for budget in budgets:
+        dates, prefix = series.get(budget.category_id, ([], [Decimal(0)]))
+        first = bisect_left(dates, budget.start_date)
+        last = bisect_right(dates, budget.end_date) if budget.end_date else len(dates)
+        budget.spent_amount = (prefix[last] - prefix[first]).quantize(CENT) if last > first else Decimal(0)
+    return budgets
+
+
+def budget_status(budget, today):
+    """Compact status entry for a budget already run through evaluate_budgets()"""
+    spent = budget.get_spent_amount()
+    percentage = (spent / budget.amount * 100) if budget.amount else Decimal(0)
+
+    if percentage >= 100:
+        state = 'exceeded'
+    elif percentage >= WARNING_THRESHOLD:
+        state = 'warning'
+    else:
+        state = 'ok'
+
+    return {
+        'id': budget.pk,
+        'category': budget.category_id,
+        'category_name': budget.category.name,
+        'amount': budget.amount,
+        'spent_amount': spent,
+        'remaining_amount': budget.amount - spent,
+        'percentage_used': round(float(percentage), 2),
+        'status': state,
+        'is_active': budget.start_date <= today and (budget.end_date is None or today <= budget.end_date),
+        'start_date': budget.start_date,
+        'end_date': budget.end_date,
+    }
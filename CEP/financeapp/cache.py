@@ -0,0 +1,70 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+DASHBOARD_VERSION_KEY = 'financeapp:dashboard-version:{user_id}'
+DASHBOARD_DATA_KEY = 'financeapp:dashboard:{user_id}:{version}:{day}'
+FORECAST_DATA_KEY = 'financeapp:forecast:{user_id}:{version}:{day}:{months}'
+
+
+def get_dashboard_version(user_id):
+    """Current cache version of a user's dashboard
+
+    A missing version starts from the clock rather than 1 so that it can't
+    collide with entries cached under an evicted, older version.
+    """
+    key = DASHBOARD_VERSION_KEY.format(user_id=user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_dashboard_version(user_id):
+    """Invalidate a user's cached dashboard once the current transaction commits"""
+    def bump():
+        key = DASHBOARD_VERSION_KEY.format(user_id=user_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), timeout=None)
+
+    transaction.on_commit(bump)
+
+
+def dashboard_etag(user_id, version, day):
+    return f'"dashboard-{user_id}-{version}-{day:%Y%m%d}"'
+
+
+def dashboard_cache_key(user_id, version, day):
+    return DASHBOARD_DATA_KEY.format(user_id=user_id, version=version, day=day.isoformat())
+
+
+def get_cached_dashboard(user_id, version, day, build):
+    """Return the cached dashboard payload for a version, building it on a miss"""
+    key = dashboard_cache_key(user_id, version, day)
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, timeout=settings.DASHBOARD_CACHE_TIMEOUT)
+    return data
+
+
+def forecast_cache_key(user_id, version, day, months):
+    return FORECAST_DATA_KEY.format(user_id=user_id, version=version, day=day.isoformat(), months=months)
+
+
+def get_cached_forecast(user_id, version, day, months, build):
+    """Return the cached forecast for a dashboard version, building it on a miss
+
+    Forecasts read the same data as the dashboard, so they share its version.
+    """
+    key = forecast_cache_key(user_id, version, day, months)
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, timeout=settings.FORECAST_CACHE_TIMEOUT)
+    return data
@@ -0,0 +1,175 @@
+from collections import defaultdict
+
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from .fx import Converter, currency_context, is_mixed
+from .models import Account, MonthlyRollup, Transaction
+from .serializers import TransactionSerializer
+from .utils import add_months
+
+CHART_MONTHS = 6
+
+
+def get_total_balance(user, today):
+    """Sum of all account balances for the user, in their preferred currency at today's rates"""
+    context = currency_context(user.pk)
+    if not is_mixed(context):
+        return Account.objects.filter(user=user).aggregate(Sum('balance'))['balance__sum'] or 0
+    balances = dict(Account.objects.filter(user=user).values_list('pk', 'balance'))
+    return Converter(context, today, today).total(balances, today)
+
+
+def later_in_month(user, today):
+    """This month's transactions dated after `today`, which the rollup includes but the dashboard does not"""
+    return Transaction.objects.filter(user=user, date__gt=today, date__lt=add_months(today.replace(day=1), 1))
+
+
+def get_monthly_totals(user, first_month, last_month, today):
+    """Income and expense totals per month, read from the rollup table
+
+    Rollups hold whole months, so the transactions of the current month
+    dated after `today` are subtracted with a second grouped query (an
+    index range over the few future-dated rows). With accounts in several
+    currencies the rows are also split per account, and each month is
+    converted at the rates of its first day.
+    """
+    context = currency_context(user.pk)
+    mixed = is_mixed(context)
+    group = ['account_id'] if mixed else []
+    rows = MonthlyRollup.objects.filter(
+        user=user,
+        month__gte=first_month,
+        month__lte=last_month
+    ).values('month', *group).annotate(
+        income=Sum('amount', filter=Q(transaction_type='income')),
+        expenses=Sum('amount', filter=Q(transaction_type='expense')),
+    ).order_by('month')
+
+    # (month, account id if mixed) -> [income, expenses]
+    totals = defaultdict(lambda: [0, 0])
+    for row in rows:
+        totals[(row['month'], *(row[field] for field in group))] = [row['income'] or 0, row['expenses'] or 0]
+    this_month = today.replace(day=1)
+    later = later_in_month(user, today).values('transaction_type', *group).annotate(amount=Sum('amount')).order_by()
+    for row in later:
+        totals[(this_month, *(row[field] for field in group))][row['transaction_type'] == 'expense'] -= row['amount']
+
+    if not mixed:
+        return {month: tuple(amounts) for (month,), amounts in totals.items()}
+
+    income = defaultdict(dict)
+    expenses = defaultdict(dict)
+    for (month, account_id), (month_income, month_expenses) in totals.items():
+        income[month][account_id] = month_income
+        expenses[month][account_id] = month_expenses
+    converter = Converter(context, first_month, last_month)
+    return {
+        month: (converter.total(income[month], month), converter.total(expenses[month], month))
+        for month in income
+    }
+
+
+def get_recent_transactions(user, limit=5):
+    """Serialized list of the most recent transactions"""
+    queryset = Transaction.objects.filter(user=user).select_related('account', 'category').order_by('-date')
+    return TransactionSerializer(queryset[:limit], many=True).data
+
+
+def get_category_spending(user, today):
+    """Expense totals per category for the current month up to `today`
+
+    One grouped query over the month's rollups, less the month's expenses
+    dated after `today`.
+    """
+    context = currency_context(user.pk)
+    mixed = is_mixed(context)
+    group = ['account_id'] if mixed else []
+    start_of_month = today.replace(day=1)
+    rows = MonthlyRollup.objects.filter(
+        user=user,
+        category__category_type='expense',
+        transaction_type='expense',
+        month=start_of_month
+    ).values(
+        'category_id', 'category__name', 'category__color', *group
+    ).annotate(
+        amount=Sum('amount')
+    ).order_by('category_id')
+    later = later_in_month(user, today).filter(
+        category__category_type='expense', transaction_type='expense'
+    ).values('category_id', *group).annotate(amount=Sum('amount')).order_by()
+    later = {tuple(row[field] for field in ('category_id', *group)): row['amount'] for row in later}
+
+    # category id -> name, color and amount per account (one None entry unless mixed)
+    categories = {}
+    for row in rows:
+        category = categories.setdefault(
+            row['category_id'], {'category': row['category__name'], 'color': row['category__color'], 'amount': {}}
+        )
+        key = tuple(row[field] for field in ('category_id', *group))
+        category['amount'][row['account_id'] if mixed else None] = row['amount'] - later.get(key, 0)
+
+    converter = Converter(context, start_of_month, start_of_month)
+    spending = []
+    for category in categories.values():
+        if mixed:
+            amount = converter.total(category['amount'], start_of_month)
+        else:
+            amount = category['amount'][None]
+        if amount > 0:
+            spending.append({**category, 'amount': amount})
+    return spending
+
+
+def get_chart_data(monthly_totals, month_starts):
+    """Monthly income/expense series with empty months filled in"""
+    return {
+        'months': [month_start.strftime('%b') for month_start in month_starts],
+        'income': [float(monthly_totals.get(month, (0, 0))[0]) for month in month_starts],
+        'expenses': [float(monthly_totals.get(month, (0, 0))[1]) for month in month_starts]
+    }
+
+
+def get_dashboard_sections(user, today):
+    """Independent pieces of the dashboard as zero-argument callables
+
+    None of them depends on another, so they can run in any order or
+    concurrently; assemble_dashboard_summary() combines the results.
+    """
+    start_of_month = today.replace(day=1)
+    # The chart covers the full months before the current one
+    first_month = add_months(start_of_month, -CHART_MONTHS)
+
+    return {
+        'balance': lambda: get_total_balance(user, today),
+        'monthly': lambda: get_monthly_totals(user, first_month, start_of_month, today),
+        'recent': lambda: get_recent_transactions(user),
+        'categories': lambda: get_category_spending(user, today),
+        'currency': lambda: currency_context(user.pk).preferred,
+    }
+
+
+def assemble_dashboard_summary(sections, today):
+    """Build the response payload from computed section results"""
+    start_of_month = today.replace(day=1)
+    month_starts = [add_months(start_of_month, i - CHART_MONTHS) for i in range(CHART_MONTHS)]
+    monthly_totals = sections['monthly']
+    income, expenses = monthly_totals.get(start_of_month, (0, 0))
+
+    return {
+        'currency': sections['currency'],
+        'total_balance': float(sections['balance']),
+        'month_income': float(income),
+        'month_expenses': float(expenses),
+        'recent_transactions': sections['recent'],
+        'category_spending': sections['categories'],
+        'chart_data': get_chart_data(monthly_totals, month_starts)
+    }
+
+
+def build_dashboard_summary(user, today=None):
+    """Assemble the dashboard payload using a fixed number of grouped queries"""
+    today = today or timezone.now().date()
+    sections = get_dashboard_sections(user, today)
+    return assemble_dashboard_summary({name: compute() for name, compute in sections.items()}, today)
@@ -0,0 +1,125 @@
+import csv
+import io
+import json
+
+from .models import Account, Category
+from .utils import chunked
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Parquet exports are only offered when pyarrow is installed
+    pyarrow = None
+
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_COLUMNS = (
+    'id', 'date', 'account', 'category', 'transaction_type', 'amount', 'payment_method', 'description', 'notes'
+)
+EXPORT_FIELDS = (
+    'id', 'date', 'account_id', 'category_id', 'transaction_type', 'amount', 'payment_method', 'description', 'notes'
+)
+
+
+def export_rows(queryset, user, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield one tuple per transaction in EXPORT_COLUMNS order
+
+    Rows come straight from the database cursor in chunks, without model
+    instances or serializers, and the account and category ids are resolved
+    from name lookups loaded once up front.
+    """
+    accounts = dict(Account.objects.filter(user=user).values_list('pk', 'name'))
+    categories = dict(Category.objects.filter(user=user).values_list('pk', 'name'))
+
+    for txn_id, day, account_id, category_id, *rest in queryset.values_list(*EXPORT_FIELDS).iterator(
+        chunk_size=chunk_size
+    ):
+        yield (txn_id, day, accounts.get(account_id), categories.get(category_id), *rest)
+
+
+def stream_csv(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for chunk in chunked(rows, chunk_size):
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def stream_ndjson(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    for chunk in chunked(rows, chunk_size):
+        yield ''.join(
+            json.dumps(dict(zip(EXPORT_COLUMNS, row)), default=str, separators=(',', ':')) + '\n'
+            for row in chunk
+        )
+
+
+class ParquetSink(io.RawIOBase):
+    """Write-only file that hands back what was written since the last drain
+
+    The Parquet writer records byte offsets through tell(), so the position
+    keeps counting even though drained bytes are released.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.position = 0
+        self.pending = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.pending.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.pending)
+        self.pending = []
+        return data
+
+
+def parquet_schema():
+    return pyarrow.schema([
+        ('id', pyarrow.int64()),
+        ('date', pyarrow.date32()),
+        ('account', pyarrow.string()),
+        ('category', pyarrow.string()),
+        ('transaction_type', pyarrow.string()),
+        ('amount', pyarrow.decimal128(15, 2)),
+        ('payment_method', pyarrow.string()),
+        ('description', pyarrow.string()),
+        ('notes', pyarrow.string()),
+    ])
+
+
+def stream_parquet(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    """Write every chunk as its own row group and stream it out as soon as it is encoded"""
+    schema = parquet_schema()
+    sink = ParquetSink()
+    with pyarrow.parquet.ParquetWriter(sink, schema) as writer:
+        for chunk in chunked(rows, chunk_size):
+            columns = zip(*chunk)
+            writer.write_table(pyarrow.Table.from_arrays(
+                [pyarrow.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema
+            ))
+            yield sink.drain()
+    yield sink.drain()
+
+
+# format -> (content type, file extension, streaming writer)
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv', stream_csv),
+    'ndjson': ('application/x-ndjson', 'ndjson', stream_ndjson),
+}
+if pyarrow is not None:
+    EXPORT_FORMATS['parquet'] = ('application/vnd.apache.parquet', 'parquet', stream_parquet)
@@ -0,0 +1,135 @@
+from datetime import datetime
+from functools import lru_cache
+
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+
+try:
+    import orjson
+except ImportError:  # Fast-path responses are rendered with the stock JSONRenderer instead
+    orjson = None
+
+# Fields whose to_representation() returns database values unchanged
+PASSTHROUGH_FIELDS = (
+    serializers.CharField, serializers.ChoiceField, serializers.IntegerField, serializers.BooleanField,
+    serializers.ReadOnlyField, PrimaryKeyRelatedField,
+)
+# Fields whose own to_representation() is applied to each value
+CONVERTED_FIELDS = (serializers.DecimalField, serializers.DateTimeField, serializers.DateField)
+
+
+class ValuesSerializer:
+    """Turn ``.values()`` rows into the same dicts a ModelSerializer's ``data`` would hold
+
+    The serializer's fields are mapped once to (name, lookup, converter):
+    relations read their foreign key column, dotted sources become joins,
+    and only decimals, dates and datetimes go through their field's
+    to_representation(). Any other kind of field could change the output,
+    so serializers using one are rejected up front.
+    """
+
+    def __init__(self, serializer_class):
+        self.columns = []
+        for name, field in serializer_class().fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, serializers.DecimalField) and not getattr(field, 'coerce_to_string', True):
+                raise TypeError(f'{serializer_class.__name__}.{name} renders decimals as numbers')
+            if not isinstance(field, CONVERTED_FIELDS + PASSTHROUGH_FIELDS):
+                raise TypeError(f'{serializer_class.__name__}.{name} ({type(field).__name__}) has no fast path')
+            self.columns.append((name, '__'.join(field.source_attrs), field))
+        self.lookups = [lookup for _, lookup, _ in self.columns]
+
+    @staticmethod
+    def converter(field):
+        """Function applied to the field's non-None values, or None to pass them through"""
+        if isinstance(field, serializers.DateTimeField):
+            return datetime_converter(field)
+        if isinstance(field, CONVERTED_FIELDS):
+            return field.to_representation
+        return None
+
+    def serialize(self, rows):
+        # Resolved per call: datetimes depend on the timezone active for the request
+        columns = [(name, lookup, self.converter(field)) for name, lookup, field in self.columns]
+        return [
+            {
+                # Like Serializer.to_representation(), None is never passed to a field
+                name: value if converter is None or value is None else converter(value)
+                for name, lookup, converter in columns
+                for value in (row[lookup],)
+            }
+            for row in rows
+        ]
+
+
+def datetime_converter(field):
+    """DateTimeField.to_representation() with the timezone lookup hoisted out of the per-value path
+
+    Only aware datetimes in ISO 8601 output take the shortcut; anything else
+    goes through the field itself.
+    """
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if output_format is None or output_format.lower() != ISO_8601 or field_timezone is None:
+        return field.to_representation
+
+    def convert(value):
+        if not isinstance(value, datetime) or timezone.is_naive(value):
+            return field.to_representation(value)
+        value = value.astimezone(field_timezone).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return convert
+
+
+@lru_cache(maxsize=None)
+def values_serializer(serializer_class):
+    return ValuesSerializer(serializer_class)
+
+
+def render_json(data):
+    """Bytes identical to JSONRenderer's for data made of dicts, lists, strings, ints, bools and None"""
+    if orjson is None:
+        return JSONRenderer().render(data)
+    # JSONRenderer escapes these two so the output is also valid JavaScript
+    return orjson.dumps(data).replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class FastListMixin:
+    """list() built from ``.values()`` rows and rendered straight to JSON bytes
+
+    Used only when the client negotiated plain, compact JSON; the browsable
+    API, any other renderer and indented output (``Accept:
+    application/json; indent=2``) get the regular serializer path. Keyset
+    pagination works on the rows too, as long as the ordering fields are fetched.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not self.renders_plain_json(request):
+            return super().list(request, *args, **kwargs)
+
+        rows_serializer = values_serializer(self.get_serializer_class())
+        lookups = list(rows_serializer.lookups)
+        paginator = self.paginator
+        if paginator is not None and hasattr(paginator, 'get_ordering'):
+            ordering = (field.lstrip('-') for field in paginator.get_ordering(request))
+            lookups += [name for name in ordering if name not in lookups]
+        queryset = self.filter_queryset(self.get_queryset()).values(*lookups)
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            data = self.get_paginated_response(rows_serializer.serialize(page)).data
+        else:
+            data = rows_serializer.serialize(queryset)
+        return HttpResponse(render_json(data), content_type=JSONRenderer.media_type)
+
+    def renders_plain_json(self, request):
+        """Whether JSONRenderer would produce the bytes render_json() does for this request"""
+        renderer = request.accepted_renderer
+        if type(renderer) is not JSONRenderer or not renderer.compact or renderer.ensure_ascii:
+            return False
+        return renderer.get_indent(request.accepted_media_type, self.get_renderer_context()) is None
@@ -0,0 +1,293 @@
+import math
+from calendar import monthrange
+from collections import defaultdict, namedtuple
+
+from django.contrib.auth.models import User
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+from .cache import get_cached_forecast, get_dashboard_version
+from .fx import Converter, MissingExchangeRate, currency_context
+from .models import Account, Goal, MonthlyRollup, RecurringRule, Transaction
+from .utils import add_months, end_of_month
+
+try:
+    import numpy
+except ImportError:  # Forecasts fall back to plain Python arithmetic
+    numpy = None
+
+FORECAST_HISTORY_MONTHS = 12
+FORECAST_MONTHS = 12
+MAX_FORECAST_MONTHS = 60
+# Months, the last full one included, a payment must repeat in to be projected as recurring
+RECURRING_MIN_MONTHS = 3
+
+# A monthly payment found in the history; months: the past months it was posted in
+RecurringPattern = namedtuple('RecurringPattern', [
+    'account_id', 'category_id', 'transaction_type', 'description', 'amount', 'months', 'due_this_month'
+])
+
+
+def detect_recurring(user, first_month, this_month):
+    """Payments that repeat every month without a recurring rule, such as a subscription paid by card
+
+    A pattern is the same account, category, type, description and amount
+    posted exactly once in each of at least RECURRING_MIN_MONTHS months since
+    `first_month`, the last full month included, and never twice in a month.
+    It is due this month unless it has already been posted.
+    """
+    rows = (
+        Transaction.objects.filter(
+            user=user, recurring_rule__isnull=True, date__gte=first_month, date__lt=add_months(this_month, 1)
+        )
+        .annotate(month=TruncMonth('date'))
+        .values('account_id', 'category_id', 'transaction_type', 'description', 'amount', 'month')
+        .annotate(count=Count('id')).order_by()
+    )
+    postings = defaultdict(dict)
+    for row in rows:
+        key = (row['account_id'], row['category_id'], row['transaction_type'], row['description'], row['amount'])
+        postings[key][row['month']] = row['count']
+
+    last_month = add_months(this_month, -1)
+    patterns = []
+    for key, counts in postings.items():
+        past = sorted(month for month in counts if month < this_month)
+        if len(past) >= RECURRING_MIN_MONTHS and last_month in counts and set(counts.values()) == {1}:
+            patterns.append(RecurringPattern(*key, months=past, due_this_month=this_month not in counts))
+    return patterns
+
+
+def load_history(user, first_month, this_month, patterns=()):
+    """Per-account net flow of each full month from `first_month` up to (not including) `this_month`
+
+    Returns ``(accounts, rows)``: (id, name, balance, currency) tuples and
+    one list of floats per account. Transactions posted by recurring rules
+    or matching a detected recurring pattern are left out; those flows are
+    projected from the rules and patterns themselves.
+    """
+    months = (this_month.year - first_month.year) * 12 + this_month.month - first_month.month
+    accounts = list(Account.objects.filter(user=user).order_by('pk').values_list('pk', 'name', 'balance', 'currency'))
+    index = {account[0]: position for position, account in enumerate(accounts)}
+    rows = [[0.0] * months for _ in accounts]
+
+    def add(account_id, day, transaction_type, total, sign=1):
+        position = index.get(account_id)
+        if position is None:
+            return
+        month = (day.year - first_month.year) * 12 + day.month - first_month.month
+        amount = float(total) if transaction_type == 'income' else -float(total)
+        rows[position][month] += sign * amount
+
+    rollups = MonthlyRollup.objects.filter(user=user, month__gte=first_month, month__lt=this_month)
+    for row in rollups.values('account_id', 'month', 'transaction_type').annotate(total=Sum('amount')).order_by():
+        add(row['account_id'], row['month'], row['transaction_type'], row['total'])
+
+    scheduled = Transaction.objects.filter(
+        user=user, recurring_rule__isnull=False, date__gte=first_month, date__lt=this_month
+    )
+    for row in scheduled.values('account_id', 'date', 'transaction_type').annotate(total=Sum('amount')).order_by():
+        add(row['account_id'], row['date'], row['transaction_type'], row['total'], sign=-1)
+
+    for pattern in patterns:
+        for month in pattern.months:
+            add(pattern.account_id, month, pattern.transaction_type, pattern.amount, sign=-1)
+
+    return accounts, rows
+
+
+def scheduled_flows(user, accounts, this_month, months, patterns=()):
+    """Net flow per account and future month from active recurring rules, pending occurrences included,
+    and from detected recurring patterns"""
+    index = {account[0]: position for position, account in enumerate(accounts)}
+    flows = [[0.0] * months for _ in accounts]
+    horizon_end = end_of_month(add_months(this_month, months - 1))
+
+    for rule in RecurringRule.objects.filter(user=user, is_active=True, next_date__isnull=False):
+        position = index.get(rule.account_id)
+        if position is None:
+            continue
+        amount = float(rule.amount) if rule.transaction_type == 'income' else -float(rule.amount)
+        occurrence = rule.occurrences
+        day = rule.next_date
+        while day is not None and day <= horizon_end:
+            # Overdue occurrences not yet materialized land in the current month
+            month = max((day.year - this_month.year) * 12 + day.month - this_month.month, 0)
+            flows[position][month] += amount
+            occurrence += 1
+            day = rule.occurrence_date(occurrence)
+
+    for pattern in patterns:
+        position = index.get(pattern.account_id)
+        if position is None:
+            continue
+        amount = float(pattern.amount) if pattern.transaction_type == 'income' else -float(pattern.amount)
+        for month in range(0 if pattern.due_this_month else 1, months):
+            flows[position][month] += amount
+    return flows
+
+
+def project_balances(balances, history, scheduled, months, first_weight):
+    """Month-end balances per account: a least-squares trend of past net flows plus scheduled flows
+
+    `first_weight` is the share of the current month still to come. Returns
+    ``(balances, flows)``, each with one row of `months` floats per account.
+    """
+    past = len(history[0]) if history else 0
+    t_mean = (past - 1) / 2
+    t_spread = sum((t - t_mean) ** 2 for t in range(past)) or 1
+    weights = [first_weight] + [1.0] * (months - 1)
+
+    if numpy is not None and history:
+        past_flows = numpy.array(history)
+        centered = numpy.arange(past) - t_mean
+        slope = past_flows @ centered / t_spread
+        intercept = past_flows.mean(axis=1) - slope * t_mean
+        trend = intercept[:, None] + slope[:, None] * numpy.arange(past, past + months)
+        flows = trend * numpy.array(weights) + numpy.array(scheduled)
+        projected = numpy.array(balances, dtype=float)[:, None] + numpy.cumsum(flows, axis=1)
+        return projected.tolist(), flows.tolist()
+
+    projected_rows = []
+    flow_rows = []
+    for balance, past_flows, planned in zip(balances, history, scheduled):
+        mean = sum(past_flows) / past
+        slope = sum((t - t_mean) * value for t, value in enumerate(past_flows)) / t_spread
+        intercept = mean - slope * t_mean
+        flows = [
+            (intercept + slope * (past + month)) * weights[month] + planned[month]
+            for month in range(months)
+        ]
+        running = float(balance)
+        projected = []
+        for flow in flows:
+            running += flow
+            projected.append(running)
+        projected_rows.append(projected)
+        flow_rows.append(flows)
+    return projected_rows, flow_rows
+
+
+def project_goals(goals, surplus, month_ends):
+    """Completion date of each goal, funding goals in target date order from the combined monthly surplus
+
+    Goals still open after the forecast are extrapolated at the average
+    monthly surplus; with no surplus they have no projected completion.
+    """
+    cumulative = []
+    running = 0.0
+    for amount in surplus:
+        running += amount
+        cumulative.append(running)
+    average = running / len(surplus) if surplus else 0.0
+
+    projections = []
+    needed = 0.0
+    for goal in sorted(goals, key=lambda goal: (goal.target_date, goal.pk)):
+        remaining = max(float(goal.target_amount - goal.current_amount), 0.0)
+        needed += remaining
+        completion = None
+        if remaining == 0:
+            completion = month_ends[0]
+        else:
+            for month_end, saved in zip(month_ends, cumulative):
+                if saved >= needed:
+                    completion = month_end
+                    break
+            if completion is None and average > 0:
+                extra = math.ceil((needed - running) / average)
+                completion = end_of_month(add_months(month_ends[-1], extra))
+
+        projections.append({
+            'id': goal.pk,
+            'name': goal.name,
+            'target_amount': goal.target_amount,
+            'current_amount': goal.current_amount,
+            'target_date': goal.target_date,
+            'percentage_complete': round(float(goal.get_percentage_complete()), 2),
+            'projected_completion': completion,
+            'on_track': completion is not None and completion <= goal.target_date,
+        })
+    return projections
+
+
+def build_forecast(user, today, months=FORECAST_MONTHS):
+    """Projected month-end balances of every account and completion dates of every goal
+
+    Each account's future net flow is the linear trend of its last
+    FORECAST_HISTORY_MONTHS full months, without recurring-rule postings or
+    payments detected as recurring, plus the occurrences its active recurring
+    rules will post and the detected payments, once a month. Goals are funded
+    from the combined surplus converted into the preferred currency.
+    """
+    this_month = today.replace(day=1)
+    first_month = add_months(this_month, -FORECAST_HISTORY_MONTHS)
+    month_ends = [end_of_month(add_months(this_month, month)) for month in range(months)]
+    days_in_month = monthrange(today.year, today.month)[1]
+
+    patterns = detect_recurring(user, first_month, this_month)
+    accounts, history = load_history(user, first_month, this_month, patterns)
+    scheduled = scheduled_flows(user, accounts, this_month, months, patterns)
+    balances, flows = project_balances(
+        [balance for _, _, balance, _ in accounts], history, scheduled, months,
+        (days_in_month - today.day) / days_in_month
+    )
+
+    context = currency_context(user.pk)
+    converter = Converter(context, today, today)
+    surplus = [0.0] * months
+    for (_, _, _, currency), account_flows in zip(accounts, flows):
+        rate = 1.0
+        if currency != context.preferred:
+            rate = float(converter.rate(currency, today) / converter.rate(context.preferred, today))
+        for month, flow in enumerate(account_flows):
+            surplus[month] += flow * rate
+
+    return {
+        'currency': context.preferred,
+        'as_of': today,
+        'months': month_ends,
+        'accounts': [
+            {
+                'id': account_id,
+                'name': name,
+                'currency': currency,
+                'balance': balance,
+                'projected_balances': [round(value, 2) for value in projected],
+            }
+            for (account_id, name, balance, currency), projected in zip(accounts, balances)
+        ],
+        'recurring': [
+            {
+                'account': pattern.account_id,
+                'category': pattern.category_id,
+                'transaction_type': pattern.transaction_type,
+                'description': pattern.description,
+                'amount': pattern.amount,
+                'due_this_month': pattern.due_this_month,
+            }
+            for pattern in patterns
+        ],
+        'monthly_surplus': [round(value, 2) for value in surplus],
+        'goals': project_goals(list(Goal.objects.filter(user=user)), surplus, month_ends),
+    }
+
+
+def cache_user_range(user_ids, today, months=FORECAST_MONTHS):
+    """Build and cache the forecast of every user with accounts in the ``[start, end)`` id range
+
+    Forecasts already cached for the current version are kept. Returns
+    ``(built, skipped)``, skipping users whose currencies lack exchange rates.
+    """
+    start, end = user_ids
+    users = User.objects.filter(pk__gte=start, pk__lt=end, accounts__isnull=False).distinct().order_by('pk')
+    built = skipped = 0
+    for user in users.iterator():
+        version = get_dashboard_version(user.pk)
+        try:
+            get_cached_forecast(user.pk, version, today, months, lambda: build_forecast(user, today, months))
+        except MissingExchangeRate:
+            skipped += 1
+        else:
+            built += 1
+    return built, skipped
@@ -0,0 +1,209 @@
+import csv
+import time
+from bisect import bisect_right
+from collections import defaultdict, namedtuple
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import APIException
+
+from .cache import bump_dashboard_version
+from .models import Account, ExchangeRate, UserProfile
+from .utils import CENT, chunked
+
+RATES_VERSION_KEY = 'financeapp:fx-rates-version'
+CURRENCY_CONTEXT_KEY = 'financeapp:currency-context:{user_id}'
+DEFAULT_CURRENCY = 'USD'
+RATE_CACHE_SIZE = 1024
+LOAD_CHUNK_SIZE = 1000
+
+# preferred: the user's reporting currency; accounts: account id -> currency
+CurrencyContext = namedtuple('CurrencyContext', ['preferred', 'accounts'])
+
+
+class MissingExchangeRate(APIException):
+    status_code = 503
+    default_detail = 'No exchange rate is loaded for a currency in use.'
+    default_code = 'missing_exchange_rate'
+
+
+def rates_version():
+    """Changes whenever rates are loaded, so every process drops its memoized lookups"""
+    version = cache.get(RATES_VERSION_KEY)
+    if version is None:
+        cache.add(RATES_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(RATES_VERSION_KEY)
+    return version
+
+
+def bump_rates_version():
+    try:
+        cache.incr(RATES_VERSION_KEY)
+    except ValueError:
+        cache.set(RATES_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+class RateSeries:
+    """Rates of one currency over a date range; each day uses the latest rate on or before it
+
+    Days before the first known rate fall back to that first rate.
+    """
+
+    def __init__(self, dates, rates):
+        self.dates = dates
+        self.rates = rates
+
+    def at(self, day):
+        return self.rates[max(bisect_right(self.dates, day) - 1, 0)]
+
+
+@lru_cache(maxsize=RATE_CACHE_SIZE)
+def load_rate_series(currency, start, end, version):
+    """Every rate needed for start..end in one query: the one in force on `start` and all later ones up to `end`"""
+    rates = ExchangeRate.objects.filter(currency=currency)
+    in_force = rates.filter(date__lte=start).order_by('-date').values('date')[:1]
+    earliest = rates.order_by('date').values('date')[:1]
+    rows = list(rates.filter(
+        date__gte=Coalesce(Subquery(in_force), Subquery(earliest)), date__lte=Greatest(end, Subquery(earliest))
+    ).order_by('date').values_list('date', 'rate'))
+    if not rows:
+        raise MissingExchangeRate(f'No exchange rate is loaded for {currency}.')
+    dates, values = zip(*rows)
+    return RateSeries(dates, values)
+
+
+def rate_series(currency, start, end):
+    """Rates of `currency` in settings.FX_BASE_CURRENCY between two dates"""
+    if currency == settings.FX_BASE_CURRENCY:
+        return RateSeries([start], [Decimal(1)])
+    return load_rate_series(currency, start, end, rates_version())
+
+
+def get_rate(currency, day):
+    """Value of one unit of `currency` in settings.FX_BASE_CURRENCY on `day`"""
+    return rate_series(currency, day, day).at(day)
+
+
+def convert(amount, currency, target, day):
+    """`amount` in `currency` expressed in `target` at the rates of `day`, to the cent"""
+    amount = Decimal(amount)
+    if currency == target or not amount:
+        return amount
+    return (amount * get_rate(currency, day) / get_rate(target, day)).quantize(CENT)
+
+
+class Converter:
+    """Converts per-account totals of a date range into a user's preferred currency
+
+    Totals are added up per currency before converting, so each currency is
+    converted once per day rather than once per account, and the rates of a
+    currency for the whole range are loaded together on first use.
+    """
+
+    def __init__(self, context, start, end):
+        self.context = context
+        self.start = start
+        self.end = end
+        self.series = {}
+
+    def rate(self, currency, day):
+        series = self.series.get(currency)
+        if series is None:
+            series = self.series[currency] = rate_series(currency, self.start, self.end)
+        return series.at(day)
+
+    def convert(self, amount, currency, day):
+        amount = Decimal(amount)
+        target = self.context.preferred
+        if currency == target or not amount:
+            return amount
+        return (amount * self.rate(currency, day) / self.rate(target, day)).quantize(CENT)
+
+    def total(self, amounts, day):
+        """Sum a mapping of account id -> amount into the preferred currency"""
+        by_currency = defaultdict(Decimal)
+        for account_id, amount in amounts.items():
+            by_currency[self.context.accounts.get(account_id, self.context.preferred)] += Decimal(amount)
+        return sum((self.convert(amount, currency, day) for currency, amount in by_currency.items()), Decimal(0))
+
+
+def currency_context(user_id):
+    """A user's preferred currency and the currency of each of their accounts, cached until either changes"""
+    key = CURRENCY_CONTEXT_KEY.format(user_id=user_id)
+    context = cache.get(key)
+    if context is None:
+        rows = User.objects.filter(pk=user_id).values_list(
+            'profile__preferred_currency', 'accounts__id', 'accounts__currency'
+        )
+        preferred = DEFAULT_CURRENCY
+        accounts = {}
+        for preferred_currency, account_id, currency in rows:
+            preferred = preferred_currency or DEFAULT_CURRENCY
+            if account_id is not None:
+                accounts[account_id] = currency
+        context = CurrencyContext(preferred, accounts)
+        cache.set(key, context, timeout=None)
+    return context
+
+
+def forget_currency_context(user_id):
+    cache.delete(CURRENCY_CONTEXT_KEY.format(user_id=user_id))
+
+
+def is_mixed(context):
+    """Whether any account of the user is held in a currency other than the preferred one"""
+    return any(currency != context.preferred for currency in context.accounts.values())
+
+
+def is_supported_currency(currency):
+    """Whether amounts in `currency` can be converted: the base currency, or one with rates loaded"""
+    return currency == settings.FX_BASE_CURRENCY or ExchangeRate.objects.filter(currency=currency).exists()
+
+
+def read_rates(path):
+    """Parse a ``currency,date,rate`` CSV file (with header) into ExchangeRate instances"""
+    with open(path, newline='') as handle:
+        for line, row in enumerate(csv.DictReader(handle), start=2):
+            try:
+                currency = row['currency'].strip().upper()
+                day = parse_date(row['date'].strip())
+                rate = Decimal(row['rate'].strip())
+            except (KeyError, AttributeError, InvalidOperation, ValueError):
+                raise ValueError(f'line {line}: expected currency,date,rate')
+            if len(currency) != 3 or day is None or rate <= 0:
+                raise ValueError(f'line {line}: expected currency,date,rate')
+            yield ExchangeRate(currency=currency, date=day, rate=rate)
+
+
+def load_rates(rates, chunk_size=LOAD_CHUNK_SIZE):
+    """Insert or overwrite rates in chunks, all or nothing, then invalidate memoized lookups everywhere
+
+    The cached dashboards and forecasts of users holding or reporting in a
+    loaded currency are invalidated too, as their converted amounts change.
+    """
+    loaded = 0
+    currencies = set()
+    with transaction.atomic():
+        for chunk in chunked(rates, chunk_size):
+            # A later line for the same currency and date wins
+            unique = {(rate.currency, rate.date): rate for rate in chunk}
+            ExchangeRate.objects.bulk_create(
+                unique.values(), update_conflicts=True, unique_fields=['currency', 'date'], update_fields=['rate']
+            )
+            loaded += len(unique)
+            currencies.update(currency for currency, _ in unique)
+    load_rate_series.cache_clear()
+    bump_rates_version()
+
+    user_ids = set(Account.objects.filter(currency__in=currencies).values_list('user_id', flat=True).distinct())
+    user_ids.update(UserProfile.objects.filter(preferred_currency__in=currencies).values_list('user_id', flat=True))
+    for user_id in user_ids:
+        bump_dashboard_version(user_id)
+    return loaded
@@ -0,0 +1,258 @@
+import io
+import json
+import logging
+import os
+import socket
+import tempfile
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import storages
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework.renderers import JSONRenderer
+
+from .export import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, export_rows
+from .models import Account, Job, Transaction
+from .reconcile import MAX_REPORTED_MISMATCHES, RECONCILE_CHUNK_SIZE, format_mismatch, reconcile_accounts
+from .reports import cashflow_report
+from .search import filter_transactions
+from .statements import StatementImporter, parse_statement
+
+logger = logging.getLogger(__name__)
+
+# Candidates read per free slot on databases without SKIP LOCKED, where other workers may claim some first
+CLAIM_CANDIDATES_PER_SLOT = 4
+# Delay before the first retry of a failed job; it doubles with every further attempt
+RETRY_DELAY_SECONDS = 30
+
+# kind -> function(job) returning the job's result as plain JSON types
+JOB_HANDLERS = {}
+
+
+class JobFailed(Exception):
+    """Raised by a handler for errors that retrying cannot fix, such as a malformed upload
+
+    `result`, if given, is kept on the job, e.g. the counts of a partial import.
+    """
+
+    def __init__(self, message, result=None):
+        super().__init__(message)
+        self.result = result
+
+
+def job_handler(kind):
+    def register(function):
+        JOB_HANDLERS[kind] = function
+        return function
+    return register
+
+
+def job_storage():
+    """Where uploads waiting to be imported and finished exports are kept (settings.STORAGES['jobs'])"""
+    return storages['jobs']
+
+
+def enqueue(kind, user=None, params=None):
+    """Queue a job; any worker picks it up as soon as it has a free slot"""
+    return Job.objects.create(kind=kind, user=user, params=params or {})
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+
+def claim_jobs(worker, limit, kinds=None):
+    """Mark up to `limit` due jobs as running for `worker` and return their ids, oldest first
+
+    On databases with SKIP LOCKED (Postgres) the due rows are locked and
+    claimed in one transaction, and rows another worker is busy claiming are
+    skipped rather than waited for. SQLite has no row locks but runs one
+    writer at a time, so each job is claimed with an UPDATE that only matches
+    while it is still queued: whichever worker's UPDATE lands first takes it
+    and the others move on to the next candidate.
+    """
+    now = timezone.now()
+    due = Job.objects.filter(status=Job.QUEUED, run_after__lte=now).order_by('run_after', 'pk')
+    if kinds:
+        due = due.filter(kind__in=kinds)
+    claim = {
+        'status': Job.RUNNING, 'worker': worker, 'attempts': F('attempts') + 1, 'started_at': now, 'heartbeat_at': now,
+    }
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            job_ids = list(due.select_for_update(skip_locked=True).values_list('pk', flat=True)[:limit])
+            Job.objects.filter(pk__in=job_ids).update(**claim)
+        return job_ids
+
+    job_ids = []
+    for job_id in list(due.values_list('pk', flat=True)[:limit * CLAIM_CANDIDATES_PER_SLOT]):
+        if Job.objects.filter(pk=job_id, status=Job.QUEUED).update(**claim):
+            job_ids.append(job_id)
+            if len(job_ids) == limit:
+                break
+    return job_ids
+
+
+def heartbeat(worker, job_ids):
+    """Renew the lease on the jobs `worker` is running"""
+    if job_ids:
+        Job.objects.filter(pk__in=job_ids, status=Job.RUNNING, worker=worker).update(heartbeat_at=timezone.now())
+
+
+def recover_stale_jobs(lease=None):
+    """Requeue, or fail once out of attempts, running jobs whose worker stopped renewing its lease
+
+    Returns the number of jobs recovered. A worker that comes back after
+    losing its lease can no longer record an outcome for the job.
+    """
+    lease = settings.JOB_LEASE_SECONDS if lease is None else lease
+    now = timezone.now()
+    stale = Job.objects.filter(status=Job.RUNNING, heartbeat_at__lt=now - timedelta(seconds=lease))
+    recovered = stale.filter(attempts__lt=F('max_attempts')).update(
+        status=Job.QUEUED, worker='', run_after=now, error='The worker running this job stopped responding.'
+    )
+    for job in stale.filter(attempts__gte=F('max_attempts')):
+        recovered += finish(job, job.worker, Job.FAILED, error='The worker running this job stopped responding.')
+    return recovered
+
+
+def finish(job, worker, status, **fields):
+    """Record a final outcome if `worker` still holds the job, then delete its uploaded input"""
+    updated = Job.objects.filter(pk=job.pk, status=Job.RUNNING, worker=worker).update(
+        status=status, finished_at=timezone.now(), **fields
+    )
+    if updated and job.params.get('file'):
+        job_storage().delete(job.params['file'])
+    return updated
+
+
+def run_job(job_id, worker):
+    """Run a claimed job and record its outcome; the unit of work of a worker thread or process
+
+    Unexpected errors are retried with exponential backoff while attempts
+    remain; JobFailed fails the job at once. Returns the status recorded, or
+    None if the worker lost its lease meanwhile and the outcome was dropped.
+    """
+    close_old_connections()
+    try:
+        job = Job.objects.select_related('user').get(pk=job_id)
+        try:
+            result = JOB_HANDLERS[job.kind](job)
+        except JobFailed as exc:
+            outcome, fields = Job.FAILED, {'error': str(exc), 'result': exc.result}
+        except Exception:
+            logger.exception('Job %s (%s) failed on attempt %s', job.pk, job.kind, job.attempts)
+            if job.attempts >= job.max_attempts:
+                outcome, fields = Job.FAILED, {'error': 'The job failed unexpectedly.'}
+            else:
+                delay = timedelta(seconds=RETRY_DELAY_SECONDS * 2 ** (job.attempts - 1))
+                retried = Job.objects.filter(pk=job.pk, status=Job.RUNNING, worker=worker).update(
+                    status=Job.QUEUED, worker='', run_after=timezone.now() + delay,
+                    error='The job failed unexpectedly and will be retried.'
+                )
+                return Job.QUEUED if retried else None
+        else:
+            outcome, fields = Job.SUCCEEDED, {'result': result, 'error': ''}
+        return outcome if finish(job, worker, outcome, **fields) else None
+    finally:
+        close_old_connections()
+
+
+def as_json(data):
+    """`data` as the API would have rendered it (decimals, dates...), in plain JSON types"""
+    return json.loads(JSONRenderer().render(data))
+
+
+@job_handler('import_statement')
+def import_statement(job):
+    """Import an uploaded statement; a retry resumes after the last committed batch
+
+    Progress counts statement rows up to the last committed batch.
+    """
+    params = job.params
+    try:
+        account = Account.objects.get(pk=params['account'], user=job.user)
+    except Account.DoesNotExist:
+        raise JobFailed('The account no longer exists.')
+
+    importer = StatementImporter(
+        job.user, account,
+        default_category=params.get('default_category'),
+        start_row=max(params.get('start_row', 0), job.progress),
+        on_flush=lambda stats: job.set_progress(stats['last_committed_row'])
+    )
+    with job_storage().open(params['file'], 'rb') as upload:
+        lines = io.TextIOWrapper(upload, encoding='utf-8-sig', newline='')
+        try:
+            return as_json(importer.run(parse_statement(lines, params['statement_format'])))
+        except ValueError as exc:
+            raise JobFailed(str(exc), result=as_json(importer.stats))
+
+
+@job_handler('export_transactions')
+def export_transactions(job):
+    """Write the transactions matching the list filters in `params` to a file in job storage"""
+    params = dict(job.params)
+    content_type, extension, stream = EXPORT_FORMATS[params.pop('format', 'csv')]
+    queryset = filter_transactions(Transaction.objects.filter(user=job.user), params)
+    job.set_progress(0, queryset.count())
+
+    def counted(rows):
+        exported = 0
+        for exported, row in enumerate(rows, start=1):
+            yield row
+            if exported % EXPORT_CHUNK_SIZE == 0:
+                job.set_progress(exported)
+        job.set_progress(exported)
+
+    with tempfile.TemporaryFile() as output:
+        for chunk in stream(counted(export_rows(queryset, job.user))):
+            output.write(chunk.encode() if isinstance(chunk, str) else chunk)
+        output.seek(0)
+        name = job_storage().save(f'exports/{job.pk}/transactions.{extension}', File(output))
+
+    return {
+        'rows': job.progress,
+        'file': name,
+        'filename': f'transactions.{extension}',
+        'content_type': content_type,
+        'size': job_storage().size(name),
+    }
+
+
+@job_handler('cashflow_report')
+def cashflow(job):
+    """The same report as GET /api/reports/cashflow/ with the parameters that were validated when queuing"""
+    params = job.params
+    return as_json(cashflow_report(
+        job.user, parse_date(params['from']), parse_date(params['to']), params['granularity'], params.get('group_by')
+    ))
+
+
+@job_handler('reconcile_balances')
+def reconcile_balances(job):
+    """`manage.py reconcile_balances` as a job; progress counts accounts checked"""
+    params = job.params
+    user_range = tuple(params['users']) if params.get('users') else None
+    accounts = Account.objects.all()
+    if user_range is not None:
+        accounts = accounts.filter(user_id__gte=user_range[0], user_id__lt=user_range[1])
+    job.set_progress(0, accounts.count())
+
+    checked = mismatched = 0
+    lines = []
+    for chunk, mismatches in reconcile_accounts(
+        params.get('chunk_size', RECONCILE_CHUNK_SIZE), user_range,
+        fix=params.get('fix', False), adopt_opening=params.get('adopt_opening', False)
+    ):
+        checked += len(chunk)
+        mismatched += len(mismatches)
+        lines.extend(format_mismatch(*mismatch) for mismatch in mismatches[:MAX_REPORTED_MISMATCHES - len(lines)])
+        job.set_progress(checked)
+    return {'checked': checked, 'mismatched': mismatched, 'mismatches': lines}
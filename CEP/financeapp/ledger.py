@@ -0,0 +1,132 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, F, Sum, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Account, BalanceCheckpoint, MonthlyRollup, Transaction
+from .utils import CENT, add_months, end_of_month
+
+HISTORY_INTERVALS = ('day', 'week', 'month')
+MAX_HISTORY_POINTS = 1000
+
+
+def net_amount():
+    """Aggregate of income minus expenses over `amount` rows"""
+    return Coalesce(
+        Sum(Case(When(transaction_type='income', then=F('amount')), default=-F('amount'))),
+        Decimal(0)
+    )
+
+
+def ensure_checkpoints(account_id, until):
+    """Create the missing monthly checkpoints of an account up to the month of `until`
+
+    Starts from the latest checkpoint still in place and walks forward with
+    one grouped query over the monthly rollups. The build holds the account's
+    row lock, which writers take before dropping stale checkpoints, so a
+    backdated write commits either before the rollups are read or after the
+    new checkpoints are saved (and then drops them).
+    """
+    target = until.replace(day=1)
+    if BalanceCheckpoint.objects.filter(account_id=account_id, month__gte=target).exists():
+        return
+
+    with transaction.atomic():
+        Account.lock([account_id])
+        latest = BalanceCheckpoint.objects.filter(account_id=account_id).order_by('-month').first()
+        if latest is not None and latest.month >= target:
+            return
+
+        rollups = MonthlyRollup.objects.filter(account_id=account_id, month__lt=target)
+        if latest is not None:
+            rollups = rollups.filter(month__gte=latest.month)
+        monthly = {
+            row['month']: Decimal(row['net'])
+            for row in rollups.values('month').annotate(net=net_amount()).order_by('month')
+        }
+
+        if latest is not None:
+            month, running = latest.month, latest.net_before
+        else:
+            month, running = min(monthly, default=target), Decimal(0)
+
+        checkpoints = []
+        while month <= target:
+            if latest is None or month != latest.month:
+                checkpoints.append(
+                    BalanceCheckpoint(account_id=account_id, month=month, net_before=running.quantize(CENT))
+                )
+            running += monthly.get(month, 0)
+            month = add_months(month, 1)
+
+        # A concurrent request may have built some of the same months
+        BalanceCheckpoint.objects.bulk_create(checkpoints, batch_size=500, ignore_conflicts=True)
+
+
+def net_since(account_id, day):
+    """Net total of an account's transactions dated on or after `day`"""
+    rows = Transaction.objects.filter(account_id=account_id, date__gte=day)
+    return Decimal(rows.aggregate(net=net_amount())['net'])
+
+
+def history_points(start, end, interval):
+    """Dates a balance history reports on: the close of every interval, ending at `end`"""
+    points = []
+    day = start
+    while day <= end:
+        if interval == 'month':
+            point = min(end_of_month(day), end)
+        elif interval == 'week':
+            point = min(day + timedelta(days=6), end)
+        else:
+            point = day
+        points.append(point)
+        day = point + timedelta(days=1)
+    return points
+
+
+def balance_history(account, start, end, interval='day'):
+    """Closing balance of an account at the end of every interval between two dates
+
+    Balances are anchored on the nearest checkpoint at or before `start`, so
+    only the transactions from that month onwards are read. Checkpoints are
+    only built up to the current month; balances after it run on from there.
+    The offset between the current balance and the transaction total (an
+    opening balance entered by hand) comes from the current month's checkpoint.
+    """
+    today = timezone.now().date()
+    ensure_checkpoints(account.pk, today)
+
+    checkpoints = BalanceCheckpoint.objects.filter(account_id=account.pk)
+    anchor = checkpoints.filter(month__lte=start).order_by('-month').first()
+    latest = checkpoints.filter(month__lte=today).order_by('-month').first()
+
+    # Accounts without transactions before `start` have no earlier checkpoint
+    anchor_month, running = (anchor.month, anchor.net_before) if anchor else (start, Decimal(0))
+    if latest is not None:
+        total = latest.net_before + net_since(account.pk, latest.month)
+    else:
+        # A concurrent backdated write dropped the checkpoints just built
+        total = net_since(account.pk, date.min)
+    opening = account.balance - total
+
+    daily = (
+        Transaction.objects.filter(account_id=account.pk, date__gte=anchor_month, date__lte=end)
+        .values('date').annotate(net=net_amount()).order_by('date')
+    )
+
+    history = []
+    points = iter(history_points(start, end, interval))
+    point = next(points, None)
+    for row in daily.iterator():
+        while point is not None and point < row['date']:
+            history.append({'date': point, 'balance': (opening + running).quantize(CENT)})
+            point = next(points, None)
+        running += Decimal(row['net'])
+    while point is not None:
+        history.append({'date': point, 'balance': (opening + running).quantize(CENT)})
+        point = next(points, None)
+    return history
@@ -0,0 +1,67 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from financeapp.forecast import FORECAST_MONTHS, MAX_FORECAST_MONTHS, cache_user_range
+from financeapp.models import Account
+from financeapp.utils import split_user_ranges
+
+
+class Command(BaseCommand):
+    help = "Precompute every user's forecast into the cache, typically nightly"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=FORECAST_MONTHS,
+                            help='Months ahead, as requested by the forecast endpoint')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Worker processes, each taking a contiguous range of user ids')
+        parser.add_argument('--users', metavar='START:END',
+                            help='Only users with START <= id < END')
+
+    def handle(self, *args, **options):
+        if settings.CACHES['default']['BACKEND'].endswith('LocMemCache'):
+            raise CommandError('Forecasts cached in process memory are lost on exit; '
+                               'set CACHE_BACKEND to a shared cache such as file or db')
+        if not 1 <= options['months'] <= MAX_FORECAST_MONTHS:
+            raise CommandError(f'--months must be between 1 and {MAX_FORECAST_MONTHS}')
+
+        bounds = Account.objects.aggregate(first=Min('user_id'), last=Max('user_id'))
+        if bounds['first'] is None:
+            self.stdout.write(self.style.SUCCESS('No accounts to forecast'))
+            return
+        first, last = bounds['first'], bounds['last']
+        if options['users']:
+            try:
+                start, end = (int(part) for part in options['users'].split(':'))
+            except ValueError:
+                raise CommandError('--users must look like START:END')
+            first, last = max(first, start), min(last, end - 1)
+
+        today = timezone.now().date()
+        built = skipped = 0
+        if first <= last:
+            ranges = split_user_ranges(first, last, max(options['workers'], 1))
+            if options['workers'] > 1:
+                # Children must not share the parent's database connections
+                connections.close_all()
+                with ProcessPoolExecutor(options['workers'], mp_context=multiprocessing.get_context('spawn'),
+                                         initializer=django.setup) as pool:
+                    results = [pool.submit(cache_user_range, user_ids, today, options['months'])
+                               for user_ids in ranges]
+                    results = [future.result() for future in results]
+            else:
+                results = [cache_user_range(user_ids, today, options['months']) for user_ids in ranges]
+            for range_built, range_skipped in results:
+                built += range_built
+                skipped += range_skipped
+
+        summary = f'Cached forecasts for {built} users'
+        if skipped:
+            summary += f', skipped {skipped} with missing exchange rates'
+        self.stdout.write(self.style.SUCCESS(summary))
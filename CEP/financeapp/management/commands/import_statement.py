@@ -0,0 +1,68 @@
+import io
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from financeapp.models import Account
+from financeapp.statements import IMPORT_BATCH_SIZE, StatementImporter, detect_format, parse_statement
+
+
+class Command(BaseCommand):
+    help = 'Stream a CSV or OFX bank statement into an account'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Statement file to import')
+        parser.add_argument('--user', required=True, help='Username owning the account')
+        parser.add_argument('--account', type=int, required=True, help='Account id to import into')
+        parser.add_argument('--format', dest='file_format', choices=['csv', 'ofx'],
+                            help='Statement format (detected from the file extension by default)')
+        parser.add_argument('--default-category',
+                            help='Category name or id for rows without a recognised category')
+        parser.add_argument('--map', action='append', default=[], metavar='HEADER=FIELD',
+                            help='Map a CSV column to a Transaction field (may be repeated)')
+        parser.add_argument('--delimiter', default=',', help='CSV delimiter')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument('--start-row', type=int, default=0,
+                            help='Skip data rows before this offset, e.g. to resume a failed import')
+        parser.add_argument('--allow-duplicates', action='store_true',
+                            help='Import rows even if an identical transaction already exists')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+            account = Account.objects.get(pk=options['account'], user=user)
+        except (User.DoesNotExist, Account.DoesNotExist):
+            raise CommandError('Unknown user or account')
+
+        columns = None
+        if options['map']:
+            try:
+                columns = dict(item.split('=', 1) for item in options['map'])
+            except ValueError:
+                raise CommandError('--map expects HEADER=FIELD')
+
+        importer = StatementImporter(
+            user, account,
+            default_category=options['default_category'],
+            batch_size=options['batch_size'],
+            start_row=options['start_row'],
+            skip_duplicates=not options['allow_duplicates']
+        )
+        file_format = options['file_format'] or detect_format(options['path'])
+
+        with io.open(options['path'], encoding='utf-8-sig', newline='') as lines:
+            try:
+                stats = importer.run(parse_statement(lines, file_format, columns, options['delimiter']))
+            except Exception:
+                self.stderr.write(self.style.ERROR(
+                    f"Import failed; resume with --start-row {importer.stats['last_committed_row']}"
+                ))
+                raise
+
+        for error in stats['errors']:
+            self.stdout.write(self.style.WARNING(f"Row {error['row']}: {error['errors']}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Read {stats['rows_read']} rows: {stats['imported']} imported, "
+            f"{stats['duplicates']} duplicates, {stats['failed']} failed "
+            f"in {stats['seconds']}s ({stats['rows_per_second']} rows/s)"
+        ))
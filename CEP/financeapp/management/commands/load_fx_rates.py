@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from financeapp.fx import LOAD_CHUNK_SIZE, load_rates, read_rates
+
+
+class Command(BaseCommand):
+    help = 'Load exchange rates from a currency,date,rate CSV file, overwriting rates already stored'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with a currency,date,rate header; rates are in FX_BASE_CURRENCY')
+        parser.add_argument('--chunk-size', type=int, default=LOAD_CHUNK_SIZE,
+                            help='Rates per bulk insert')
+
+    def handle(self, *args, **options):
+        try:
+            loaded = load_rates(read_rates(options['path']), options['chunk_size'])
+        except OSError as exc:
+            raise CommandError(f'Could not read {options["path"]}: {exc}')
+        except ValueError as exc:
+            raise CommandError(f'{options["path"]}, {exc}')
+        self.stdout.write(self.style.SUCCESS(f'Loaded {loaded} exchange rates'))
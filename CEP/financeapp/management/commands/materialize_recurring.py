@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from financeapp.recurring import MATERIALIZE_CHUNK_SIZE, materialize_due
+
+
+class Command(BaseCommand):
+    help = ('Post the due occurrences of every recurring rule as transactions; '
+            'safe to rerun and to run as several workers at once')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Materialize occurrences up to this date (YYYY-MM-DD, default today)')
+        parser.add_argument('--chunk-size', type=int, default=MATERIALIZE_CHUNK_SIZE,
+                            help='Rules per transaction and bulk insert')
+
+    def handle(self, *args, **options):
+        today = timezone.now().date()
+        if options['date']:
+            try:
+                today = parse_date(options['date'])
+            except ValueError:
+                # Well formed but not a real date, e.g. 2024-02-30
+                today = None
+            if today is None:
+                raise CommandError('--date must be a valid date like YYYY-MM-DD')
+
+        started = time.perf_counter()
+        rules = posted = 0
+        for chunk_rules, chunk_posted in materialize_due(today, options['chunk_size']):
+            rules += chunk_rules
+            posted += chunk_posted
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{rules} rules, {posted} transactions so far')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Materialized {posted} transactions from {rules} due rules up to {today} '
+            f'in {time.perf_counter() - started:.1f}s'
+        ))
@@ -0,0 +1,90 @@
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+from financeapp.models import BalanceCheckpoint, MonthlyRollup, Transaction
+from financeapp.utils import CENT
+
+
+def expected_rollups(user_id):
+    """Rollup rows recomputed from the raw transactions of one user"""
+    rows = Transaction.objects.filter(user_id=user_id).annotate(
+        month=TruncMonth('date')
+    ).values(
+        'account_id', 'category_id', 'transaction_type', 'month'
+    ).annotate(
+        total=Sum('amount'),
+        rows=Count('id')
+    ).order_by()
+
+    return {
+        (user_id, row['account_id'], row['category_id'], row['transaction_type'], row['month']):
+            (Decimal(row['total']).quantize(CENT), row['rows'])
+        for row in rows.iterator()
+    }
+
+
+def stored_rollups(user_id):
+    """Rollup rows currently stored for one user, ignoring emptied rows"""
+    rows = MonthlyRollup.objects.filter(user_id=user_id).exclude(count=0).values_list(
+        'account_id', 'category_id', 'transaction_type', 'month', 'amount', 'count'
+    )
+
+    return {
+        (user_id, account_id, category_id, transaction_type, month): (amount, count)
+        for account_id, category_id, transaction_type, month, amount, count in rows.iterator()
+    }
+
+
+class Command(BaseCommand):
+    help = 'Rebuild (or with --verify, check) the monthly transaction rollups from raw transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='Only process this user id (may be repeated)')
+        parser.add_argument('--verify', action='store_true',
+                            help='Compare stored rollups against raw transactions without writing')
+
+    def handle(self, *args, **options):
+        user_ids = options['users'] or User.objects.order_by('pk').values_list('pk', flat=True).iterator()
+        mismatched_users = 0
+
+        for user_id in user_ids:
+            expected = expected_rollups(user_id)
+
+            if options['verify']:
+                stored = stored_rollups(user_id)
+                if stored != expected:
+                    mismatched_users += 1
+                    keys = set(stored) ^ set(expected) | {
+                        key for key in set(stored) & set(expected) if stored[key] != expected[key]
+                    }
+                    self.stdout.write(self.style.WARNING(
+                        f'User {user_id}: {len(keys)} rollup rows differ from raw transactions'
+                    ))
+                continue
+
+            with transaction.atomic():
+                MonthlyRollup.objects.filter(user_id=user_id).delete()
+                # Checkpoints are derived from the rollups, so they are rebuilt on demand too
+                BalanceCheckpoint.objects.filter(account__user_id=user_id).delete()
+                MonthlyRollup.objects.bulk_create(
+                    [
+                        MonthlyRollup(
+                            user_id=user_id, account_id=account_id, category_id=category_id,
+                            transaction_type=transaction_type, month=month, amount=total, count=rows
+                        )
+                        for (_, account_id, category_id, transaction_type, month), (total, rows) in expected.items()
+                    ],
+                    batch_size=1000
+                )
+            self.stdout.write(f'User {user_id}: rebuilt {len(expected)} rollup rows')
+
+        if options['verify']:
+            if mismatched_users:
+                raise CommandError(f'{mismatched_users} user(s) have drifted rollups; run without --verify to rebuild')
+            self.stdout.write(self.style.SUCCESS('All rollups match raw transactions'))
@@ -0,0 +1,99 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Max, Min
+
+from financeapp.jobs import enqueue
+from financeapp.models import Account
+from financeapp.reconcile import RECONCILE_CHUNK_SIZE, format_mismatch, reconcile_accounts, reconcile_user_range
+from financeapp.utils import split_user_ranges
+
+
+class Command(BaseCommand):
+    help = 'Recompute account balances from their transactions and report (or fix) any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Rewrite drifted balances')
+        parser.add_argument('--adopt-opening-balances', action='store_true',
+                            help='Keep each difference as the opening balance instead of treating it as drift '
+                                 '(one-off, for accounts created before opening balances were tracked)')
+        parser.add_argument('--chunk-size', type=int, default=RECONCILE_CHUNK_SIZE,
+                            help='Accounts per aggregate query and bulk update')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Worker processes, each taking a contiguous range of user ids')
+        parser.add_argument('--users', metavar='START:END',
+                            help='Only accounts of users with START <= id < END')
+        parser.add_argument('--enqueue', action='store_true',
+                            help='Queue the reconciliation for `run_worker` instead of running it here')
+
+    def handle(self, *args, **options):
+        if options['fix'] and options['adopt_opening_balances']:
+            raise CommandError('--fix and --adopt-opening-balances are mutually exclusive')
+        writes = {'fix': options['fix'], 'adopt_opening': options['adopt_opening_balances']}
+        user_range = self.parse_user_range(options['users'])
+
+        if options['enqueue']:
+            job = enqueue('reconcile_balances', params={
+                **writes, 'chunk_size': options['chunk_size'], 'users': list(user_range) if user_range else None,
+            })
+            self.stdout.write(self.style.SUCCESS(f'Queued as job {job.pk}'))
+            return
+
+        if options['workers'] > 1:
+            checked, mismatched = self.run_workers(options['workers'], options['chunk_size'], user_range, writes)
+        else:
+            checked = mismatched = 0
+            for accounts, mismatches in reconcile_accounts(options['chunk_size'], user_range, **writes):
+                checked += len(accounts)
+                mismatched += len(mismatches)
+                for mismatch in mismatches:
+                    self.stdout.write(format_mismatch(*mismatch))
+
+        summary = f'Checked {checked} accounts, {mismatched} drifted'
+        if mismatched and not (options['fix'] or options['adopt_opening_balances']):
+            raise CommandError(f'{summary}; run with --fix to repair them')
+        if options['fix']:
+            summary += ' and were fixed'
+        elif options['adopt_opening_balances']:
+            summary += ' and had their opening balance adjusted'
+        self.stdout.write(self.style.SUCCESS(summary))
+
+    @staticmethod
+    def parse_user_range(value):
+        if not value:
+            return None
+        try:
+            start, end = (int(part) for part in value.split(':'))
+        except ValueError:
+            raise CommandError('--users must look like START:END')
+        return start, end
+
+    def run_workers(self, workers, chunk_size, user_range, writes):
+        bounds = Account.objects.aggregate(first=Min('user_id'), last=Max('user_id'))
+        if bounds['first'] is None:
+            return 0, 0
+        first, last = bounds['first'], bounds['last']
+        if user_range is not None:
+            first, last = max(first, user_range[0]), min(last, user_range[1] - 1)
+        if first > last:
+            return 0, 0
+
+        # Children must not share the parent's database connections
+        connections.close_all()
+        checked = mismatched = 0
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=django.setup) as pool:
+            ranges = split_user_ranges(first, last, workers)
+            futures = [pool.submit(reconcile_user_range, user_ids, chunk_size, **writes) for user_ids in ranges]
+            for user_ids, future in zip(ranges, futures):
+                accounts, drifted, lines = future.result()
+                checked += accounts
+                mismatched += drifted
+                for line in lines:
+                    self.stdout.write(line)
+                if drifted > len(lines):
+                    self.stdout.write(f'... and {drifted - len(lines)} more for users {user_ids[0]}:{user_ids[1]}')
+        return checked, mismatched
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from financeapp.budgets import evaluate_budgets
+from financeapp.models import Budget
+
+
+class Command(BaseCommand):
+    help = 'Recompute the running spent counters of budgets and repair any that drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='Only process this user id (may be repeated)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report drifted counters without writing')
+
+    def handle(self, *args, **options):
+        user_ids = Budget.objects.order_by('user_id').values_list('user_id', flat=True).distinct()
+        if options['users']:
+            user_ids = user_ids.filter(user_id__in=options['users'])
+
+        drifted_total = 0
+        for user_id in user_ids.iterator():
+            with transaction.atomic():
+                budgets = Budget.objects.filter(user_id=user_id)
+                if not options['dry_run']:
+                    budgets = budgets.select_for_update()
+                drifted = [
+                    budget for budget in evaluate_budgets(user_id, budgets)
+                    if budget.spent_counter != budget.get_spent_amount()
+                ]
+                if not drifted:
+                    continue
+
+                drifted_total += len(drifted)
+                for budget in drifted:
+                    self.stdout.write(self.style.WARNING(
+                        f'Budget {budget.pk} (user {user_id}): counter {budget.spent_counter}, '
+                        f'actual {budget.get_spent_amount()}'
+                    ))
+                    budget.spent_counter = budget.get_spent_amount()
+                if not options['dry_run']:
+                    Budget.objects.bulk_update(drifted, ['spent_counter'], batch_size=1000)
+
+        verb = 'found' if options['dry_run'] else 'repaired'
+        self.stdout.write(self.style.SUCCESS(f'{verb.capitalize()} {drifted_total} drifted budget counter(s)'))
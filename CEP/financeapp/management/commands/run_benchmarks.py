@@ -0,0 +1,90 @@
+import json
+import platform
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+
+from financeapp.benchmarks import SCENARIOS, run_concurrent_writes, run_scenario, run_serialization
+from financeapp.models import Transaction
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the hot API endpoints and write p50/p95 latency, query counts and peak memory as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Username to benchmark as (default: the user with most transactions)')
+        parser.add_argument('--scenario', action='append', dest='scenarios', choices=sorted(SCENARIOS),
+                            help='Scenario to run (may be repeated; default: all)')
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--output', help='Write the JSON results to this file')
+        parser.add_argument('--writers', type=int, default=0,
+                            help='Also measure write throughput with this many concurrent writers')
+        parser.add_argument('--writes-per-writer', type=int, default=100)
+        parser.add_argument('--serialization-rows', type=int, default=10000,
+                            help='Compare regular and fast-path list serialization over this many rows (0 to skip)')
+
+    def handle(self, *args, **options):
+        if options['writers'] and connection.vendor == 'sqlite' and not settings.SQLITE_CONCURRENT:
+            raise CommandError('Concurrent writers on SQLite need DB_SQLITE_CONCURRENT=1 (on a scratch DB_NAME)')
+        user = self.get_user(options['user'])
+        results = {
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'user': user.username,
+            'transactions': Transaction.objects.filter(user=user).count(),
+            'database': connection.vendor,
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'scenarios': [],
+        }
+
+        for name in options['scenarios'] or sorted(SCENARIOS):
+            result = run_scenario(name, user, iterations=options['iterations'], warmup=options['warmup'])
+            results['scenarios'].append(result)
+            self.stdout.write(
+                f"{name:<22} p50 {result['p50_ms']:>9.2f} ms  p95 {result['p95_ms']:>9.2f} ms  "
+                f"{result['queries']:>4} queries  {result['peak_memory_kb']:>10.1f} KiB peak"
+            )
+
+        if options['serialization_rows']:
+            result = run_serialization(user, options['serialization_rows'], iterations=max(options['iterations'] // 4, 1))
+            results['serialization'] = result
+            self.stdout.write(
+                f"serialization          {result['rows']} rows  regular {result['regular_ms_per_10k']} ms/10k  "
+                f"fast ({result['renderer']}) {result['fast_ms_per_10k']} ms/10k  {result['speedup']}x  "
+                f"{'identical' if result['identical'] else 'OUTPUT DIFFERS'}"
+            )
+
+        if options['writers']:
+            result = run_concurrent_writes(options['writers'], options['writes_per_writer'])
+            results['concurrent_writes'] = result
+            self.stdout.write(
+                f"concurrent_writes      {result['writers']} writers  {result['writes_per_second']} writes/s  "
+                f"p95 {result['p95_ms']} ms  {result['failed']} failed  "
+                f"balances {'consistent' if result['balances_consistent'] else 'INCONSISTENT'}"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    @staticmethod
+    def get_user(username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f'Unknown user {username!r}')
+
+        busiest = Transaction.objects.values('user').order_by().annotate(
+            rows=Count('id')
+        ).order_by('-rows').values_list('user', flat=True).first()
+        if busiest is None:
+            raise CommandError('No transactions to benchmark; run seed_synthetic first')
+        return User.objects.get(pk=busiest)
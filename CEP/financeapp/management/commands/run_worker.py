@@ -0,0 +1,88 @@
+import multiprocessing
+import signal
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from financeapp.jobs import claim_jobs, heartbeat, recover_stale_jobs, run_job, worker_name
+from financeapp.models import Job
+
+
+class Command(BaseCommand):
+    help = ('Run queued background jobs (statement imports, exports, reports, reconciliations) until stopped; '
+            'start more workers, on any host sharing the database and job storage, for more throughput')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4, help='Jobs run at the same time')
+        parser.add_argument('--pool', choices=['thread', 'process'], default='thread',
+                            help='Run jobs in threads, or in worker processes for CPU-bound work')
+        parser.add_argument('--kind', dest='kinds', action='append', choices=[kind for kind, _ in Job.KINDS],
+                            help='Only run jobs of this kind (may be repeated)')
+        parser.add_argument('--poll-interval', type=float, default=settings.JOB_POLL_INTERVAL,
+                            help='Seconds to wait between looking for jobs while idle')
+        parser.add_argument('--burst', action='store_true',
+                            help='Exit once the queue is empty instead of waiting for new jobs')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency must be at least 1')
+        concurrency = options['concurrency']
+        worker = worker_name()
+        stopping = []
+
+        def stop(signum, frame):
+            if not stopping:
+                self.stdout.write('Stopping once the running jobs finish')
+            stopping.append(signum)
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        if options['pool'] == 'process':
+            executor = ProcessPoolExecutor(concurrency, mp_context=multiprocessing.get_context('spawn'),
+                                           initializer=django.setup)
+        else:
+            executor = ThreadPoolExecutor(concurrency, thread_name_prefix='job')
+        self.stdout.write(f'Worker {worker} running up to {concurrency} jobs in {options["pool"]}s')
+
+        # Leases are renewed (and other workers' expired leases recovered) a few times per lease period
+        maintenance_interval = settings.JOB_LEASE_SECONDS / 3
+        last_maintenance = None
+        running = {}
+        outcomes = Counter()
+        with executor:
+            while True:
+                for future in [future for future in running if future.done()]:
+                    job_id = running.pop(future)
+                    outcome = future.result()
+                    outcomes[outcome] += 1
+                    if options['verbosity'] > 1:
+                        self.stdout.write(f"Job {job_id} {outcome or 'lost its lease; outcome dropped'}")
+
+                if last_maintenance is None or time.monotonic() - last_maintenance >= maintenance_interval:
+                    heartbeat(worker, list(running.values()))
+                    recovered = recover_stale_jobs()
+                    if recovered:
+                        self.stdout.write(self.style.WARNING(f'Recovered {recovered} jobs from unresponsive workers'))
+                    last_maintenance = time.monotonic()
+
+                claimed = []
+                if not stopping and len(running) < concurrency:
+                    claimed = claim_jobs(worker, concurrency - len(running), options['kinds'])
+                    for job_id in claimed:
+                        running[executor.submit(run_job, job_id, worker)] = job_id
+
+                if not running and (stopping or (options['burst'] and not claimed)):
+                    break
+                if running:
+                    wait(running, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                elif not claimed:
+                    time.sleep(options['poll_interval'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Ran {sum(outcomes.values())} jobs: {outcomes[Job.SUCCEEDED]} succeeded, "
+            f"{outcomes[Job.FAILED]} failed, {outcomes[Job.QUEUED]} queued for retry"
+        ))
@@ -0,0 +1,150 @@
+import math
+import random
+import re
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from financeapp.budgets import evaluate_budgets
+from financeapp.models import Account, Budget, Category, MonthlyRollup, Transaction, UserProfile
+
+EXPENSE_CATEGORIES = [
+    ('Groceries', 3.6, 0.6), ('Rent', 7.0, 0.1), ('Utilities', 4.5, 0.3), ('Dining', 3.2, 0.7),
+    ('Transport', 3.0, 0.8), ('Entertainment', 3.4, 0.9), ('Health', 4.0, 1.0), ('Shopping', 3.9, 1.1),
+    ('Travel', 5.5, 1.0), ('Subscriptions', 2.6, 0.4),
+]
+INCOME_CATEGORIES = [('Salary', 8.2, 0.15), ('Freelance', 6.0, 0.8), ('Interest', 2.0, 1.0)]
+COLORS = ['#F56565', '#ED8936', '#ECC94B', '#48BB78', '#38B2AC', '#4299E1', '#667EEA', '#9F7AEA', '#ED64A6']
+PAYMENT_METHODS = [method for method, _ in Transaction.PAYMENT_METHODS]
+
+
+class Command(BaseCommand):
+    help = 'Seed synthetic users, accounts, categories, budgets and transactions for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--accounts', type=int, default=3, help='Accounts per user')
+        parser.add_argument('--categories', type=int, default=12, help='Categories per user')
+        parser.add_argument('--transactions', type=int, default=10000, help='Transactions per user')
+        parser.add_argument('--budgets', type=int, default=5, help='Budgets per user')
+        parser.add_argument('--days', type=int, default=730, help='History length ending today')
+        parser.add_argument('--prefix', default='synthetic', help='Username prefix')
+        parser.add_argument('--password', default='synthetic', help='Password for every seeded user')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for reproducible data')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.options = options
+        self.today = date.today()
+        password = make_password(options['password'])
+        start = self.next_index(options['prefix'])
+
+        for index in range(start, start + options['users']):
+            with transaction.atomic():
+                user = User.objects.create(username=f"{options['prefix']}_{index}", password=password)
+                UserProfile.objects.create(user=user)
+                rows = self.seed_user(user)
+            self.stdout.write(f'{user.username}: {rows} transactions')
+
+        self.stdout.write(self.style.SUCCESS(f"Seeded {options['users']} users"))
+
+    @staticmethod
+    def next_index(prefix):
+        """One past the highest N among existing `{prefix}_N` users, so reruns add users instead of colliding"""
+        pattern = rf'^{re.escape(prefix)}_[0-9]+$'
+        usernames = User.objects.filter(username__regex=pattern).values_list('username', flat=True)
+        return max((int(username.rsplit('_', 1)[1]) + 1 for username in usernames), default=0)
+
+    def seed_user(self, user):
+        Account.objects.bulk_create([
+            Account(user=user, name=f'Account {i + 1}', account_type=self.random.choice(Account.ACCOUNT_TYPES)[0],
+                    color=self.random.choice(COLORS))
+            for i in range(self.options['accounts'])
+        ])
+        accounts = list(Account.objects.filter(user=user))
+
+        profiles = self.category_profiles(self.options['categories'])
+        Category.objects.bulk_create([
+            Category(user=user, name=name, category_type=category_type, color=self.random.choice(COLORS))
+            for name, category_type, _, _ in profiles
+        ])
+        categories = list(Category.objects.filter(user=user).order_by('pk'))
+        pools = {
+            is_income: [item for item in zip(categories, profiles) if (item[1][1] == 'income') == is_income]
+            for is_income in (True, False)
+        }
+
+        balance_deltas = defaultdict(int)
+        rollup_deltas = defaultdict(lambda: [0, 0])
+        batch = []
+        for _ in range(self.options['transactions']):
+            txn = self.make_transaction(user, accounts, pools)
+            balance_deltas[txn.account_id] += txn.signed_amount
+            delta = rollup_deltas[MonthlyRollup.key_for(txn)]
+            delta[0] += txn.amount
+            delta[1] += 1
+            batch.append(txn)
+            if len(batch) >= self.options['batch_size']:
+                Transaction.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            Transaction.objects.bulk_create(batch)
+
+        Account.apply_balance_deltas(balance_deltas)
+        MonthlyRollup.apply_deltas(rollup_deltas)
+
+        expense_categories = [category for category in categories if category.category_type == 'expense']
+        budgets = evaluate_budgets(user, [
+            Budget(
+                user=user, category=self.random.choice(expense_categories),
+                amount=Decimal(self.random.randrange(100, 2000)),
+                start_date=self.today.replace(day=1) - timedelta(days=30 * self.random.randrange(0, 6)),
+                end_date=self.random.choice([None, self.today + timedelta(days=self.random.randrange(0, 90))])
+            )
+            for _ in range(self.options['budgets'] if expense_categories else 0)
+        ])
+        # bulk_create skips Budget.save(), which normally starts the running counter
+        for budget in budgets:
+            budget.spent_counter = budget.get_spent_amount()
+        Budget.objects.bulk_create(budgets)
+        return self.options['transactions']
+
+    def category_profiles(self, count):
+        """(name, type, log-mean, log-sigma) for `count` categories, mostly expenses"""
+        incomes = max(1, count // 6)
+        profiles = [(name, 'income', mu, sigma) for name, mu, sigma in INCOME_CATEGORIES[:incomes]]
+        for i in range(count - len(profiles)):
+            name, mu, sigma = EXPENSE_CATEGORIES[i % len(EXPENSE_CATEGORIES)]
+            suffix = f' {i // len(EXPENSE_CATEGORIES) + 1}' if i >= len(EXPENSE_CATEGORIES) else ''
+            profiles.append((name + suffix, 'expense', mu, sigma))
+        return profiles
+
+    def make_transaction(self, user, accounts, pools):
+        # Expenses vastly outnumber income entries
+        is_income = self.random.random() < 0.08
+        pool = pools[is_income] or pools[not is_income]
+        category, (name, category_type, mu, sigma) = self.random.choice(pool)
+
+        # Log-normal amounts; weekends get a little more spending
+        day = self.today - timedelta(days=int(self.random.triangular(0, self.options['days'], 0)))
+        if category_type == 'expense' and day.weekday() < 5 and self.random.random() < 0.2:
+            day += timedelta(days=5 - day.weekday())
+            day = min(day, self.today)
+        amount = Decimal(str(round(min(math.exp(self.random.gauss(mu, sigma)), 10 ** 7), 2))) or Decimal('0.01')
+
+        return Transaction(
+            user=user,
+            account=self.random.choice(accounts),
+            category=category,
+            amount=amount,
+            transaction_type=category_type,
+            description=f'{name} #{self.random.randrange(1, 10 ** 6)}',
+            date=day,
+            payment_method=self.random.choice(PAYMENT_METHODS),
+        )
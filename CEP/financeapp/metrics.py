@@ -0,0 +1,204 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the shape Prometheus expects"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self):
+        """(le label, cumulative count) pairs, ending with +Inf"""
+        running = 0
+        for bound, count in zip((*self.buckets, '+Inf'), self.counts):
+            running += count
+            yield str(bound), running
+
+
+class ViewStats:
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.python_seconds = 0.0
+        self.response_bytes = 0
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.query_counts = Histogram(QUERY_BUCKETS)
+
+
+class MetricsRegistry:
+    """Per-view request statistics of this process, aggregated in memory"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = defaultdict(ViewStats)
+
+    def observe(self, view, seconds, queries, sql_seconds, response_bytes):
+        with self.lock:
+            stats = self.views[view]
+            stats.requests += 1
+            stats.queries += queries
+            stats.sql_seconds += sql_seconds
+            stats.python_seconds += max(seconds - sql_seconds, 0)
+            stats.response_bytes += response_bytes
+            stats.duration.observe(seconds)
+            stats.query_counts.observe(queries)
+
+    def reset(self):
+        with self.lock:
+            self.views.clear()
+
+    def render(self):
+        """All statistics in the Prometheus text exposition format"""
+        with self.lock:
+            views = sorted(self.views.items())
+            lines = []
+
+            def family(name, kind, help_text, values):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for view, value in values:
+                    lines.append(f'{name}{{view="{view}"}} {value}')
+
+            family('finance_requests_total', 'counter', 'Requests handled',
+                   ((view, stats.requests) for view, stats in views))
+            family('finance_sql_queries_total', 'counter', 'SQL queries run while handling requests',
+                   ((view, stats.queries) for view, stats in views))
+            family('finance_sql_seconds_total', 'counter', 'Time spent in SQL queries',
+                   ((view, f'{stats.sql_seconds:.6f}') for view, stats in views))
+            family('finance_python_seconds_total', 'counter', 'Request time spent outside SQL queries',
+                   ((view, f'{stats.python_seconds:.6f}') for view, stats in views))
+            family('finance_response_bytes_total', 'counter', 'Response body bytes (streaming responses excluded)',
+                   ((view, stats.response_bytes) for view, stats in views))
+
+            for name, help_text, attribute in (
+                ('finance_request_duration_seconds', 'Request latency', 'duration'),
+                ('finance_request_queries', 'SQL queries per request', 'query_counts'),
+            ):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for view, stats in views:
+                    histogram = getattr(stats, attribute)
+                    for bound, count in histogram.samples():
+                        lines.append(f'{name}_bucket{{view="{view}",le="{bound}"}} {count}')
+                    lines.append(f'{name}_sum{{view="{view}"}} {histogram.sum}')
+                    lines.append(f'{name}_count{{view="{view}"}} {stats.requests}')
+
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+class QueryRecorder:
+    """Query count and time spent in queries of one request, on whichever threads they ran"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.seconds = 0.0
+
+    def add(self, seconds):
+        with self.lock:
+            self.queries += 1
+            self.seconds += seconds
+
+
+# Recorder of the request being handled. Context variables follow the request into sync_to_async threads
+# (sync views under ASGI) and into copied contexts (the async dashboard's section threads).
+current_recorder = ContextVar('query_recorder', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper installed on every connection, timing queries for the current request's recorder"""
+    recorder = current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        recorder.add(time.perf_counter() - started)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """connection_created receiver (see apps.py); connections are per thread, so each gets the wrapper as it opens"""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class MetricsMiddleware:
+    """Record query count, SQL time, Python time and response size per resolved URL name
+
+    Enabled with the METRICS_ENABLED setting. When it is off the middleware
+    removes itself at startup and connections are opened without the query
+    recorder (see apps.py), so it costs nothing. Queries are counted on
+    every connection that runs in the request's context, whether on the
+    request thread, the thread a sync view runs on under ASGI, or the async
+    dashboard's section threads.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        recorder = QueryRecorder()
+        token = current_recorder.set(recorder)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_recorder.reset(token)
+        return self.finish(request, response, recorder, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        token = current_recorder.set(recorder)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_recorder.reset(token)
+        return self.finish(request, response, recorder, time.perf_counter() - started)
+
+    @staticmethod
+    def finish(request, response, recorder, seconds):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match is not None else 'unresolved'
+        response_bytes = 0 if response.streaming else len(response.content)
+        registry.observe(view, seconds, recorder.queries, recorder.seconds, response_bytes)
+
+        timing = (
+            f'sql;dur={recorder.seconds * 1000:.1f};desc="{recorder.queries} queries", '
+            f'app;dur={max(seconds - recorder.seconds, 0) * 1000:.1f}, '
+            f'total;dur={seconds * 1000:.1f}'
+        )
+        existing = response.get('Server-Timing')
+        response['Server-Timing'] = f'{existing}, {timing}' if existing else timing
+        return response
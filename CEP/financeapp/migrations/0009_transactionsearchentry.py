@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:40
+
+import django.db.models.deletion
+import financeapp.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeapp', '0008_account_opening_balance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionSearchEntry',
+            fields=[
+                ('transaction', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='financeapp.transaction')),
+                ('description', models.TextField()),
+                ('notes', models.TextField()),
+                ('document', financeapp.models.SearchDocumentField(db_column='financeapp_transaction_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'financeapp_transaction_fts',
+                'managed': False,
+            },
+        ),
+    ]
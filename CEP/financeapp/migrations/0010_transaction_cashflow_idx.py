@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeapp', '0009_transactionsearchentry'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', 'date', 'transaction_type', 'category', 'account', 'payment_method', 'amount'], name='transaction_cashflow_idx'),
+        ),
+    ]
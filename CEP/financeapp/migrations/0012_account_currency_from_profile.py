@@ -0,0 +1,25 @@
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+def adopt_preferred_currency(apps, schema_editor):
+    """Tag existing accounts with their owner's preferred currency
+
+    Amounts were entered in that currency before accounts had one; only
+    accounts of users without a profile keep the field default.
+    """
+    Account = apps.get_model('financeapp', 'Account')
+    UserProfile = apps.get_model('financeapp', 'UserProfile')
+    preferred = UserProfile.objects.filter(user=OuterRef('user')).values('preferred_currency')[:1]
+    Account.objects.filter(user__profile__isnull=False).update(currency=Subquery(preferred))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('financeapp', '0011_exchangerate_account_currency'),
+    ]
+
+    operations = [
+        migrations.RunPython(adopt_preferred_currency, migrations.RunPython.noop),
+    ]
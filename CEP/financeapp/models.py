@@ -1,5 +1,13 @@
-from django.db import models
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connections, models, router, transaction, IntegrityError
+from django.db.models import F
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
+from django.utils import timezone
+from .utils import CENT, add_months, end_of_month, split_full_months
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
@@ -22,6 +30,10 @@ class Account(models.Model):
     name = models.CharField(max_length=100)
     account_type = models.CharField(max_length=20, choices=ACCOUNT_TYPES)
     balance = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    # Balance before any transaction; balance should equal this plus the net of all transactions
+    opening_balance = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    # ISO 4217 code; balance and the account's transaction amounts are in this currency
+    currency = models.CharField(max_length=3, default='USD')
     account_number = models.CharField(max_length=20, blank=True, null=True)
     color = models.CharField(max_length=20, default='#4299E1')
     created_at = models.DateTimeField(auto_now_add=True)
@@ -30,6 +42,48 @@ class Account(models.Model):
     def __str__(self):
         return f"{self.name} ({self.account_type})"
 
+    def save(self, *args, **kwargs):
+        # A new account starts from whatever balance it was given
+        if self._state.adding and not self.opening_balance:
+            self.opening_balance = self.balance
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def lock(account_ids):
+        """Lock account rows in id order for the rest of the current transaction
+
+        Every ledger write takes these locks before touching rollups, checkpoints
+        or budgets, so concurrent writers to an account queue on its row
+        instead of deadlocking on each other's rollup rows.
+        """
+        list(Account.objects.select_for_update(no_key=True).filter(pk__in=account_ids).order_by('pk').values_list('pk', flat=True))
+
+    @staticmethod
+    def apply_balance_deltas(deltas):
+        """Add a mapping of account id -> amount to balances with one UPDATE per account
+
+        The arithmetic happens in the database, so concurrent writers to the
+        same account never overwrite each other's changes.
+        """
+        now = timezone.now()
+        for account_id, delta in deltas.items():
+            if delta:
+                Account.objects.filter(pk=account_id).update(balance=F('balance') + delta, updated_at=now)
+
+class ExchangeRate(models.Model):
+    """Value of one unit of a currency in settings.FX_BASE_CURRENCY, as of a date"""
+    currency = models.CharField(max_length=3)
+    date = models.DateField()
+    rate = models.DecimalField(max_digits=20, decimal_places=10)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['currency', 'date'], name='unique_exchange_rate'),
+        ]
+
+    def __str__(self):
+        return f"{self.currency} {self.date} - {self.rate}"
+
 class Category(models.Model):
     CATEGORY_TYPES = [
         ('income', 'Income'),
@@ -48,6 +102,22 @@ class Category(models.Model):
     def __str__(self):
         return f"{self.name} ({self.category_type})"
 
+class TransactionQuerySet(models.QuerySet):
+    def delete(self):
+        """Delete the rows and reverse their balance, rollup and budget counter effects
+
+        Queryset deletes (the admin's "delete selected" included) never call
+        Transaction.delete(), so the rows are read first and their effects
+        reversed in one pass, as bulk ingestion applies them.
+        """
+        with transaction.atomic():
+            Account.lock(set(self.values_list('account_id', flat=True)))
+            deleted = list(self.select_for_update().only(
+                'user_id', 'account_id', 'category_id', 'amount', 'transaction_type', 'date'
+            ))
+            Transaction.apply_batch_effects(deleted, sign=-1)
+            return super().delete()
+
 class Transaction(models.Model):
     TRANSACTION_TYPES = [
         ('income', 'Income'),
@@ -72,48 +142,424 @@ class Transaction(models.Model):
     date = models.DateField()
     payment_method = models.CharField(max_length=10, choices=PAYMENT_METHODS, default='cash')
     notes = models.TextField(blank=True, null=True)
+    # Set on transactions posted by a recurring rule; `date` is then the occurrence date
+    recurring_rule = models.ForeignKey(
+        'RecurringRule', on_delete=models.SET_NULL, null=True, blank=True, related_name='transactions'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = TransactionQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # A rule posts each occurrence once, however often or concurrently it is materialized
+            models.UniqueConstraint(
+                fields=['recurring_rule', 'date'],
+                condition=models.Q(recurring_rule__isnull=False),
+                name='unique_recurring_occurrence'
+            ),
+        ]
+        indexes = [
+            # Keyset pagination of the ledger; also serves (user, date) range filters
+            models.Index(fields=['user', '-date', '-id'], name='transaction_ledger_idx'),
+            # Income/expense totals over a date range
+            models.Index(fields=['user', 'transaction_type', 'date'], name='transaction_user_type_idx'),
+            # Per-category spending (budgets, category filters)
+            models.Index(fields=['user', 'category', 'transaction_type', 'date'], name='transaction_user_cat_idx'),
+            # Duplicate detection during statement imports
+            models.Index(fields=['account', 'date', 'amount', 'description'], name='transaction_dedupe_idx'),
+            # Covers the per-day grouping of cashflow reports, so they never touch the table itself
+            models.Index(
+                fields=['user', 'date', 'transaction_type', 'category', 'account', 'payment_method', 'amount'],
+                name='transaction_cashflow_idx'
+            ),
+        ]
+
     def __str__(self):
         return f"{self.description} - {self.amount}"
 
+    @property
+    def signed_amount(self):
+        """Effect of this transaction on its account balance"""
+        return self.amount if self.transaction_type == 'income' else -self.amount
+
+    @staticmethod
+    def apply_batch_effects(transactions, sign=1):
+        """Apply (or with sign=-1, reverse) the effects of many transactions written without save()
+
+        Balance, rollup and budget counter deltas are summed in memory and
+        applied with one update per account, rollup key and budget. Balance
+        checkpoints from the earliest date written onwards are dropped per account.
+        """
+        balance_deltas = defaultdict(int)
+        rollup_deltas = defaultdict(lambda: [0, 0])
+        spending_deltas = defaultdict(lambda: defaultdict(int))
+        checkpoint_dates = {}
+
+        for txn in transactions:
+            balance_deltas[txn.account_id] += sign * txn.signed_amount
+            checkpoint_dates[txn.account_id] = min(txn.date, checkpoint_dates.get(txn.account_id, txn.date))
+            delta = rollup_deltas[MonthlyRollup.key_for(txn)]
+            delta[0] += sign * txn.amount
+            delta[1] += sign
+            if txn.transaction_type == 'expense':
+                spending_deltas[txn.user_id][(txn.category_id, txn.date)] += sign * txn.amount
+
+        Account.lock(checkpoint_dates)
+        Account.apply_balance_deltas(balance_deltas)
+        MonthlyRollup.apply_deltas(rollup_deltas)
+        BalanceCheckpoint.invalidate(checkpoint_dates)
+        for user_id, deltas in spending_deltas.items():
+            Budget.apply_spending_deltas(user_id, deltas)
+
     def save(self, *args, **kwargs):
         # Update account balance when transaction is saved
         is_new = self.pk is None
 
-        if not is_new:
-            # Get the original transaction from the database
-            old_transaction = Transaction.objects.get(pk=self.pk)
-            old_amount = old_transaction.amount
+        with transaction.atomic():
+            balance_deltas = {}
+            spending_deltas = defaultdict(int)
+            checkpoint_dates = {self.account_id: self.date}
 
-            # Revert previous transaction effect
-            if old_transaction.transaction_type == 'income':
-                old_transaction.account.balance -= old_amount
-            else:
-                old_transaction.account.balance += old_amount
+            if not is_new:
+                # Only the fields that affect balances and rollups are needed
+                old_transaction = Transaction.objects.only(
+                    'user_id', 'account_id', 'category_id', 'amount', 'transaction_type', 'date'
+                ).get(pk=self.pk)
 
-            old_transaction.account.save()
+                # Revert previous transaction effect on the account it was posted to
+                balance_deltas[old_transaction.account_id] = -old_transaction.signed_amount
+                checkpoint_dates[old_transaction.account_id] = min(
+                    old_transaction.date, checkpoint_dates.get(old_transaction.account_id, old_transaction.date)
+                )
+                if old_transaction.transaction_type == 'expense':
+                    spending_deltas[(old_transaction.category_id, old_transaction.date)] -= old_transaction.amount
 
-        # Apply new transaction effect
-        if self.transaction_type == 'income':
-            self.account.balance += self.amount
-        else:
-            self.account.balance -= self.amount
+            # Apply new transaction effect
+            balance_deltas[self.account_id] = balance_deltas.get(self.account_id, 0) + self.signed_amount
+            if self.transaction_type == 'expense':
+                spending_deltas[(self.category_id, self.date)] += self.amount
 
-        self.account.save()
-
-        super().save(*args, **kwargs)
+            Account.lock(checkpoint_dates)
+            super().save(*args, **kwargs)
+            Account.apply_balance_deltas(balance_deltas)
+            if not is_new:
+                MonthlyRollup.apply_transaction(old_transaction, sign=-1)
+            MonthlyRollup.apply_transaction(self)
+            BalanceCheckpoint.invalidate(checkpoint_dates)
+            Budget.apply_spending_deltas(self.user_id, spending_deltas)
 
     def delete(self, *args, **kwargs):
         # Update account balance when transaction is deleted
-        if self.transaction_type == 'income':
-            self.account.balance -= self.amount
+        with transaction.atomic():
+            Account.lock([self.account_id])
+            Account.apply_balance_deltas({self.account_id: -self.signed_amount})
+            MonthlyRollup.apply_transaction(self, sign=-1)
+            BalanceCheckpoint.invalidate({self.account_id: self.date})
+            if self.transaction_type == 'expense':
+                Budget.apply_spending_deltas(self.user_id, {(self.category_id, self.date): -self.amount})
+            return super().delete(*args, **kwargs)
+
+class RecurringRule(models.Model):
+    """Template for a transaction that repeats every `interval` days, weeks, months or years"""
+    FREQUENCIES = [
+        ('daily', 'Daily'),
+        ('weekly', 'Weekly'),
+        ('monthly', 'Monthly'),
+        ('yearly', 'Yearly'),
+    ]
+    # frequency -> (days, months) per interval
+    FREQUENCY_STEPS = {
+        'daily': (1, 0),
+        'weekly': (7, 0),
+        'monthly': (0, 1),
+        'yearly': (0, 12),
+    }
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recurring_rules')
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='recurring_rules')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='recurring_rules')
+    amount = models.DecimalField(max_digits=15, decimal_places=2)
+    transaction_type = models.CharField(max_length=10, choices=Transaction.TRANSACTION_TYPES)
+    description = models.CharField(max_length=200)
+    payment_method = models.CharField(max_length=10, choices=Transaction.PAYMENT_METHODS, default='bank')
+    notes = models.TextField(blank=True, null=True)
+    frequency = models.CharField(max_length=10, choices=FREQUENCIES)
+    interval = models.PositiveIntegerField(default=1)
+    start_date = models.DateField()
+    end_date = models.DateField(null=True, blank=True)
+    is_active = models.BooleanField(default=True)
+    # Occurrences already materialized, and the date of the next one (None once past end_date)
+    occurrences = models.PositiveIntegerField(default=0)
+    next_date = models.DateField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.description} every {self.interval} {self.frequency}"
+
+    def save(self, *args, **kwargs):
+        # Changing the schedule keeps the number of occurrences already posted
+        self.next_date = self.occurrence_date(self.occurrences)
+        super().save(*args, **kwargs)
+
+    def occurrence_date(self, index):
+        """Date of the rule's `index`-th occurrence (0 is start_date), or None past end_date
+
+        Monthly and yearly dates count from start_date, so a rule starting on
+        the 31st falls on the last day of shorter months and returns to the
+        31st afterwards.
+        """
+        days, months = self.FREQUENCY_STEPS[self.frequency]
+        if months:
+            month = add_months(self.start_date, index * self.interval * months)
+            day = month.replace(day=min(self.start_date.day, end_of_month(month).day))
         else:
-            self.account.balance += self.amount
+            day = self.start_date + timedelta(days=index * self.interval * days)
+        if self.end_date is not None and day > self.end_date:
+            return None
+        return day
+
+    def advance(self):
+        """Move on to the next occurrence without saving"""
+        self.occurrences += 1
+        self.next_date = self.occurrence_date(self.occurrences)
+
+    def build_transaction(self, day):
+        """Unsaved transaction for the occurrence on `day`"""
+        return Transaction(
+            user_id=self.user_id,
+            account_id=self.account_id,
+            category_id=self.category_id,
+            amount=self.amount,
+            transaction_type=self.transaction_type,
+            description=self.description,
+            payment_method=self.payment_method,
+            notes=self.notes,
+            date=day,
+            recurring_rule=self,
+        )
+
+class SearchDocumentField(models.TextField):
+    """The hidden column of an FTS5 table that is named after the table itself"""
+
+@SearchDocumentField.register_lookup
+class FullTextMatch(models.Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', (*lhs_params, *rhs_params)
+
+class TransactionSearchEntry(models.Model):
+    """Row of the SQLite FTS5 index over transaction descriptions and notes
+
+    The virtual table and the triggers that keep it in step with every write
+    to Transaction are created by financeapp.search after migrate; this model
+    only exists so searches can join against it.
+    """
+    transaction = models.OneToOneField(
+        Transaction, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid', related_name='search_entry'
+    )
+    description = models.TextField()
+    notes = models.TextField()
+    document = SearchDocumentField(db_column='financeapp_transaction_fts')
+    # bm25 score of the current MATCH; lower is a better match
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'financeapp_transaction_fts'
+
+class MonthlyRollup(models.Model):
+    """Per-month transaction totals, kept in step with Transaction writes"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='monthly_rollups')
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='monthly_rollups')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='monthly_rollups')
+    transaction_type = models.CharField(max_length=10, choices=Transaction.TRANSACTION_TYPES)
+    month = models.DateField()
+    amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'account', 'category', 'transaction_type', 'month'],
+                name='unique_monthly_rollup'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'month'], name='rollup_user_month_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} {self.transaction_type} - {self.amount}"
 
-        self.account.save()
-        super().delete(*args, **kwargs)
+    @staticmethod
+    def key_for(txn):
+        """Rollup key (user_id, account_id, category_id, transaction_type, month) of a transaction"""
+        return (txn.user_id, txn.account_id, txn.category_id, txn.transaction_type, txn.date.replace(day=1))
+
+    @classmethod
+    def apply_transaction(cls, txn, sign=1):
+        """Add (or with sign=-1, remove) a single transaction's effect"""
+        cls.apply_deltas({cls.key_for(txn): (sign * txn.amount, sign)})
+
+    @classmethod
+    def apply_deltas(cls, deltas):
+        """Apply a mapping of rollup key -> (amount delta, count delta) in place
+
+        Large batches are applied with one bulk UPDATE for existing rows and
+        one bulk INSERT for new ones; a single key goes through a plain UPDATE.
+        """
+        if len(deltas) > 1:
+            deltas = cls._apply_bulk_deltas(deltas)
+
+        for key, (amount, count) in deltas.items():
+            cls._apply_delta(key, amount, count)
+
+    @classmethod
+    def _apply_bulk_deltas(cls, deltas):
+        """Bulk-apply deltas, returning any that still need the per-key path"""
+        months = [key[4] for key in deltas]
+        candidates = cls.objects.filter(
+            user_id__in={key[0] for key in deltas},
+            account_id__in={key[1] for key in deltas},
+            month__gte=min(months),
+            month__lte=max(months)
+        )
+
+        updated_keys = set()
+        existing = []
+        for rollup_id, *key in candidates.values_list(
+            'id', 'user_id', 'account_id', 'category_id', 'transaction_type', 'month'
+        ).iterator():
+            key = tuple(key)
+            if key in deltas:
+                amount, count = deltas[key]
+                existing.append((amount, count, rollup_id))
+                updated_keys.add(key)
+        if existing:
+            # One statement run for every row; bulk_update would build a CASE expression per row
+            connection = connections[router.db_for_write(cls)]
+            quote = connection.ops.quote_name
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    f"UPDATE {quote(cls._meta.db_table)} SET {quote('amount')} = {quote('amount')} + %s, "
+                    f"{quote('count')} = {quote('count')} + %s WHERE {quote('id')} = %s",
+                    existing
+                )
+
+        missing = {key: delta for key, delta in deltas.items() if key not in updated_keys}
+        try:
+            with transaction.atomic():
+                cls.objects.bulk_create([
+                    cls(user_id=user_id, account_id=account_id, category_id=category_id,
+                        transaction_type=transaction_type, month=month, amount=amount, count=count)
+                    for (user_id, account_id, category_id, transaction_type, month), (amount, count) in missing.items()
+                ], batch_size=500)
+        except IntegrityError:
+            # A concurrent writer created some of the rows; fall back to per-key upserts
+            return missing
+        return {}
+
+    @classmethod
+    def _apply_delta(cls, key, amount, count):
+        user_id, account_id, category_id, transaction_type, month = key
+        lookup = {
+            'user_id': user_id,
+            'account_id': account_id,
+            'category_id': category_id,
+            'transaction_type': transaction_type,
+            'month': month,
+        }
+        changes = {'amount': F('amount') + amount, 'count': F('count') + count}
+
+        if cls.objects.filter(**lookup).update(**changes):
+            return
+
+        try:
+            with transaction.atomic():
+                cls.objects.create(amount=amount, count=count, **lookup)
+        except IntegrityError:
+            # Another writer created the row first
+            cls.objects.filter(**lookup).update(**changes)
+
+class BalanceCheckpoint(models.Model):
+    """Net transaction total of an account before the first day of a month
+
+    Built lazily from the monthly rollups (see financeapp.ledger) so a balance
+    on any date only needs the transactions since the nearest checkpoint.
+    Checkpoints after a backdated write are deleted and rebuilt on demand.
+    """
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='balance_checkpoints')
+    month = models.DateField()
+    # Income minus expenses of every transaction dated before `month`
+    net_before = models.DecimalField(max_digits=15, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'month'], name='unique_balance_checkpoint'),
+        ]
+
+    def __str__(self):
+        return f"{self.account} before {self.month:%Y-%m}: {self.net_before}"
+
+    @staticmethod
+    def invalidate(account_dates):
+        """Drop checkpoints made stale by writes, given account id -> earliest date written
+
+        Must run inside the write's transaction, after Account.lock() on the
+        same accounts, which ledger.ensure_checkpoints() also takes, so checkpoints
+        are never built from rollups this write has not committed yet and saved after it.
+        """
+        for account_id, day in account_dates.items():
+            BalanceCheckpoint.objects.filter(account_id=account_id, month__gt=day).delete()
+
+def sum_transactions(user_id, start_date, end_date=None, **filters):
+    """Sum transaction amounts in a date window
+
+    Whole months are read from MonthlyRollup; only the partial months at the
+    edges of the window touch the Transaction table.
+    """
+    first_month, last_month, edges = split_full_months(start_date, end_date)
+    total = 0
+
+    if first_month is not None:
+        rollups = MonthlyRollup.objects.filter(user_id=user_id, month__gte=first_month, **filters)
+        if last_month is not None:
+            rollups = rollups.filter(month__lte=last_month)
+        total += rollups.aggregate(models.Sum('amount'))['amount__sum'] or 0
+
+    if edges:
+        date_filter = models.Q()
+        for edge_start, edge_end in edges:
+            date_filter |= models.Q(date__gte=edge_start, date__lte=edge_end)
+        total += Transaction.objects.filter(
+            date_filter, user_id=user_id, **filters
+        ).aggregate(models.Sum('amount'))['amount__sum'] or 0
+
+    return total
+
+class BudgetQuerySet(models.QuerySet):
+    def with_spent_amount(self):
+        """Annotate each budget with its spent amount using one correlated subquery"""
+        spent = Transaction.objects.filter(
+            user=models.OuterRef('user'),
+            category=models.OuterRef('category'),
+            transaction_type='expense',
+            date__gte=models.OuterRef('start_date'),
+            # An open-ended budget compares the date against itself
+            date__lte=Coalesce(models.OuterRef('end_date'), F('date'))
+        ).order_by().values('category').annotate(total=models.Sum('amount')).values('total')
+
+        return self.annotate(spent_amount=Coalesce(
+            models.Subquery(spent, output_field=models.DecimalField(max_digits=15, decimal_places=2)),
+            models.Value(0, output_field=models.DecimalField(max_digits=15, decimal_places=2))
+        ))
 
 class Budget(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='budgets')
@@ -121,29 +567,121 @@ class Budget(models.Model):
     amount = models.DecimalField(max_digits=15, decimal_places=2)
     start_date = models.DateField()
     end_date = models.DateField(blank=True, null=True)
+    # Running total of expenses in the window, kept up to date by transaction writes
+    spent_counter = models.DecimalField(max_digits=15, decimal_places=2, default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Set by Budget.objects.with_spent_amount() or on first get_spent_amount() call
+    spent_amount = None
+
+    objects = BudgetQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.category.name} Budget - {self.amount}"
 
-    def get_spent_amount(self):
-        """Calculate how much has been spent in this budget's category during budget period"""
-        query = Transaction.objects.filter(
-            user=self.user,
-            category=self.category,
-            transaction_type='expense',
-            date__gte=self.start_date
-        )
+    def save(self, *args, **kwargs):
+        # The budget window or category may have changed, so drop the memoized value
+        # and restart the running counter from the transactions in the window
+        self.spent_amount = None
+        self.spent_counter = self.get_spent_amount()
+        with transaction.atomic():
+            previous = None
+            if not self._state.adding:
+                previous = Budget.objects.filter(pk=self.pk).values_list('amount', 'spent_counter').first()
+            super().save(*args, **kwargs)
+            # A lower amount or a wider window can cross a threshold just as new spending does
+            before = previous or (self.amount, Decimal(0))
+            BudgetAlert.objects.bulk_create([
+                BudgetAlert(
+                    user_id=self.user_id, budget=self, threshold=threshold,
+                    spent_amount=self.spent_counter, budget_amount=self.amount
+                )
+                for threshold in Budget.crossed_thresholds(before, (self.amount, self.spent_counter))
+            ])
+
+    @staticmethod
+    def crossed_thresholds(before, after):
+        """Alert thresholds reached at `after` but not at `before`, both (amount, spent) pairs"""
+        (amount_before, spent_before), (amount, spent) = before, after
+        return [
+            threshold for threshold in BudgetAlert.THRESHOLDS
+            if spent_before < amount_before * threshold / 100 and amount * threshold / 100 <= spent
+        ]
+
+    @staticmethod
+    def apply_spending_deltas(user_id, deltas):
+        """Add expense deltas keyed by (category_id, date) to the counters of matching budgets
 
-        if self.end_date:
-            query = query.filter(date__lte=self.end_date)
+        Records a BudgetAlert for every threshold a counter crosses upwards and
+        returns the new alerts.
+        """
+        by_category = defaultdict(list)
+        for (category_id, day), amount in deltas.items():
+            if amount:
+                by_category[category_id].append((day, amount))
+        if not by_category:
+            return []
 
-        return query.aggregate(models.Sum('amount'))['amount__sum'] or 0
+        days = [day for entries in by_category.values() for day, _ in entries]
+        budgets = Budget.objects.filter(
+            models.Q(end_date__isnull=True) | models.Q(end_date__gte=min(days)),
+            user_id=user_id,
+            category_id__in=by_category,
+            start_date__lte=max(days)
+        ).only('id', 'category_id', 'start_date', 'end_date')
+
+        changes = {}
+        for budget in budgets:
+            delta = sum(
+                amount for day, amount in by_category[budget.category_id]
+                if budget.start_date <= day and (budget.end_date is None or day <= budget.end_date)
+            )
+            if delta:
+                changes[budget.pk] = delta
+        if not changes:
+            return []
+
+        for budget_id, delta in changes.items():
+            Budget.objects.filter(pk=budget_id).update(spent_counter=F('spent_counter') + delta)
+
+        alerts = []
+        for budget_id, amount, spent in Budget.objects.filter(pk__in=changes).values_list('pk', 'amount', 'spent_counter'):
+            alerts.extend(
+                BudgetAlert(
+                    user_id=user_id, budget_id=budget_id, threshold=threshold, spent_amount=spent, budget_amount=amount
+                )
+                for threshold in Budget.crossed_thresholds((amount, spent - changes[budget_id]), (amount, spent))
+            )
+        return BudgetAlert.objects.bulk_create(alerts)
+
+    def get_spent_amount(self):
+        """Calculate how much has been spent in this budget's category during budget period"""
+        if self.spent_amount is None:
+            self.spent_amount = sum_transactions(
+                self.user_id, self.start_date, self.end_date,
+                category_id=self.category_id,
+                transaction_type='expense'
+            )
+        return Decimal(self.spent_amount).quantize(CENT)
 
     def get_remaining(self):
         """Calculate remaining budget"""
         return self.amount - self.get_spent_amount()
 
+class BudgetAlert(models.Model):
+    """Recorded when a budget's spending crosses one of the alert thresholds"""
+    THRESHOLDS = (80, 100)
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='budget_alerts')
+    budget = models.ForeignKey(Budget, on_delete=models.CASCADE, related_name='alerts')
+    threshold = models.PositiveSmallIntegerField()
+    spent_amount = models.DecimalField(max_digits=15, decimal_places=2)
+    budget_amount = models.DecimalField(max_digits=15, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.budget} reached {self.threshold}%"
+
 class Goal(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='goals')
     name = models.CharField(max_length=100)
@@ -159,3 +697,60 @@ class Goal(models.Model):
         if self.target_amount == 0:
             return 0
         return (self.current_amount / self.target_amount) * 100
+
+class Job(models.Model):
+    """A unit of background work, queued in the database and run by `manage.py run_worker`"""
+    KINDS = [
+        ('import_statement', 'Statement import'),
+        ('export_transactions', 'Transaction export'),
+        ('cashflow_report', 'Cashflow report'),
+        ('reconcile_balances', 'Balance reconciliation'),
+    ]
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUSES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    # Null for jobs started from the command line, such as reconciliations
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='jobs')
+    kind = models.CharField(max_length=30, choices=KINDS)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    # Units of work done out of `total` (rows, accounts...); total stays null when unknown
+    progress = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    # Set while running: the worker that claimed the job and when it last reported being alive
+    worker = models.CharField(max_length=100, blank=True, default='')
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['run_after', 'id'], condition=models.Q(status='queued'), name='job_queue_idx'),
+            models.Index(fields=['heartbeat_at'], condition=models.Q(status='running'), name='job_running_idx'),
+            models.Index(fields=['user', '-created_at'], name='job_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.pk} ({self.status})"
+
+    def set_progress(self, progress, total=None):
+        """Save progress with a single UPDATE, leaving the rest of the row to the worker"""
+        self.progress = progress
+        fields = {'progress': progress}
+        if total is not None:
+            self.total = fields['total'] = total
+        Job.objects.filter(pk=self.pk).update(**fields)
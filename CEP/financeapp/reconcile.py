@@ -0,0 +1,92 @@
+from decimal import Decimal
+
+from django.db import transaction
+
+from .ledger import net_amount
+from .models import Account, Transaction
+from .utils import CENT
+
+RECONCILE_CHUNK_SIZE = 1000
+# Mismatches listed per report; the rest are only counted
+MAX_REPORTED_MISMATCHES = 100
+
+
+def reconcile_chunk(after_pk, chunk_size=RECONCILE_CHUNK_SIZE, user_range=None, fix=False, adopt_opening=False):
+    """Check the next `chunk_size` accounts after primary key `after_pk`
+
+    The expected balances of the whole chunk come from one grouped aggregate.
+    Returns ``(accounts, mismatches)`` where mismatches is a list of
+    ``(account, recorded balance, expected balance)``. With `fix` the drifted
+    balances are rewritten; with `adopt_opening` the difference is kept as
+    the opening balance instead. Either way it is one bulk UPDATE per chunk,
+    made while the chunk's rows are locked so concurrent transaction writes
+    queue behind it rather than being overwritten.
+    """
+    writes = fix or adopt_opening
+    with transaction.atomic():
+        accounts = Account.objects.filter(pk__gt=after_pk).order_by('pk').only(
+            'pk', 'user_id', 'balance', 'opening_balance'
+        )
+        if user_range is not None:
+            accounts = accounts.filter(user_id__gte=user_range[0], user_id__lt=user_range[1])
+        if writes:
+            accounts = accounts.select_for_update()
+        accounts = list(accounts[:chunk_size])
+        if not accounts:
+            return accounts, []
+
+        nets = dict(
+            Transaction.objects.filter(account_id__in=[account.pk for account in accounts])
+            .values('account_id').annotate(net=net_amount()).order_by()
+            .values_list('account_id', 'net')
+        )
+
+        mismatches = []
+        for account in accounts:
+            net = Decimal(nets.get(account.pk, 0)).quantize(CENT)
+            expected = account.opening_balance + net
+            if expected != account.balance:
+                mismatches.append((account, account.balance, expected))
+
+        if fix:
+            for account, _, expected in mismatches:
+                account.balance = expected
+            Account.objects.bulk_update([account for account, _, _ in mismatches], ['balance'])
+        elif adopt_opening:
+            for account, recorded, expected in mismatches:
+                account.opening_balance += recorded - expected
+            Account.objects.bulk_update([account for account, _, _ in mismatches], ['opening_balance'])
+
+    return accounts, mismatches
+
+
+def reconcile_accounts(chunk_size=RECONCILE_CHUNK_SIZE, user_range=None, fix=False, adopt_opening=False):
+    """Yield ``(accounts, mismatches)`` chunk by chunk over every account in primary-key order"""
+    after_pk = 0
+    while True:
+        accounts, mismatches = reconcile_chunk(after_pk, chunk_size, user_range, fix, adopt_opening)
+        if not accounts:
+            return
+        yield accounts, mismatches
+        after_pk = accounts[-1].pk
+
+
+def format_mismatch(account, recorded, expected):
+    return f'Account {account.pk} (user {account.user_id}): balance {recorded}, expected {expected}'
+
+
+def reconcile_user_range(user_range, chunk_size=RECONCILE_CHUNK_SIZE, fix=False, adopt_opening=False,
+                         sample_size=MAX_REPORTED_MISMATCHES):
+    """Reconcile the accounts of users with ids in ``[start, end)``; the unit of work of one worker process
+
+    Returns ``(accounts checked, accounts mismatched, report lines)`` with
+    lines for the first `sample_size` mismatches only, so widespread drift
+    doesn't pile up in memory or in the result sent back to the parent.
+    """
+    checked = mismatched = 0
+    lines = []
+    for accounts, mismatches in reconcile_accounts(chunk_size, user_range, fix, adopt_opening):
+        checked += len(accounts)
+        mismatched += len(mismatches)
+        lines.extend(format_mismatch(*mismatch) for mismatch in mismatches[:sample_size - len(lines)])
+    return checked, mismatched, lines
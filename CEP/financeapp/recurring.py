@@ -0,0 +1,94 @@
+from collections import defaultdict
+
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import F
+
+from .ingest import post_transactions
+from .models import RecurringRule, Transaction
+
+MATERIALIZE_CHUNK_SIZE = 1000
+
+
+def due_rules(today, after_pk=0):
+    """Active rules with an occurrence on or before `today`, in primary key order from `after_pk`
+
+    Walking the primary key visits every rule once per run and keeps a
+    user's rules (created together) in the same chunks, so each chunk
+    touches few accounts, rollups and budgets. On databases that support it,
+    rules being materialized by another worker are locked and skipped rather
+    than waited for; they are left for that worker.
+    """
+    rules = RecurringRule.objects.filter(pk__gt=after_pk, is_active=True, next_date__lte=today).order_by('pk')
+    if connection.features.has_select_for_update_skip_locked:
+        rules = rules.select_for_update(skip_locked=True)
+    return rules
+
+
+def materialize_chunk(today, after_pk=0, chunk_size=MATERIALIZE_CHUNK_SIZE):
+    """Post every due occurrence of up to `chunk_size` rules after `after_pk`
+
+    Returns (rules, transactions posted, last rule pk). Occurrences that
+    already have a transaction (an earlier run that died before advancing
+    its rules, or a posted transaction whose rule was rescheduled) are
+    skipped, found with one query for the whole chunk. The rest go through
+    post_transactions(): chunked bulk inserts and a single balance, rollup
+    and budget delta per account, key and budget.
+
+    Databases without SKIP LOCKED (SQLite) can't keep two workers off the
+    same chunk. The unique (rule, date) constraint, or SQLite's single write
+    lock, fails the slower one; it rolls back and returns (0, 0, last rule
+    pk), leaving those rules to the worker that got there first.
+    """
+    rules = []
+    try:
+        with transaction.atomic():
+            rules = list(due_rules(today, after_pk)[:chunk_size])
+            if not rules:
+                return 0, 0, None
+            posted = post_due_occurrences(rules, today)
+    except (IntegrityError, OperationalError):
+        if connection.features.has_select_for_update_skip_locked or not rules:
+            raise
+        return 0, 0, rules[-1].pk
+    return len(rules), posted, rules[-1].pk
+
+
+def post_due_occurrences(rules, today):
+    """Post the due occurrences of `rules` missing a transaction and advance the rules; returns the number posted"""
+    existing = set(Transaction.objects.filter(
+        recurring_rule__in=rules, date__gte=min(rule.next_date for rule in rules), date__lte=today
+    ).values_list('recurring_rule_id', 'date'))
+
+    transactions = []
+    # (occurrences added, new next_date) -> rule ids, so progress is saved with one UPDATE per group
+    progress = defaultdict(list)
+    for rule in rules:
+        advanced = 0
+        while rule.next_date is not None and rule.next_date <= today:
+            if (rule.pk, rule.next_date) not in existing:
+                transactions.append(rule.build_transaction(rule.next_date))
+            rule.advance()
+            advanced += 1
+        progress[advanced, rule.next_date].append(rule.pk)
+
+    if transactions:
+        post_transactions(transactions)
+    for (advanced, next_date), rule_ids in progress.items():
+        RecurringRule.objects.filter(pk__in=rule_ids).update(
+            occurrences=F('occurrences') + advanced, next_date=next_date
+        )
+    return len(transactions)
+
+
+def materialize_due(today, chunk_size=MATERIALIZE_CHUNK_SIZE):
+    """Materialize chunks until no rule is due, yielding (rules, transactions) per chunk
+
+    Each chunk commits on its own, so an interrupted run keeps its progress
+    and a rerun picks up where it stopped.
+    """
+    after_pk = 0
+    while True:
+        rules, posted, after_pk = materialize_chunk(today, after_pk, chunk_size)
+        if after_pk is None:
+            return
+        yield rules, posted
@@ -0,0 +1,172 @@
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Sum
+
+from .fx import Converter, currency_context, is_mixed
+from .models import Account, Category, MonthlyRollup, Transaction
+from .utils import CENT, add_months, split_full_months
+
+GRANULARITIES = ('day', 'week', 'month', 'quarter', 'year')
+GROUP_BY = ('category', 'account', 'payment_method')
+MAX_REPORT_PERIODS = 5000
+
+# group_by -> column holding the group key on Transaction
+GROUP_FIELDS = {
+    'category': 'category_id',
+    'account': 'account_id',
+    'payment_method': 'payment_method',
+}
+
+
+def period_start(day, granularity):
+    """First day of the period containing `day`; weeks start on Monday"""
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    if granularity == 'quarter':
+        return day.replace(month=(day.month - 1) // 3 * 3 + 1, day=1)
+    if granularity == 'year':
+        return day.replace(month=1, day=1)
+    return day
+
+
+def next_period(start, granularity):
+    if granularity == 'week':
+        return start + timedelta(days=7)
+    if granularity == 'month':
+        return add_months(start, 1)
+    if granularity == 'quarter':
+        return add_months(start, 3)
+    if granularity == 'year':
+        return add_months(start, 12)
+    return start + timedelta(days=1)
+
+
+def report_periods(start_date, end_date, granularity):
+    """Start dates of every period overlapping the range, empty ones included"""
+    periods = []
+    period = period_start(start_date, granularity)
+    while period <= end_date:
+        periods.append(period)
+        try:
+            period = next_period(period, granularity)
+        except (OverflowError, ValueError):
+            # The last period runs up to date.max
+            break
+    return periods
+
+
+def load_totals(user, start_date, end_date, granularity, group_field=None, per_account=False):
+    """Totals keyed by (date, transaction_type, group key, account id), at the coarsest precision that still buckets exactly
+
+    Ranges of whole months bucketed by month or longer come from the monthly
+    rollups; everything else is grouped per day in the database. Either way
+    the result has at most a few rows per day, so the period bucketing that
+    follows is cheap. The account id is only split out (otherwise None) with
+    `per_account`, for converting currencies.
+    """
+    columns = ['transaction_type'] + ([group_field] if group_field else [])
+    if per_account and group_field != 'account_id':
+        columns.append('account_id')
+    ranges = [(start_date, end_date)]
+    rows = []
+
+    # The rollups carry no payment method, so that grouping always reads raw rows
+    if granularity in ('month', 'quarter', 'year') and group_field != 'payment_method':
+        first_month, last_month, ranges = split_full_months(start_date, end_date)
+        if first_month is not None:
+            rollups = MonthlyRollup.objects.filter(user=user, month__gte=first_month, month__lte=last_month)
+            rows.extend(
+                (row['month'], row['transaction_type'], row.get(group_field), row.get('account_id'), row['total'])
+                for row in rollups.values('month', *columns).annotate(total=Sum('amount')).order_by()
+            )
+
+    for range_start, range_end in ranges:
+        transactions = Transaction.objects.filter(user=user, date__gte=range_start, date__lte=range_end)
+        rows.extend(
+            (row['date'], row['transaction_type'], row.get(group_field), row.get('account_id'), row['total'])
+            for row in transactions.values('date', *columns).annotate(total=Sum('amount')).order_by()
+        )
+    return rows
+
+
+def group_names(user, group_by):
+    if group_by == 'category':
+        return dict(Category.objects.filter(user=user).values_list('pk', 'name'))
+    if group_by == 'account':
+        return dict(Account.objects.filter(user=user).values_list('pk', 'name'))
+    return dict(Transaction.PAYMENT_METHODS)
+
+
+def cashflow_report(user, start_date, end_date, granularity='month', group_by=None):
+    """Income, expenses and net per period between two dates, optionally split by a group
+
+    Every period in the range is present, with zeros where nothing happened.
+    Amounts are in the user's preferred currency; with accounts in other
+    currencies each period is converted at the rates of its first day.
+    """
+    periods = report_periods(start_date, end_date, granularity)
+    index = {period: position for position, period in enumerate(periods)}
+    group_field = GROUP_FIELDS.get(group_by)
+    context = currency_context(user.pk)
+    mixed = is_mixed(context)
+
+    totals = {'income': [Decimal(0)] * len(periods), 'expense': [Decimal(0)] * len(periods)}
+    groups = defaultdict(lambda: {'income': [Decimal(0)] * len(periods), 'expense': [Decimal(0)] * len(periods)})
+    # (period position, transaction_type, group key) -> account id -> amount, converted once all rows are in
+    unconverted = defaultdict(lambda: defaultdict(Decimal))
+
+    # Bucket starts are memoized per date, so each distinct day is mapped once
+    buckets = {}
+    for day, transaction_type, key, account_id, total in load_totals(
+        user, start_date, end_date, granularity, group_field, per_account=mixed
+    ):
+        position = buckets.get(day)
+        if position is None:
+            position = buckets[day] = index[period_start(day, granularity)]
+        if mixed:
+            unconverted[position, transaction_type, key][account_id] += Decimal(total)
+            continue
+        amount = Decimal(total)
+        totals[transaction_type][position] += amount
+        if group_field:
+            groups[key][transaction_type][position] += amount
+
+    if unconverted:
+        converter = Converter(context, periods[0], end_date)
+        for (position, transaction_type, key), amounts in unconverted.items():
+            amount = converter.total(amounts, periods[position])
+            totals[transaction_type][position] += amount
+            if group_field:
+                groups[key][transaction_type][position] += amount
+
+    def series(values):
+        return [value.quantize(CENT) for value in values]
+
+    report = {
+        'currency': context.preferred,
+        'from': start_date,
+        'to': end_date,
+        'granularity': granularity,
+        'group_by': group_by,
+        'periods': periods,
+        'income': series(totals['income']),
+        'expenses': series(totals['expense']),
+        'net': series(income - expense for income, expense in zip(totals['income'], totals['expense'])),
+    }
+
+    if group_field:
+        names = group_names(user, group_by)
+        report['groups'] = [
+            {
+                'key': key,
+                'name': names.get(key, key),
+                'income': series(values['income']),
+                'expenses': series(values['expense']),
+            }
+            for key, values in sorted(groups.items(), key=lambda item: str(names.get(item[0], item[0])))
+        ]
+    return report
@@ -0,0 +1,134 @@
+import re
+from datetime import timedelta
+
+from django.db import connections
+from django.db.models import BooleanField, F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from .models import Transaction, TransactionSearchEntry
+
+SEARCH_TABLE = TransactionSearchEntry._meta.db_table
+TRANSACTION_TABLE = Transaction._meta.db_table
+
+# Postgres: the same expression is used by the GIN index and by searches, so the planner can match them
+POSTGRES_DOCUMENT = "to_tsvector('simple', coalesce(description, '') || ' ' || coalesce(notes, ''))"
+
+SQLITE_SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        description, notes, content='{TRANSACTION_TABLE}', content_rowid='id'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_insert AFTER INSERT ON {TRANSACTION_TABLE} BEGIN
+        INSERT INTO {SEARCH_TABLE}(rowid, description, notes) VALUES (new.id, new.description, new.notes);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_delete AFTER DELETE ON {TRANSACTION_TABLE} BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, description, notes)
+        VALUES ('delete', old.id, old.description, old.notes);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_update AFTER UPDATE OF description, notes ON {TRANSACTION_TABLE} BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, description, notes)
+        VALUES ('delete', old.id, old.description, old.notes);
+        INSERT INTO {SEARCH_TABLE}(rowid, description, notes) VALUES (new.id, new.description, new.notes);
+    END""",
+]
+
+POSTGRES_SCHEMA = [
+    f"CREATE INDEX IF NOT EXISTS transaction_search_idx ON {TRANSACTION_TABLE} USING gin ({POSTGRES_DOCUMENT})",
+]
+
+
+def search_terms(text):
+    """Words of a search box query; punctuation and search operators are ignored"""
+    return re.findall(r'\w+', text.lower())
+
+
+def install_search_index(using='default'):
+    """Create the full-text index for the database's backend if it is missing
+
+    SQLite gets an FTS5 table over description and notes that triggers keep
+    in sync with every insert, update and delete (bulk_create and queryset
+    deletes included); it is filled from existing rows when first created.
+    Postgres gets a GIN index over a tsvector expression. Other backends fall
+    back to icontains searches.
+    """
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            created = SEARCH_TABLE not in connection.introspection.table_names(cursor)
+            for statement in SQLITE_SCHEMA:
+                cursor.execute(statement)
+            if created:
+                cursor.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')")
+        elif connection.vendor == 'postgresql':
+            for statement in POSTGRES_SCHEMA:
+                cursor.execute(statement)
+
+
+def search_transactions(queryset, text):
+    """Restrict a Transaction queryset to matches of `text`, annotated with `search_rank`
+
+    Every word must match, as a prefix, in the description or the notes.
+    `search_rank` sorts ascending from the best match on every backend.
+    """
+    terms = search_terms(text)
+    if not terms:
+        return queryset.none().annotate(search_rank=Value(0.0))
+
+    vendor = connections[queryset.db].vendor
+    if vendor == 'sqlite':
+        query = ' '.join(f'"{term}"*' for term in terms)
+        return queryset.filter(search_entry__document__match=query).annotate(search_rank=F('search_entry__rank'))
+
+    if vendor == 'postgresql':
+        query = ' & '.join(f'{term}:*' for term in terms)
+        return queryset.filter(
+            RawSQL(f"{POSTGRES_DOCUMENT} @@ to_tsquery('simple', %s)", [query], output_field=BooleanField())
+        ).annotate(
+            # ts_rank() is a real; as a double the rank survives a round trip through the page cursor
+            search_rank=RawSQL(f"-ts_rank({POSTGRES_DOCUMENT}, to_tsquery('simple', %s))::float8", [query],
+                               output_field=FloatField())
+        )
+
+    for term in terms:
+        queryset = queryset.filter(Q(description__icontains=term) | Q(notes__icontains=term))
+    return queryset.annotate(search_rank=Value(0.0))
+
+
+def filter_transactions(queryset, params):
+    """Apply the transaction list's query parameters (account, category, type, date_range, search) and order it
+
+    Shared by the API and background exports, which receive the same
+    parameters from the request that queued them.
+    """
+    account_id = params.get('account', None)
+    category_id = params.get('category', None)
+    transaction_type = params.get('type', None)
+    date_range = params.get('date_range', None)
+
+    if account_id and account_id != 'all':
+        queryset = queryset.filter(account_id=account_id)
+
+    if category_id and category_id != 'all':
+        queryset = queryset.filter(category_id=category_id)
+
+    if transaction_type and transaction_type != 'all':
+        queryset = queryset.filter(transaction_type=transaction_type)
+
+    if date_range:
+        today = timezone.now().date()
+
+        if date_range == 'month':
+            start_date = today.replace(day=1)
+            queryset = queryset.filter(date__gte=start_date)
+        elif date_range == 'quarter':
+            start_date = today - timedelta(days=90)
+            queryset = queryset.filter(date__gte=start_date)
+        elif date_range == 'year':
+            start_date = today.replace(month=1, day=1)
+            queryset = queryset.filter(date__gte=start_date)
+
+    search = params.get('search')
+    if search:
+        return search_transactions(queryset, search).order_by('search_rank', '-id')
+
+    return queryset.order_by('-date', '-id')
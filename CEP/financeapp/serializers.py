@@ -1,6 +1,17 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import UserProfile, Account, Category, Transaction, Budget, Goal
+from django.urls import reverse
+from .fx import currency_context, is_supported_currency
+from .models import UserProfile, Account, Category, Transaction, RecurringRule, Budget, BudgetAlert, Goal, Job
+
+def validate_currency_code(value):
+    """An upper-cased ISO 4217 code that amounts can be converted from and to"""
+    value = value.upper()
+    if len(value) != 3 or not value.isalpha():
+        raise serializers.ValidationError('Use a three-letter ISO 4217 currency code.')
+    if not is_supported_currency(value):
+        raise serializers.ValidationError(f'No exchange rates are loaded for {value}.')
+    return value
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -24,6 +35,10 @@ class RegisterSerializer(serializers.ModelSerializer):
         fields = ('username', 'email', 'password', 'first_name', 'last_name', 'preferred_currency')
         extra_kwargs = {'password': {'write_only': True}}
 
+    @staticmethod
+    def validate_preferred_currency(value):
+        return validate_currency_code(value)
+
     @staticmethod
     def create(validated_data):
         preferred_currency = validated_data.pop('preferred_currency')
@@ -34,9 +49,28 @@ class RegisterSerializer(serializers.ModelSerializer):
 class AccountSerializer(serializers.ModelSerializer):
     class Meta:
         model = Account
-        fields = ('id', 'name', 'account_type', 'balance', 'account_number', 'color', 'created_at', 'updated_at')
+        fields = ('id', 'name', 'account_type', 'currency', 'balance', 'account_number', 'color',
+                  'created_at', 'updated_at')
         read_only_fields = ('id', 'created_at', 'updated_at')
 
+    def validate_currency(self, value):
+        # An account may keep its currency even if no rates are loaded for it any more
+        if self.instance is not None and value.upper() == self.instance.currency:
+            return self.instance.currency
+        return validate_currency_code(value)
+
+    def create(self, validated_data):
+        # New accounts are held in the owner's preferred currency unless told otherwise
+        if 'currency' not in validated_data:
+            validated_data['currency'] = currency_context(validated_data['user'].pk).preferred
+        return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        # A hand-edited balance is a correction of the opening balance, not drift
+        if 'balance' in validated_data:
+            validated_data['opening_balance'] = instance.opening_balance + validated_data['balance'] - instance.balance
+        return super().update(instance, validated_data)
+
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
@@ -47,13 +81,50 @@ class TransactionSerializer(serializers.ModelSerializer):
     account_name = serializers.ReadOnlyField(source='account.name')
     category_name = serializers.ReadOnlyField(source='category.name')
     category_color = serializers.ReadOnlyField(source='category.color')
+    currency = serializers.ReadOnlyField(source='account.currency')
 
     class Meta:
         model = Transaction
         fields = ('id', 'account', 'account_name', 'category', 'category_name', 'category_color', 
-                  'amount', 'transaction_type', 'description', 'date', 'payment_method', 
+                  'amount', 'currency', 'transaction_type', 'description', 'date', 'payment_method', 
                   'notes', 'created_at', 'updated_at')
-        read_only_fields = ('id', 'created_at', 'updated_at', 'account_name', 'category_name', 'category_color')
+        read_only_fields = ('id', 'created_at', 'updated_at', 'account_name', 'category_name', 'category_color',
+                            'currency')
+
+class RecurringRuleSerializer(serializers.ModelSerializer):
+    account_name = serializers.ReadOnlyField(source='account.name')
+    category_name = serializers.ReadOnlyField(source='category.name')
+
+    class Meta:
+        model = RecurringRule
+        fields = ('id', 'account', 'account_name', 'category', 'category_name', 'amount', 'transaction_type',
+                  'description', 'payment_method', 'notes', 'frequency', 'interval', 'start_date', 'end_date',
+                  'is_active', 'occurrences', 'next_date', 'created_at', 'updated_at')
+        read_only_fields = ('id', 'account_name', 'category_name', 'occurrences', 'next_date',
+                            'created_at', 'updated_at')
+
+    def validate_account(self, value):
+        if value.user_id != self.context['request'].user.pk:
+            raise serializers.ValidationError('Invalid account.')
+        return value
+
+    def validate_category(self, value):
+        if value.user_id != self.context['request'].user.pk:
+            raise serializers.ValidationError('Invalid category.')
+        return value
+
+    @staticmethod
+    def validate_interval(value):
+        if value < 1:
+            raise serializers.ValidationError('Must be at least 1.')
+        return value
+
+    def validate(self, attrs):
+        start_date = attrs.get('start_date', getattr(self.instance, 'start_date', None))
+        end_date = attrs.get('end_date', getattr(self.instance, 'end_date', None))
+        if start_date and end_date and end_date < start_date:
+            raise serializers.ValidationError({'end_date': 'Must not be before start_date.'})
+        return attrs
 
 class BudgetSerializer(serializers.ModelSerializer):
     category_name = serializers.ReadOnlyField(source='category.name')
@@ -84,6 +155,14 @@ class BudgetSerializer(serializers.ModelSerializer):
             return 0
         return (obj.get_spent_amount() / obj.amount) * 100
 
+class BudgetAlertSerializer(serializers.ModelSerializer):
+    category_name = serializers.ReadOnlyField(source='budget.category.name')
+
+    class Meta:
+        model = BudgetAlert
+        fields = ('id', 'budget', 'category_name', 'threshold', 'spent_amount', 'budget_amount', 'created_at')
+        read_only_fields = fields
+
 class GoalSerializer(serializers.ModelSerializer):
     percentage_complete = serializers.SerializerMethodField()
 
@@ -96,3 +175,26 @@ class GoalSerializer(serializers.ModelSerializer):
     @staticmethod
     def get_percentage_complete(obj):
         return obj.get_percentage_complete()
+
+class JobSerializer(serializers.ModelSerializer):
+    url = serializers.SerializerMethodField()
+    download = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = ('id', 'url', 'kind', 'status', 'progress', 'total', 'result', 'error', 'attempts',
+                  'created_at', 'started_at', 'finished_at', 'download')
+        read_only_fields = fields
+
+    def absolute_url(self, view_name, obj):
+        # Not DRF's reverse(): it would carry over ?format= from the request, an export format when queuing one
+        return self.context['request'].build_absolute_uri(reverse(view_name, args=[obj.pk]))
+
+    def get_url(self, obj):
+        return self.absolute_url('job-detail', obj)
+
+    def get_download(self, obj):
+        """Link to the file a finished export produced"""
+        if obj.status != Job.SUCCEEDED or not (obj.result or {}).get('file'):
+            return None
+        return self.absolute_url('job-download', obj)
@@ -0,0 +1,35 @@
+from django.db.models.signals import post_delete, post_save
+from django.db import transaction
+from django.dispatch import receiver
+
+from .cache import bump_dashboard_version
+from .fx import forget_currency_context
+from .models import Account, Budget, Category, Goal, RecurringRule, Transaction, UserProfile
+
+
+@receiver(post_save, sender=Account)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Transaction)
+@receiver(post_save, sender=Budget)
+@receiver(post_save, sender=Goal)
+@receiver(post_save, sender=RecurringRule)
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=Account)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Transaction)
+@receiver(post_delete, sender=Budget)
+@receiver(post_delete, sender=Goal)
+@receiver(post_delete, sender=RecurringRule)
+def invalidate_dashboard(sender, instance, **kwargs):
+    """Any write to data shown on the dashboard or used by forecasts (including the preferred currency they are
+    converted to) starts a new cache version"""
+    bump_dashboard_version(instance.user_id)
+
+
+@receiver(post_save, sender=Account)
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=Account)
+def invalidate_currency_context(sender, instance, **kwargs):
+    """Account currencies and the preferred currency are cached for conversions"""
+    user_id = instance.user_id
+    transaction.on_commit(lambda: forget_currency_context(user_id))
@@ -0,0 +1,241 @@
+import csv
+import re
+import time
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from .ingest import post_transactions, validate_row
+from .models import Category, Transaction
+
+IMPORT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+
+# Statement column -> Transaction field used when no explicit mapping is given
+DEFAULT_CSV_COLUMNS = {
+    'date': 'date',
+    'description': 'description',
+    'amount': 'amount',
+    'type': 'transaction_type',
+    'category': 'category',
+    'payment_method': 'payment_method',
+    'notes': 'notes',
+}
+
+CSV_DATE_FORMATS = ('%Y-%m-%d', '%m/%d/%Y', '%d.%m.%Y', '%Y%m%d')
+
+OFX_TAG = re.compile(r'<(/?)([A-Z0-9.]+)>([^<]*)', re.IGNORECASE)
+
+
+def parse_date(value):
+    """Parse the date formats commonly found in bank statements"""
+    value = value.strip().split('T')[0].split(' ')[0]
+    for date_format in CSV_DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    raise ValueError(f'Unrecognised date: {value!r}')
+
+
+def parse_csv(lines, columns=None, delimiter=','):
+    """Yield one dict of Transaction fields per CSV row
+
+    `columns` maps CSV header names to Transaction fields; unmapped columns
+    are ignored. Header matching is case-insensitive.
+    """
+    columns = {header.lower(): field for header, field in (columns or DEFAULT_CSV_COLUMNS).items()}
+    reader = csv.reader(lines, delimiter=delimiter)
+    try:
+        header = next(reader, None)
+        if header is None:
+            return
+
+        mapping = [(index, columns.get(name.strip().lower())) for index, name in enumerate(header)]
+        mapping = [(index, field) for index, field in mapping if field]
+
+        for record in reader:
+            if not any(cell.strip() for cell in record):
+                continue
+            yield {field: record[index].strip() for index, field in mapping if index < len(record)}
+    except csv.Error as exc:
+        # Reported like any other unreadable statement
+        raise ValueError(f'Malformed CSV on line {reader.line_num}: {exc}')
+
+
+def parse_ofx(lines):
+    """Yield one dict of Transaction fields per <STMTTRN> block of an OFX statement
+
+    Works for both SGML (unclosed tags) and XML flavoured OFX and only keeps
+    the current transaction in memory.
+    """
+    current = None
+    for line in lines:
+        for closing, tag, value in OFX_TAG.findall(line):
+            tag = tag.upper()
+            value = value.strip()
+            if tag == 'STMTTRN':
+                if closing and current is not None:
+                    yield current
+                    current = None
+                elif not closing:
+                    current = {}
+            elif current is not None and not closing and value:
+                if tag == 'DTPOSTED':
+                    current['date'] = value[:8]
+                elif tag == 'TRNAMT':
+                    current['amount'] = value
+                elif tag == 'NAME':
+                    current['description'] = value
+                elif tag == 'MEMO':
+                    current['notes'] = value
+
+
+class StatementImporter:
+    """Stream parsed statement rows into an account in fixed-size batches
+
+    Memory stays flat: only one batch of rows is held at a time, categories
+    are resolved from a name -> id cache built once, and duplicates are found
+    with one indexed query per batch rather than one per row. `on_flush`, if
+    given, is called with the stats after every committed batch.
+    """
+
+    def __init__(self, user, account, default_category=None, batch_size=IMPORT_BATCH_SIZE,
+                 start_row=0, skip_duplicates=True, on_flush=None):
+        self.user = user
+        self.account = account
+        self.batch_size = batch_size
+        self.start_row = start_row
+        self.skip_duplicates = skip_duplicates
+        self.on_flush = on_flush
+        self.categories = {
+            name.lower(): pk
+            for pk, name in Category.objects.filter(user=user).values_list('pk', 'name')
+        }
+        self.category_ids = set(self.categories.values())
+        self.default_category = self.resolve_category(default_category) if default_category else None
+        self.stats = {
+            'rows_read': 0,
+            'imported': 0,
+            'duplicates': 0,
+            'failed': 0,
+            'last_committed_row': start_row,
+            'errors': [],
+        }
+
+    def resolve_category(self, value):
+        if isinstance(value, int) or str(value).isdigit():
+            return int(value)
+        return self.categories.get(str(value).strip().lower())
+
+    def normalize(self, raw):
+        """Turn a parsed statement row into ingest.validate_row() input"""
+        try:
+            amount = Decimal(raw.get('amount', '').replace(',', ''))
+            # NaN and Infinity parse, but can't be compared or stored
+            if not amount.is_finite():
+                raise InvalidOperation
+        except InvalidOperation:
+            raise ValueError(f"Invalid amount: {raw.get('amount')!r}")
+
+        transaction_type = raw.get('transaction_type', '').lower()
+        if transaction_type not in ('income', 'expense'):
+            transaction_type = 'expense' if amount < 0 else 'income'
+
+        category = raw.get('category')
+        category_id = self.resolve_category(category) if category else self.default_category
+        if category_id is None:
+            raise ValueError(f'Unknown category: {category!r}' if category else 'No category given')
+
+        return {
+            'account': self.account.pk,
+            'category': category_id,
+            'amount': abs(amount),
+            'transaction_type': transaction_type,
+            'description': (raw.get('description') or 'Imported transaction')[:200],
+            'date': parse_date(raw.get('date', '')),
+            'payment_method': raw.get('payment_method') or 'bank',
+            'notes': raw.get('notes') or None,
+        }
+
+    def record_error(self, row_number, errors):
+        self.stats['failed'] += 1
+        if len(self.stats['errors']) < MAX_REPORTED_ERRORS:
+            self.stats['errors'].append({'row': row_number, 'errors': errors})
+
+    def run(self, rows):
+        """Import an iterable of parsed rows and return the stats dict"""
+        started = time.monotonic()
+        batch = []
+
+        for row_number, raw in enumerate(rows):
+            if row_number < self.start_row:
+                continue
+            self.stats['rows_read'] += 1
+
+            try:
+                data = self.normalize(raw)
+            except ValueError as exc:
+                self.record_error(row_number, {'non_field_errors': [str(exc)]})
+                continue
+
+            validated, errors = validate_row(data)
+            if errors:
+                self.record_error(row_number, errors)
+                continue
+            if validated['category_id'] not in self.category_ids:
+                self.record_error(row_number, {'category': ['Invalid category.']})
+                continue
+
+            batch.append(Transaction(user=self.user, **validated))
+            if len(batch) >= self.batch_size:
+                self.flush(batch, row_number + 1)
+                batch = []
+
+        if batch:
+            self.flush(batch, self.start_row + self.stats['rows_read'])
+
+        elapsed = time.monotonic() - started
+        self.stats['seconds'] = round(elapsed, 3)
+        self.stats['rows_per_second'] = round(self.stats['rows_read'] / elapsed, 1) if elapsed else None
+        return self.stats
+
+    def flush(self, batch, next_row):
+        """Write one batch, dropping rows that already exist in the account"""
+        if self.skip_duplicates:
+            batch = self.drop_duplicates(batch)
+        self.stats['imported'] += post_transactions(batch)
+        self.stats['last_committed_row'] = next_row
+        if self.on_flush is not None:
+            self.on_flush(self.stats)
+
+    def drop_duplicates(self, batch):
+        """Filter out rows matching (account, date, amount, description) of existing ones"""
+        existing = set(Transaction.objects.filter(
+            account=self.account,
+            date__in={txn.date for txn in batch},
+            amount__in={txn.amount for txn in batch}
+        ).values_list('date', 'amount', 'description'))
+
+        unique = []
+        for txn in batch:
+            key = (txn.date, txn.amount, txn.description)
+            if key in existing:
+                self.stats['duplicates'] += 1
+                continue
+            existing.add(key)
+            unique.append(txn)
+        return unique
+
+
+def parse_statement(lines, file_format, columns=None, delimiter=','):
+    """Pick the parser for a statement format"""
+    if file_format == 'ofx':
+        return parse_ofx(lines)
+    if file_format == 'csv':
+        return parse_csv(lines, columns=columns, delimiter=delimiter)
+    raise ValueError(f'Unsupported statement format: {file_format!r}')
+
+
+def detect_format(filename):
+    """Guess the statement format from a file name"""
+    return 'ofx' if filename.lower().endswith(('.ofx', '.qfx')) else 'csv'
@@ -0,0 +1,1425 @@
+import base64
+import csv
+import io
+import json
+import re
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection
+from django.db.backends.signals import connection_created
+from django.db.models import F
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITestCase
+
+from .async_views import section_executor
+from .benchmarks import dashboard_cold, run_concurrent_writes
+from .budgets import evaluate_budgets
+from .cache import get_dashboard_version
+from .dashboard import build_dashboard_summary
+from .export import EXPORT_COLUMNS, stream_csv, stream_ndjson
+from .fastpath import FastListMixin
+from .forecast import build_forecast
+from .fx import load_rates
+from .ingest import post_transactions
+from .jobs import JOB_HANDLERS, RETRY_DELAY_SECONDS, JobFailed, claim_jobs, enqueue, recover_stale_jobs, run_job
+from .ledger import balance_history
+from .metrics import install_query_recorder, record_query, registry
+from .models import (
+    Account, BalanceCheckpoint, Budget, BudgetAlert, Category, ExchangeRate, Job, RecurringRule, Transaction,
+    UserProfile
+)
+from .reconcile import reconcile_user_range
+from .recurring import materialize_due
+from .reports import GRANULARITIES, cashflow_report, period_start, report_periods
+from .utils import add_months
+
+
+def make_user(username='alice'):
+    return User.objects.create_user(username, password='secret')
+
+
+def make_ledger(user, categories=3, months=2, today=None):
+    """An account with `categories` expense categories (plus one income category) and, for each of the
+    last `months` months up to `today`, a salary and one expense per category"""
+    today = today or timezone.now().date()
+    account = Account.objects.create(user=user, name='Checking', account_type='checking', balance=Decimal('1000.00'))
+    salary = Category.objects.create(user=user, name='Salary', category_type='income')
+    expenses = [
+        Category.objects.create(user=user, name=f'Expense {index}', category_type='expense')
+        for index in range(categories)
+    ]
+    transactions = []
+    for month in range(months):
+        day = add_months(today.replace(day=1), -month)
+        transactions.append(Transaction(
+            user=user, account=account, category=salary, amount=Decimal('3000.00'),
+            transaction_type='income', description='Salary', date=day
+        ))
+        transactions.extend(
+            Transaction(
+                user=user, account=account, category=category, amount=Decimal('10.50') + index,
+                transaction_type='expense', description=f'Spend {index}', date=day
+            )
+            for index, category in enumerate(expenses)
+        )
+    post_transactions(transactions)
+    return account
+
+
+def make_budgets(user):
+    """A budget from the start of last month for every expense category that has none"""
+    start = add_months(timezone.now().date().replace(day=1), -1)
+    return [
+        Budget.objects.create(user=user, category=category, amount=Decimal('100.00'), start_date=start)
+        for category in Category.objects.filter(user=user, category_type='expense', budgets=None)
+    ]
+
+
+class DashboardQueryCountTests(TestCase):
+    """The dashboard costs the same number of queries however many categories and months there are"""
+    # balance, monthly totals and category spending (each rollups less later rows), recent transactions,
+    # currency context
+    DASHBOARD_QUERIES = 7
+    today = date(2024, 6, 15)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_query_count_is_constant(self):
+        small = make_user('small')
+        make_ledger(small, categories=2, months=1, today=self.today)
+        large = make_user('large')
+        make_ledger(large, categories=40, months=12, today=self.today)
+
+        with self.assertNumQueries(self.DASHBOARD_QUERIES):
+            build_dashboard_summary(small, self.today)
+        with self.assertNumQueries(self.DASHBOARD_QUERIES):
+            build_dashboard_summary(large, self.today)
+
+    def test_totals(self):
+        user = make_user()
+        make_ledger(user, categories=3, months=2, today=self.today)
+
+        summary = build_dashboard_summary(user, self.today)
+
+        spent = 10.5 + 11.5 + 12.5
+        self.assertEqual(summary['total_balance'], 1000 + 2 * (3000 - spent))
+        self.assertEqual(summary['month_income'], 3000)
+        self.assertEqual(summary['month_expenses'], spent)
+        self.assertEqual(len(summary['category_spending']), 3)
+        self.assertEqual(summary['chart_data']['income'], [0, 0, 0, 0, 0, 3000])
+        self.assertEqual(summary['chart_data']['expenses'], [0, 0, 0, 0, 0, spent])
+
+    def test_later_transactions_this_month_are_left_out(self):
+        user = make_user()
+        account = make_ledger(user, categories=1, months=1, today=self.today)
+        category = Category.objects.get(user=user, category_type='expense')
+        salary = Category.objects.get(user=user, category_type='income')
+        for day, category_, transaction_type in (
+            (self.today, category, 'expense'),
+            (self.today + timedelta(days=1), category, 'expense'),
+            (self.today + timedelta(days=1), salary, 'income'),
+            (date(2024, 7, 1), category, 'expense'),
+        ):
+            Transaction.objects.create(
+                user=user, account=account, category=category_, amount=Decimal('100.00'),
+                transaction_type=transaction_type, description='Later', date=day
+            )
+
+        summary = build_dashboard_summary(user, self.today)
+
+        self.assertEqual(summary['month_income'], 3000)
+        self.assertEqual(summary['month_expenses'], 10.5 + 100)
+        self.assertEqual([row['amount'] for row in summary['category_spending']], [Decimal('110.50')])
+
+
+class TransactionDeleteTests(TestCase):
+    """Queryset deletes reverse balances, rollups and budget counters the way Transaction.delete() does"""
+    today = date(2024, 6, 15)
+
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.account = make_ledger(self.user, categories=2, months=2, today=self.today)
+
+    def assertLedgerMatchesTransactions(self):
+        call_command('rebuild_rollups', '--verify', stdout=io.StringIO())
+        self.account.refresh_from_db()
+        net = sum(txn.signed_amount for txn in Transaction.objects.filter(account=self.account))
+        self.assertEqual(self.account.balance, Decimal('1000.00') + net)
+
+    def test_bulk_delete(self):
+        Transaction.objects.filter(user=self.user, transaction_type='expense').delete()
+
+        summary = build_dashboard_summary(self.user, self.today)
+        self.assertEqual(summary['month_expenses'], 0)
+        self.assertEqual(summary['total_balance'], 1000 + 2 * 3000)
+        self.assertLedgerMatchesTransactions()
+
+    def test_budget_created_after_bulk_delete(self):
+        category = Category.objects.filter(user=self.user, category_type='expense').first()
+        Transaction.objects.filter(user=self.user, category=category, date__gte=self.today.replace(day=1)).delete()
+
+        budget = Budget.objects.create(
+            user=self.user, category=category, amount=Decimal('100.00'), start_date=date(2024, 5, 1)
+        )
+        self.assertEqual(budget.spent_counter, Decimal('10.50'))
+        self.assertLedgerMatchesTransactions()
+
+    def test_admin_delete_selected(self):
+        User.objects.create_superuser('admin', password='secret')
+        self.client.login(username='admin', password='secret')
+        selected = Transaction.objects.filter(user=self.user, date__gte=self.today.replace(day=1))
+
+        response = self.client.post('/admin/financeapp/transaction/', {
+            'action': 'delete_selected', 'post': 'yes',
+            '_selected_action': list(selected.values_list('pk', flat=True)),
+        })
+
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(selected.exists())
+        self.assertEqual(build_dashboard_summary(self.user, self.today)['month_expenses'], 0)
+        self.assertLedgerMatchesTransactions()
+
+
+class ListQueryCountTests(APITestCase):
+    """List endpoints cost a fixed number of queries, independent of the number of rows"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.client.force_authenticate(self.user)
+
+    def assertConstantQueries(self, url, expected, budgets=False):
+        for categories, months in ((2, 1), (30, 6)):
+            make_ledger(self.user, categories=categories, months=months)
+            if budgets:
+                make_budgets(self.user)
+            # Measure uncached responses
+            cache.clear()
+            with self.assertNumQueries(expected):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_dashboard(self):
+        self.assertConstantQueries('/api/dashboard/summary/', DashboardQueryCountTests.DASHBOARD_QUERIES)
+
+    def test_transactions(self):
+        self.assertConstantQueries('/api/transactions/?page_size=500', 1)
+
+    def test_transactions_browsable_api(self):
+        # The serializer path (not the .values() fast path) must not query per row either
+        self.assertConstantQueries('/api/transactions/?page_size=500&format=api', 3)
+
+    def test_transaction_detail(self):
+        make_ledger(self.user)
+        transaction = Transaction.objects.filter(user=self.user).first()
+        # Account and category names come from the same query
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/transactions/{transaction.pk}/')
+        self.assertContains(response, transaction.category.name)
+
+    def test_accounts(self):
+        self.assertConstantQueries('/api/accounts/', 1)
+
+    def test_budgets(self):
+        # Budgets with their categories, then one grouped query for every budget's spending
+        self.assertConstantQueries('/api/budgets/', 2, budgets=True)
+
+    def test_budget_status(self):
+        self.assertConstantQueries('/api/budgets/status/', 2, budgets=True)
+
+    def test_categories(self):
+        self.assertConstantQueries('/api/categories/', 1)
+
+
+class DashboardCacheTests(APITestCase):
+    url = '/api/dashboard/summary/'
+
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.client.force_authenticate(self.user)
+        self.account = make_ledger(self.user, categories=2, months=1)
+
+    def test_unchanged_dashboard_is_not_modified(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        etag = first['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), first.json())
+
+    def test_write_changes_the_etag(self):
+        first = self.client.get(self.url)
+        category = Category.objects.filter(user=self.user, category_type='expense').first()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Transaction.objects.create(
+                user=self.user, account=self.account, category=category, amount=Decimal('5.00'),
+                transaction_type='expense', description='Coffee', date=timezone.now().date()
+            )
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+        self.assertEqual(response.json()['month_expenses'], first.json()['month_expenses'] + 5)
+
+    def test_etags_are_per_user(self):
+        etag = self.client.get(self.url)['ETag']
+        other = make_user('bob')
+        self.client.force_authenticate(other)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_cold_benchmark_only_drops_its_users_entries(self):
+        other = make_user('bob')
+        make_ledger(other, categories=1, months=1)
+        self.client.get(self.url)
+        self.client.force_authenticate(other)
+        self.client.get(self.url)
+
+        self.client.force_authenticate(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(dashboard_cold(self.client, self.user).status_code, 200)
+        self.assertGreater(len(queries), 0)
+
+        self.client.force_authenticate(other)
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+
+class DashboardErrorTests(TransactionTestCase):
+    """The sync and the async dashboard answer errors alike"""
+    # Transactional, so the async view's section threads see the fixture
+    URLS = ('/api/dashboard/summary/', '/api/dashboard/summary/async/')
+
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.client = APIClient()
+
+    def test_missing_credentials(self):
+        for url in self.URLS:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 401)
+                self.assertEqual(response['WWW-Authenticate'], 'Token')
+
+    def test_invalid_token(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token not-a-token')
+        for url in self.URLS:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 401)
+                self.assertEqual(response['WWW-Authenticate'], 'Token')
+                self.assertEqual(response.json(), {'detail': 'Invalid token.'})
+
+    def test_missing_exchange_rate(self):
+        account = make_ledger(self.user, categories=1, months=1)
+        account.currency = 'EUR'
+        account.save()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user).key}')
+        for url in self.URLS:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 503)
+                self.assertEqual(response.json(), {'detail': 'No exchange rate is loaded for EUR.'})
+
+
+class BalanceHistoryTests(APITestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client.force_authenticate(self.user)
+        self.today = timezone.now().date()
+        self.account = make_ledger(self.user, categories=1, months=2, today=self.today)
+        self.url = f'/api/accounts/{self.account.pk}/balance-history/'
+
+    def history(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return {row['date']: Decimal(row['balance']) for row in response.json()['history']}
+
+    def test_future_dates_run_on_from_the_current_month(self):
+        later = add_months(self.today, 14)
+        Transaction.objects.create(
+            user=self.user, account=self.account, category=Category.objects.filter(user=self.user).first(),
+            amount=Decimal('25.00'), transaction_type='expense', description='Later', date=later
+        )
+        self.account.refresh_from_db()
+
+        history = self.history(**{'from': add_months(self.today, 2).isoformat(),
+                                  'to': add_months(self.today, 24).isoformat(), 'interval': 'month'})
+
+        balances = list(history.values())
+        self.assertEqual(len(balances), 23)
+        # The later expense is already in the account balance
+        self.assertEqual(balances[0], self.account.balance + Decimal('25.00'))
+        self.assertEqual(balances[-1], self.account.balance)
+        self.assertFalse(BalanceCheckpoint.objects.filter(month__gt=self.today).exists())
+
+    def test_dates_out_of_range(self):
+        for params in ({'from': '3000-01-01', 'to': '3000-01-31'}, {'from': '9999-12-01', 'to': '9999-12-31'},
+                       {'from': '0001-01-01', 'to': '0001-01-31'}, {'to': '9999-12-31', 'interval': 'month'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.url, params).status_code, 400)
+        self.assertFalse(BalanceCheckpoint.objects.filter(month__gt=self.today).exists())
+
+
+class CashflowReportTests(APITestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client.force_authenticate(self.user)
+        make_ledger(self.user, categories=2, months=2, today=date(2024, 6, 15))
+
+    def test_totals_by_month(self):
+        response = self.client.get('/api/reports/cashflow/', {'from': '2024-05-01', 'to': '2024-06-30'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['periods'], ['2024-05-01', '2024-06-01'])
+        self.assertEqual(response.json()['income'], [3000, 3000])
+        self.assertEqual(response.json()['expenses'], [22, 22])
+
+    def test_periods_up_to_the_last_date(self):
+        for granularity in GRANULARITIES:
+            with self.subTest(granularity=granularity):
+                periods = report_periods(date(9999, 12, 1), date.max, granularity)
+                self.assertEqual(periods[-1], period_start(date.max, granularity))
+                report = cashflow_report(self.user, date(9999, 12, 1), date.max, granularity, 'category')
+                self.assertEqual(len(report['income']), len(periods))
+
+    def test_dates_out_of_range(self):
+        for granularity in ('month', 'year'):
+            with self.subTest(granularity=granularity):
+                response = self.client.get('/api/reports/cashflow/', {'to': '9999-12-31', 'granularity': granularity})
+                self.assertEqual(response.status_code, 400)
+
+
+def close_section_connections():
+    """Close the connection of every async dashboard section thread; each opens a new one on its next query"""
+    workers = settings.DASHBOARD_ASYNC_WORKERS
+    barrier = threading.Barrier(workers)
+
+    def close():
+        # Every call waits for the others, so each pool thread runs exactly one
+        barrier.wait()
+        connection.close()
+
+    for future in [section_executor.submit(close) for _ in range(workers)]:
+        future.result()
+
+
+@override_settings(METRICS_ENABLED=True)
+class MetricsTests(TransactionTestCase):
+    """Queries are counted under ASGI, where views and dashboard sections don't run on the request's thread"""
+
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+        # apps.py only installs the recorder when METRICS_ENABLED is set at startup
+        connection_created.connect(install_query_recorder, dispatch_uid='financeapp.metrics')
+        self.addCleanup(connection_created.disconnect, dispatch_uid='financeapp.metrics')
+        install_query_recorder(None, connection)
+        self.addCleanup(connection.execute_wrappers.remove, record_query)
+        # Dashboard section threads may hold connections opened without it (postgres keeps them for CONN_MAX_AGE)
+        close_section_connections()
+        self.addCleanup(close_section_connections)
+        user = make_user()
+        make_ledger(user)
+        self.client = AsyncClient()
+        self.headers = {'Authorization': f'Token {Token.objects.create(user=user).key}'}
+
+    def get(self, url):
+        response = async_to_sync(self.client.get)(url, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_sync_view(self):
+        self.get('/api/transactions/')
+        self.get('/api/transactions/')
+        self.assertEqual(registry.views['transaction-list'].queries, 4)
+        self.assertIn('desc="2 queries"', self.get('/api/transactions/')['Server-Timing'])
+
+    def test_async_dashboard_sections(self):
+        response = self.get('/api/dashboard/summary/async/')
+
+        queries = registry.views['dashboard-summary-async'].queries
+        # The token lookup and at least one query per dashboard query, whichever section thread ran it
+        self.assertGreaterEqual(queries, DashboardQueryCountTests.DASHBOARD_QUERIES + 1)
+        self.assertIn(f'desc="{queries} queries"', response['Server-Timing'])
+
+
+class CurrencyTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.client.force_authenticate(self.user)
+
+    def create_account(self, currency):
+        return self.client.post('/api/accounts/', {'name': 'Account', 'account_type': 'checking', 'currency': currency})
+
+    def test_account_currency_needs_rates(self):
+        self.assertEqual(self.create_account('usd').status_code, 201)
+        self.assertEqual(self.create_account('EUR').status_code, 400)
+        self.assertEqual(self.create_account('E1R').status_code, 400)
+
+        ExchangeRate.objects.create(currency='EUR', date=date(2024, 1, 1), rate=Decimal('1.1'))
+        response = self.create_account('eur')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['currency'], 'EUR')
+
+    def test_account_keeps_its_currency(self):
+        account = Account.objects.create(user=self.user, name='Old', account_type='checking', currency='GBP')
+        response = self.client.patch(f'/api/accounts/{account.pk}/', {'currency': 'GBP', 'name': 'Renamed'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_register_with_unsupported_currency(self):
+        self.client.force_authenticate(None)
+        data = {'username': 'bob', 'password': 'secret-password', 'preferred_currency': 'XYZ'}
+        self.assertEqual(self.client.post('/api/register/', data).status_code, 400)
+        data['preferred_currency'] = 'usd'
+        self.assertEqual(self.client.post('/api/register/', data).status_code, 201)
+
+    def test_preferred_currency_change_invalidates_dashboard(self):
+        profile = UserProfile.objects.create(user=self.user)
+        version = get_dashboard_version(self.user.pk)
+        profile.preferred_currency = 'EUR'
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+        self.assertNotEqual(get_dashboard_version(self.user.pk), version)
+
+    def test_loading_rates_invalidates_dashboards(self):
+        other = make_user('bob')
+        Account.objects.create(user=self.user, name='Euro', account_type='checking', currency='EUR')
+        versions = {user.pk: get_dashboard_version(user.pk) for user in (self.user, other)}
+
+        with self.captureOnCommitCallbacks(execute=True):
+            load_rates([ExchangeRate(currency='EUR', date=date(2024, 1, 1), rate=Decimal('1.1'))])
+
+        self.assertNotEqual(get_dashboard_version(self.user.pk), versions[self.user.pk])
+        self.assertEqual(get_dashboard_version(other.pk), versions[other.pk])
+
+
+class ForecastTests(TestCase):
+    today = date(2024, 6, 15)
+
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.account = Account.objects.create(
+            user=self.user, name='Checking', account_type='checking', balance=Decimal('1000.00')
+        )
+        self.salary = Category.objects.create(user=self.user, name='Salary', category_type='income')
+        self.leisure = Category.objects.create(user=self.user, name='Leisure', category_type='expense')
+
+    def post(self, *entries):
+        post_transactions([
+            Transaction(
+                user=self.user, account=self.account, category=category, amount=Decimal(amount),
+                transaction_type=category.category_type, description=description, date=day
+            )
+            for day, category, description, amount in entries
+        ])
+        self.account.refresh_from_db()
+
+    def post_monthly(self, months, day, category, description, amount):
+        self.post(*(
+            (add_months(self.today, -month).replace(day=day), category, description, amount) for month in months
+        ))
+
+    def test_detects_monthly_payments(self):
+        self.post_monthly(range(4), 1, self.salary, 'Salary', '3000.00')
+        self.post_monthly(range(1, 4), 20, self.leisure, 'Streaming', '15.00')
+        # Not monthly: twice in one month, only two months, or a different amount each time
+        self.post_monthly(range(1, 4), 3, self.leisure, 'Cinema', '12.00')
+        self.post((date(2024, 5, 25), self.leisure, 'Cinema', '12.00'))
+        self.post_monthly(range(1, 3), 8, self.leisure, 'Gym', '30.00')
+        for month, amount in ((1, '40.00'), (2, '41.00'), (3, '42.00')):
+            self.post_monthly([month], 10, self.leisure, 'Groceries', amount)
+
+        forecast = build_forecast(self.user, self.today, months=3)
+
+        self.assertEqual(
+            sorted((row['description'], row['amount'], row['due_this_month']) for row in forecast['recurring']),
+            [('Salary', Decimal('3000.00'), False), ('Streaming', Decimal('15.00'), True)]
+        )
+
+    def test_projects_detected_payments(self):
+        self.post_monthly(range(4), 1, self.salary, 'Salary', '3000.00')
+        self.post_monthly(range(1, 5), 20, self.leisure, 'Streaming', '15.00')
+
+        forecast = build_forecast(self.user, self.today, months=3)
+
+        balance = float(self.account.balance)
+        # Nothing else happened, so the trend is flat and only the detected payments move the balance
+        self.assertEqual(forecast['accounts'][0]['projected_balances'], [
+            balance - 15, balance - 15 + 2985, balance - 15 + 2 * 2985
+        ])
+        self.assertEqual(forecast['monthly_surplus'], [-15, 2985, 2985])
+
+
+class TransactionPaginationTests(APITestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client.force_authenticate(self.user)
+        make_ledger(self.user, categories=4, months=3)
+
+    def test_pages_cover_every_transaction_once(self):
+        seen = []
+        url = '/api/transactions/?page_size=4'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(row['id'] for row in response.json()['results'])
+            url = response.json()['next']
+        expected = Transaction.objects.filter(user=self.user).order_by('-date', '-id').values_list('id', flat=True)
+        self.assertEqual(seen, list(expected))
+
+    def test_malformed_cursors_are_not_found(self):
+        for position in ([[1], [2]], [{'a': 1}, 1], ['2024-01-01', 1], ['not a date', '1'], ['2024-01-01', 'x'],
+                         ['2024-01-01'], {'date': '2024-01-01'}, None):
+            cursor = base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+            with self.subTest(position=position):
+                response = self.client.get('/api/transactions/', {'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.get('/api/transactions/', {'cursor': '%%%'}).status_code, 404)
+
+
+class FastListTests(APITestCase):
+    """The .values() fast path renders the same bytes as the serializer and JSONRenderer"""
+
+    def setUp(self):
+        self.user = make_user()
+        self.client.force_authenticate(self.user)
+        account = Account.objects.create(user=self.user, name='Compte joint ☂', account_type='checking')
+        category = Category.objects.create(user=self.user, name='Café', category_type='expense')
+        Transaction.objects.create(
+            user=self.user, account=account, category=category, amount=Decimal('1234.05'),
+            transaction_type='expense', description='Crème brûlée 🍮 \u2028 "quoted" \\ slash', notes=None,
+            date=date(2024, 5, 3)
+        )
+        Transaction.objects.create(
+            user=self.user, account=account, category=category, amount=Decimal('0.10'),
+            transaction_type='expense', description='Tea', notes='', date=date(2024, 5, 4)
+        )
+
+    def get_both(self, url, **headers):
+        def regular_list(view, request, *args, **kwargs):
+            return super(FastListMixin, view).list(request, *args, **kwargs)
+
+        fast = self.client.get(url, headers=headers)
+        with mock.patch.object(FastListMixin, 'list', regular_list):
+            regular = self.client.get(url, headers=headers)
+        self.assertEqual(fast.status_code, 200)
+        self.assertEqual(regular.status_code, 200)
+        return fast, regular
+
+    def test_same_bytes_as_the_serializer(self):
+        for url in ('/api/transactions/', '/api/transactions/?page_size=1', '/api/accounts/', '/api/categories/'):
+            with self.subTest(url=url):
+                fast, regular = self.get_both(url)
+                self.assertEqual(fast.content, regular.content)
+                self.assertEqual(fast['Content-Type'], regular['Content-Type'])
+
+        rows = json.loads(self.get_both('/api/transactions/')[0].content)['results']
+        self.assertEqual([(row['amount'], row['notes']) for row in rows], [('0.10', ''), ('1234.05', None)])
+
+    def test_indented_json_is_left_to_the_renderer(self):
+        fast, regular = self.get_both('/api/transactions/', Accept='application/json; indent=2')
+        self.assertEqual(fast.content, regular.content)
+        self.assertIn(b'\n  "results": [', fast.content)
+
+
+class TransactionSearchTests(APITestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client.force_authenticate(self.user)
+        self.account = Account.objects.create(user=self.user, name='Checking', account_type='checking')
+        self.category = Category.objects.create(user=self.user, name='Food', category_type='expense')
+
+    def add(self, description, notes=''):
+        return Transaction.objects.create(
+            user=self.user, account=self.account, category=self.category, amount=Decimal('4.00'),
+            transaction_type='expense', description=description, notes=notes, date=date(2024, 5, 3)
+        )
+
+    def search(self, text, **params):
+        response = self.client.get('/api/transactions/', {'search': text, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_best_matches_come_first(self):
+        double = self.add('Coffee and coffee beans')
+        single = self.add('Bakery', notes='coffee')
+        self.add('Groceries')
+
+        self.assertEqual([row['id'] for row in self.search('coffee')['results']], [double.pk, single.pk])
+        # Words match as prefixes, and every word has to match
+        self.assertEqual([row['id'] for row in self.search('cof bean')['results']], [double.pk])
+        self.assertEqual(self.search('coffee tea')['results'], [])
+
+    def test_pages_follow_the_ranking(self):
+        for count in range(1, 8):
+            self.add(' '.join(['coffee'] * count), notes=f'cup {count}')
+        self.add('Groceries')
+
+        expected = [row['id'] for row in self.search('coffee', page_size=50)['results']]
+        self.assertEqual(len(expected), 7)
+        seen = []
+        page = self.search('coffee', page_size=2)
+        while True:
+            seen.extend(row['id'] for row in page['results'])
+            if not page['next']:
+                break
+            response = self.client.get(page['next'])
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+        self.assertEqual(seen, expected)
+
+    def test_index_follows_updates_and_deletes(self):
+        transaction = self.add('Coffee')
+
+        transaction.description = 'Tea'
+        transaction.save()
+        self.assertEqual(self.search('coffee')['results'], [])
+        self.assertEqual([row['id'] for row in self.search('tea')['results']], [transaction.pk])
+
+        Transaction.objects.filter(pk=transaction.pk).update(notes='Espresso')
+        self.assertEqual([row['id'] for row in self.search('espresso')['results']], [transaction.pk])
+
+        transaction.delete()
+        self.assertEqual(self.search('tea')['results'], [])
+        self.assertEqual(self.search('espresso')['results'], [])
+
+        self.add('Coffee')
+        Transaction.objects.filter(user=self.user).delete()
+        self.assertEqual(self.search('coffee')['results'], [])
+
+
+class ExportTests(APITestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client.force_authenticate(self.user)
+        self.account = Account.objects.create(user=self.user, name='Checking', account_type='checking')
+        self.food = Category.objects.create(user=self.user, name='Café', category_type='expense')
+        self.salary = Category.objects.create(user=self.user, name='Salary', category_type='income')
+        self.lunch = Transaction.objects.create(
+            user=self.user, account=self.account, category=self.food, amount=Decimal('12.50'),
+            transaction_type='expense', description='Lunch, "the usual"', notes='Crème brûlée\nand coffee',
+            payment_method='card', date=date(2024, 5, 3)
+        )
+        self.pay = Transaction.objects.create(
+            user=self.user, account=self.account, category=self.salary, amount=Decimal('3000.00'),
+            transaction_type='income', description='Pay', date=date(2024, 5, 1)
+        )
+        other = make_user('bob')
+        Transaction.objects.create(
+            user=other, account=Account.objects.create(user=other, name='Other', account_type='checking'),
+            category=Category.objects.create(user=other, name='Other', category_type='expense'),
+            amount=Decimal('1.00'), transaction_type='expense', description='Not mine', date=date(2024, 5, 2)
+        )
+
+    def export(self, **params):
+        response = self.client.get('/api/transactions/export/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_csv_holds_the_users_transactions_in_list_order(self):
+        response, body = self.export()
+
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="transactions.csv"')
+        self.assertEqual(list(csv.reader(io.StringIO(body))), [
+            list(EXPORT_COLUMNS),
+            [str(self.lunch.pk), '2024-05-03', 'Checking', 'Café', 'expense', '12.50', 'card',
+             'Lunch, "the usual"', 'Crème brûlée\nand coffee'],
+            [str(self.pay.pk), '2024-05-01', 'Checking', 'Salary', 'income', '3000.00', 'cash', 'Pay', ''],
+        ])
+
+    def test_ndjson_rows_follow_the_list_filters(self):
+        response, body = self.export(format='ndjson', type='expense')
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual([json.loads(line) for line in body.splitlines()], [{
+            'id': self.lunch.pk, 'date': '2024-05-03', 'account': 'Checking', 'category': 'Café',
+            'transaction_type': 'expense', 'amount': '12.50', 'payment_method': 'card',
+            'description': 'Lunch, "the usual"', 'notes': 'Crème brûlée\nand coffee',
+        }])
+
+    def test_unknown_format_is_rejected(self):
+        response = self.client.get('/api/transactions/export/', {'format': 'xlsx'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_writers_stream_one_piece_per_chunk(self):
+        rows = [(index, date(2024, 5, 1), 'Checking', 'Food', 'expense', Decimal('1.00'), 'cash', f'Row {index}', None)
+                for index in range(5)]
+
+        pieces = list(stream_csv(iter(rows), chunk_size=2))
+        self.assertEqual(len(pieces), 3)
+        self.assertEqual(len(list(csv.reader(io.StringIO(''.join(pieces))))), 6)
+
+        pieces = list(stream_ndjson(iter(rows), chunk_size=2))
+        self.assertEqual([piece.count('\n') for piece in pieces], [2, 2, 1])
+        self.assertEqual(json.loads(pieces[-1])['description'], 'Row 4')
+
+
+class BulkTransactionTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.client.force_authenticate(self.user)
+        self.checking = Account.objects.create(user=self.user, name='Checking', account_type='checking')
+        self.savings = Account.objects.create(user=self.user, name='Savings', account_type='savings')
+        self.food = Category.objects.create(user=self.user, name='Food', category_type='expense')
+        self.salary = Category.objects.create(user=self.user, name='Salary', category_type='income')
+
+    def row(self, **fields):
+        return {
+            'account': self.checking.pk, 'category': self.food.pk, 'amount': '12.50',
+            'transaction_type': 'expense', 'description': 'Groceries', 'date': '2024-05-03', **fields
+        }
+
+    def post(self, rows):
+        return self.client.post('/api/transactions/bulk/', rows, format='json')
+
+    def test_creates_rows_and_applies_their_effects(self):
+        budget = Budget.objects.create(
+            user=self.user, category=self.food, amount=Decimal('100.00'), start_date=date(2024, 5, 1)
+        )
+        rows = [
+            self.row(),
+            self.row(amount=7, date='2024-06-30', payment_method='debit', notes='Market'),
+            self.row(account=self.savings.pk, category=self.salary.pk, amount='3000.00',
+                     transaction_type='income', description='Salary', date='2024-04-30'),
+        ]
+
+        response = self.post({'transactions': rows})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {'created': 3, 'errors': []})
+        self.checking.refresh_from_db()
+        self.savings.refresh_from_db()
+        self.assertEqual(self.checking.balance, Decimal('-19.50'))
+        self.assertEqual(self.savings.balance, Decimal('3000.00'))
+        created = Transaction.objects.get(notes='Market')
+        self.assertEqual((created.amount, created.payment_method), (Decimal('7.00'), 'debit'))
+        self.assertEqual(Transaction.objects.get(amount=Decimal('12.50')).payment_method, 'cash')
+        budget.refresh_from_db()
+        self.assertEqual(budget.spent_counter, Decimal('19.50'))
+        call_command('rebuild_rollups', '--verify', stdout=io.StringIO())
+
+    def test_reports_errors_per_row_and_writes_nothing(self):
+        stranger = make_user('mallory')
+        their_account = Account.objects.create(user=stranger, name='Theirs', account_type='checking')
+        rows = [
+            self.row(),
+            self.row(amount='NaN'),
+            self.row(amount='1.005', date='2024-02-30'),
+            {'account': self.checking.pk},
+            self.row(account=their_account.pk, transaction_type='transfer'),
+            self.row(description='  '),
+            'not a row',
+        ]
+
+        response = self.post(rows)
+
+        self.assertEqual(response.status_code, 400)
+        errors = {entry['row']: entry['errors'] for entry in response.json()['errors']}
+        self.assertEqual(sorted(errors), [1, 2, 3, 4, 5, 6])
+        self.assertEqual(list(errors[1]), ['amount'])
+        self.assertEqual(sorted(errors[2]), ['amount', 'date'])
+        self.assertEqual(
+            sorted(errors[3]), ['amount', 'category', 'date', 'description', 'transaction_type']
+        )
+        self.assertEqual(list(errors[4]), ['transaction_type'])
+        self.assertEqual(list(errors[5]), ['description'])
+        self.assertEqual(list(errors[6]), ['non_field_errors'])
+        self.assertFalse(Transaction.objects.exists())
+
+        response = self.post([self.row(), self.row(account=their_account.pk)])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], [{'row': 1, 'errors': {'account': ['Invalid account.']}}])
+        self.assertFalse(Transaction.objects.exists())
+        self.checking.refresh_from_db()
+        self.assertEqual(self.checking.balance, 0)
+        self.assertFalse(self.user.monthly_rollups.exists())
+
+    def test_expects_a_list(self):
+        response = self.post({'transactions': self.row()})
+        self.assertEqual(response.status_code, 400)
+
+
+class StatementImportTests(APITestCase):
+    STATEMENT = (
+        'Date,Description,Amount,Category\n'
+        '2024-05-01,Salary,"3,000.00",Salary\n'
+        '05/03/2024,Groceries,-42.10,Food\n'
+        '2024-05-04,Coffee,-3.50,\n'
+    )
+
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.client.force_authenticate(self.user)
+        self.account = Account.objects.create(user=self.user, name='Checking', account_type='checking')
+        self.food = Category.objects.create(user=self.user, name='Food', category_type='expense')
+        Category.objects.create(user=self.user, name='Salary', category_type='income')
+
+    def upload(self, content, name='statement.csv'):
+        return self.client.post('/api/transactions/import/', {
+            'file': SimpleUploadedFile(name, content.encode()),
+            'account': self.account.pk,
+            'default_category': self.food.pk,
+        }, format='multipart')
+
+    def test_imports_rows(self):
+        response = self.upload(self.STATEMENT)
+
+        self.assertEqual(response.status_code, 201)
+        stats = response.json()
+        self.assertEqual((stats['rows_read'], stats['imported'], stats['failed']), (3, 3, 0))
+        self.assertEqual(
+            list(Transaction.objects.order_by('date').values_list('description', 'amount', 'transaction_type')),
+            [('Salary', Decimal('3000.00'), 'income'), ('Groceries', Decimal('42.10'), 'expense'),
+             ('Coffee', Decimal('3.50'), 'expense')]
+        )
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('2954.40'))
+        call_command('rebuild_rollups', '--verify', stdout=io.StringIO())
+
+    def test_ofx(self):
+        statement = (
+            '<OFX><BANKTRANLIST>'
+            '<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20240503120000<TRNAMT>-42.10<NAME>Groceries</STMTTRN>'
+            '<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20240504<TRNAMT>-3.50<NAME>Coffee<MEMO>Oat milk</STMTTRN>'
+            '</BANKTRANLIST></OFX>'
+        )
+
+        response = self.upload(statement, name='statement.ofx')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['imported'], 2)
+        self.assertEqual(Transaction.objects.get(description='Coffee').notes, 'Oat milk')
+
+    def test_reimport_skips_duplicates(self):
+        self.upload(self.STATEMENT)
+
+        response = self.upload(self.STATEMENT)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.json()['imported'], response.json()['duplicates']), (0, 3))
+        self.assertEqual(Transaction.objects.count(), 3)
+
+    def test_malformed_rows_are_reported(self):
+        statement = (
+            'Date,Description,Amount,Category\n'
+            '2024-05-02,Lunch,-12.00,Food\n'
+            'yesterday,Bad date,-1.00,Food\n'
+            '2024-05-02,Bad amount,twelve,Food\n'
+            '2024-05-02,Not a number,NaN,Food\n'
+            '2024-05-02,Too much,-Infinity,Food\n'
+            '2024-05-02,Unknown category,-1.00,Travel\n'
+            '2024-05-02,Too precise,-1.005,Food\n'
+        )
+
+        response = self.upload(statement)
+
+        self.assertEqual(response.status_code, 201)
+        stats = response.json()
+        self.assertEqual((stats['imported'], stats['failed']), (1, 6))
+        self.assertEqual([error['row'] for error in stats['errors']], [1, 2, 3, 4, 5, 6])
+        self.assertEqual(stats['errors'][3]['errors'], {'non_field_errors': ["Invalid amount: '-Infinity'"]})
+        self.assertEqual(list(stats['errors'][5]['errors']), ['amount'])
+        self.assertEqual(list(Transaction.objects.values_list('description', flat=True)), ['Lunch'])
+
+    def test_unreadable_csv(self):
+        response = self.upload('Date,Description,Amount\n2024-05-02,"' + 'x' * 200000 + '",-1.00\n')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Malformed CSV', response.json()['detail'])
+        self.assertFalse(Transaction.objects.exists())
+
+
+class BudgetSpentTests(TestCase):
+    """Spent amounts agree whether annotated, evaluated in bulk or computed per budget, and are memoized"""
+
+    def setUp(self):
+        self.user = make_user()
+        account = Account.objects.create(user=self.user, name='Checking', account_type='checking')
+        self.food = Category.objects.create(user=self.user, name='Food', category_type='expense')
+        rent = Category.objects.create(user=self.user, name='Rent', category_type='expense')
+        for day, category, amount, transaction_type in (
+            (date(2024, 4, 30), self.food, '1.00', 'expense'),
+            (date(2024, 5, 1), self.food, '10.00', 'expense'),
+            (date(2024, 5, 31), self.food, '20.00', 'expense'),
+            (date(2024, 5, 31), self.food, '99.00', 'income'),
+            (date(2024, 5, 15), rent, '700.00', 'expense'),
+            (date(2024, 6, 1), self.food, '40.00', 'expense'),
+        ):
+            Transaction.objects.create(
+                user=self.user, account=account, category=category, amount=Decimal(amount),
+                transaction_type=transaction_type, description='Test', date=day
+            )
+        self.may = Budget.objects.create(
+            user=self.user, category=self.food, amount=Decimal('50.00'),
+            start_date=date(2024, 5, 1), end_date=date(2024, 5, 31)
+        )
+        self.open_ended = Budget.objects.create(
+            user=self.user, category=self.food, amount=Decimal('50.00'), start_date=date(2024, 5, 1)
+        )
+        self.expected = {self.may.pk: Decimal('30.00'), self.open_ended.pk: Decimal('70.00')}
+
+    def test_annotated_spent_amount(self):
+        budgets = Budget.objects.filter(user=self.user).with_spent_amount()
+        with self.assertNumQueries(1):
+            self.assertEqual({budget.pk: budget.get_spent_amount() for budget in budgets}, self.expected)
+
+    def test_evaluated_spent_amount(self):
+        budgets = evaluate_budgets(self.user, Budget.objects.filter(user=self.user))
+        with self.assertNumQueries(0):
+            self.assertEqual({budget.pk: budget.get_spent_amount() for budget in budgets}, self.expected)
+
+    def test_spent_amount_is_memoized(self):
+        budget = Budget.objects.get(pk=self.may.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(budget.get_spent_amount(), Decimal('30.00'))
+            self.assertEqual(budget.get_remaining(), Decimal('20.00'))
+
+    def test_save_recomputes_spent_amount(self):
+        budget = Budget.objects.get(pk=self.may.pk)
+        budget.get_spent_amount()
+        budget.start_date = date(2024, 4, 1)
+        budget.save()
+
+        self.assertEqual(budget.get_spent_amount(), Decimal('31.00'))
+        self.assertEqual(budget.spent_counter, Decimal('31.00'))
+
+
+class BudgetAlertTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.account = Account.objects.create(user=self.user, name='Checking', account_type='checking')
+        self.category = Category.objects.create(user=self.user, name='Food', category_type='expense')
+        self.budget = Budget.objects.create(
+            user=self.user, category=self.category, amount=Decimal('100.00'), start_date=date(2024, 6, 1)
+        )
+
+    def spend(self, amount):
+        Transaction.objects.create(
+            user=self.user, account=self.account, category=self.category, amount=Decimal(amount),
+            transaction_type='expense', description='Test', date=date(2024, 6, 10)
+        )
+
+    def thresholds(self):
+        return list(BudgetAlert.objects.filter(budget=self.budget).order_by('id').values_list('threshold', flat=True))
+
+    def test_spending_crosses_thresholds_once(self):
+        self.spend('79.00')
+        self.assertEqual(self.thresholds(), [])
+        self.spend('1.00')
+        self.assertEqual(self.thresholds(), [80])
+        self.spend('30.00')
+        self.spend('5.00')
+        self.assertEqual(self.thresholds(), [80, 100])
+
+    def test_lowering_the_amount_below_spending(self):
+        self.spend('60.00')
+        self.budget.amount = Decimal('50.00')
+        self.budget.save()
+
+        alert = BudgetAlert.objects.get(budget=self.budget, threshold=100)
+        self.assertEqual((alert.spent_amount, alert.budget_amount), (Decimal('60.00'), Decimal('50.00')))
+        self.assertEqual(self.thresholds(), [80, 100])
+
+        # Saving again without crossing anything records nothing new
+        self.budget.save()
+        self.budget.amount = Decimal('55.00')
+        self.budget.save()
+        self.assertEqual(self.thresholds(), [80, 100])
+
+    def test_raising_the_amount(self):
+        self.spend('70.00')
+        self.budget.amount = Decimal('200.00')
+        self.budget.save()
+        self.assertEqual(self.thresholds(), [])
+
+    def test_new_budget_already_over(self):
+        self.spend('90.00')
+        budget = Budget.objects.create(
+            user=self.user, category=self.category, amount=Decimal('100.00'), start_date=date(2024, 6, 1)
+        )
+        self.assertEqual(list(budget.alerts.values_list('threshold', flat=True)), [80])
+
+
+class RecurringTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.account = Account.objects.create(
+            user=self.user, name='Checking', account_type='checking', balance=Decimal('100.00')
+        )
+        self.rent = Category.objects.create(user=self.user, name='Rent', category_type='expense')
+        self.salary = Category.objects.create(user=self.user, name='Salary', category_type='income')
+        self.rules = [
+            RecurringRule.objects.create(
+                user=self.user, account=self.account, category=self.rent, amount=Decimal('50.00'),
+                transaction_type='expense', description='Rent', frequency='monthly', start_date=date(2024, 1, 31)
+            ),
+            RecurringRule.objects.create(
+                user=self.user, account=self.account, category=self.salary, amount=Decimal('20.00'),
+                transaction_type='income', description='Allowance', frequency='weekly', interval=2,
+                start_date=date(2024, 1, 1), end_date=date(2024, 2, 1)
+            ),
+        ]
+
+    def materialize(self, today, chunk_size=1):
+        return [sum(counts) for counts in zip(*materialize_due(today, chunk_size))] or [0, 0]
+
+    def test_posts_due_occurrences_once(self):
+        self.assertEqual(self.materialize(date(2024, 3, 31)), [2, 6])
+
+        self.assertEqual(
+            list(Transaction.objects.filter(category=self.rent).order_by('date').values_list('date', flat=True)),
+            [date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31)]
+        )
+        self.assertEqual(Transaction.objects.filter(category=self.salary).count(), 3)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('100.00') - 3 * 50 + 3 * 20)
+
+        # Nothing is due any more, and an already posted occurrence is never posted twice
+        self.assertEqual(self.materialize(date(2024, 3, 31)), [0, 0])
+        RecurringRule.objects.filter(pk=self.rules[0].pk).update(next_date=date(2024, 2, 29), occurrences=1)
+        self.assertEqual(self.materialize(date(2024, 3, 31)), [1, 0])
+        self.assertEqual(Transaction.objects.count(), 6)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('10.00'))
+
+        with self.assertRaises(IntegrityError):
+            self.rules[0].build_transaction(date(2024, 2, 29)).save()
+
+    @unittest.skipIf(connection.features.has_select_for_update_skip_locked, 'Workers skip locked rules instead')
+    def test_chunk_taken_by_another_worker_is_skipped(self):
+        posted = []
+
+        def post_or_conflict(transactions):
+            # The first chunk loses to a worker that got there first
+            if not posted:
+                posted.append(None)
+                raise IntegrityError('UNIQUE constraint failed')
+            post_transactions(transactions)
+
+        with mock.patch('financeapp.recurring.post_transactions', post_or_conflict):
+            self.assertEqual(self.materialize(date(2024, 3, 31)), [1, 3])
+
+        self.assertFalse(Transaction.objects.filter(category=self.rent).exists())
+        self.assertEqual(Transaction.objects.filter(category=self.salary).count(), 3)
+        self.assertEqual(RecurringRule.objects.get(pk=self.rules[0].pk).occurrences, 0)
+
+    def test_command_rejects_impossible_dates(self):
+        with self.assertRaisesMessage(CommandError, '--date'):
+            call_command('materialize_recurring', date='2024-02-30', stdout=io.StringIO())
+        call_command('materialize_recurring', date='2024-02-29', stdout=io.StringIO())
+        self.assertEqual(Transaction.objects.count(), 5)
+
+
+class ReconcileTests(TestCase):
+    def test_report_lists_a_sample_of_mismatches(self):
+        user = make_user()
+        for index in range(5):
+            account = make_ledger(user, categories=1, months=1)
+            # Drift the stored balance without going through Transaction.save()
+            Account.objects.filter(pk=account.pk).update(balance=F('balance') + index)
+
+        checked, mismatched, lines = reconcile_user_range((user.pk, user.pk + 1), chunk_size=2, sample_size=3)
+
+        self.assertEqual((checked, mismatched, len(lines)), (5, 4, 3))
+        self.assertEqual(reconcile_user_range((user.pk, user.pk + 1), fix=True)[1], 4)
+        self.assertEqual(reconcile_user_range((user.pk, user.pk + 1))[1:], (0, []))
+
+
+def run_in_threads(function, count):
+    """Call `function(index)` from `count` threads at once, each with its own connection; re-raises their errors"""
+    def call(index):
+        try:
+            return function(index)
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(count) as pool:
+        return list(pool.map(call, range(count)))
+
+
+class BalanceTests(TransactionTestCase):
+    """Account balances stay equal to the opening balance plus the net of their transactions"""
+    WRITERS = 4
+    WRITES = 20
+
+    def setUp(self):
+        self.user = make_user()
+        self.account = Account.objects.create(
+            user=self.user, name='Checking', account_type='checking', balance=Decimal('100.00')
+        )
+        self.category = Category.objects.create(user=self.user, name='Food', category_type='expense')
+
+    def create(self, amount, transaction_type='expense', account=None):
+        return Transaction.objects.create(
+            user=self.user, account=account or self.account, category=self.category, amount=Decimal(amount),
+            transaction_type=transaction_type, description='Test', date=date(2024, 6, 1)
+        )
+
+    def assertBalanceMatchesTransactions(self, account):
+        account.refresh_from_db()
+        net = sum(transaction.signed_amount for transaction in Transaction.objects.filter(account=account))
+        self.assertEqual(account.balance, account.opening_balance + net)
+
+    def test_parallel_writers(self):
+        def write(index):
+            for number in range(self.WRITES):
+                transaction = self.create(f'{index + 1}.{number:02}', ('income', 'expense')[number % 2])
+                if number % 3 == 0:
+                    transaction.amount += 1
+                    transaction.save()
+                if number % 5 == 0:
+                    transaction.delete()
+
+        run_in_threads(write, self.WRITERS)
+
+        self.assertEqual(Transaction.objects.count(), self.WRITERS * (self.WRITES - self.WRITES // 5))
+        self.assertBalanceMatchesTransactions(self.account)
+
+    def test_move_between_accounts(self):
+        savings = Account.objects.create(
+            user=self.user, name='Savings', account_type='savings', balance=Decimal('500.00')
+        )
+        transaction = self.create('30.00')
+
+        transaction.account = savings
+        transaction.amount = Decimal('40.00')
+        transaction.save()
+
+        self.account.refresh_from_db()
+        savings.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('100.00'))
+        self.assertEqual(savings.balance, Decimal('460.00'))
+        self.assertBalanceMatchesTransactions(savings)
+
+    def test_parallel_moves(self):
+        savings = Account.objects.create(
+            user=self.user, name='Savings', account_type='savings', balance=Decimal('500.00')
+        )
+        transactions = [self.create('1.00') for _ in range(self.WRITERS * self.WRITES)]
+
+        def move(index):
+            for transaction in transactions[index::self.WRITERS]:
+                transaction.account = savings
+                transaction.save()
+
+        run_in_threads(move, self.WRITERS)
+
+        self.account.refresh_from_db()
+        savings.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('100.00'))
+        self.assertEqual(savings.balance, Decimal('500.00') - len(transactions))
+
+
+    def test_checkpoints_under_backdated_writes(self):
+        """Balance histories built while backdated writes commit never keep a checkpoint that misses one"""
+        self.create('1.00')
+
+        def work(index):
+            for number in range(self.WRITES):
+                if index % 2:
+                    balance_history(self.account, date(2023, 1, 1), date(2024, 6, 30), 'month')
+                else:
+                    Transaction.objects.create(
+                        user=self.user, account=self.account, category=self.category, amount=Decimal('2.00'),
+                        transaction_type='expense', description='Backdated', date=date(2023, number % 12 + 1, 1)
+                    )
+
+        run_in_threads(work, self.WRITERS)
+
+        balance_history(self.account, date(2023, 1, 1), date(2024, 6, 30), 'month')
+        checkpoints = BalanceCheckpoint.objects.filter(account=self.account)
+        self.assertTrue(checkpoints.exists())
+        for checkpoint in checkpoints:
+            earlier = Transaction.objects.filter(account=self.account, date__lt=checkpoint.month)
+            self.assertEqual(checkpoint.net_before, sum(transaction.signed_amount for transaction in earlier))
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Parallel writers on the postgres profile')
+class PostgresWriteTests(TransactionTestCase):
+    """Writers on separate connections never wait on a lock error or lose a balance update"""
+
+    def test_parallel_writers(self):
+        result = run_concurrent_writes(writers=8, writes_per_writer=50)
+
+        self.assertEqual(result['failed'], 0)
+        self.assertEqual(result['writes'], 8 * 50)
+        self.assertTrue(result['balances_consistent'])
+
+
+class JobTests(TransactionTestCase):
+    """Each queued job runs on one worker at a time and moves through retries to a final status"""
+    WORKERS = 8
+
+    def claim_all(self, limit=3):
+        """Every worker claims jobs until none are left; returns worker -> claimed ids"""
+        def work(index):
+            claimed = []
+            while ids := claim_jobs(f'worker-{index}', limit):
+                claimed.extend(ids)
+            return f'worker-{index}', claimed
+        return dict(run_in_threads(work, self.WORKERS))
+
+    def test_each_job_is_claimed_once(self):
+        # The conditional UPDATE is what SQLite uses; Postgres also claims under SKIP LOCKED
+        for skip_locked in {False, connection.features.has_select_for_update_skip_locked}:
+            with self.subTest(skip_locked=skip_locked), mock.patch.object(
+                type(connection.features), 'has_select_for_update_skip_locked', skip_locked
+            ):
+                Job.objects.all().delete()
+                jobs = [enqueue('cashflow_report').pk for _ in range(40)]
+
+                claimed = self.claim_all()
+
+                self.assertEqual(sorted(job_id for ids in claimed.values() for job_id in ids), jobs)
+                for job in Job.objects.all():
+                    self.assertEqual(job.status, Job.RUNNING)
+                    self.assertEqual(job.attempts, 1)
+                    self.assertIn(job.pk, claimed[job.worker])
+
+    def run_claimed(self, job):
+        # Due, and ahead of any other queued job
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now() - timedelta(days=1))
+        self.assertEqual(claim_jobs('worker', 1), [job.pk])
+        return run_job(job.pk, 'worker')
+
+    def test_failures_are_retried_with_backoff_then_failed(self):
+        handler = mock.Mock(side_effect=RuntimeError('flaky'))
+        job = enqueue('flaky')
+
+        with mock.patch.dict(JOB_HANDLERS, {'flaky': handler}), self.assertLogs('financeapp.jobs', 'ERROR'):
+            for attempt in (1, 2):
+                before = timezone.now()
+                self.assertEqual(self.run_claimed(job), Job.QUEUED)
+                job.refresh_from_db()
+                self.assertEqual((job.status, job.attempts, job.worker), (Job.QUEUED, attempt, ''))
+                delay = timedelta(seconds=RETRY_DELAY_SECONDS * 2 ** (attempt - 1))
+                self.assertGreaterEqual(job.run_after, before + delay)
+                # Not due again until the delay is over
+                self.assertEqual(claim_jobs('worker', 1), [])
+
+            self.assertEqual(self.run_claimed(job), Job.FAILED)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.error), (Job.FAILED, 3, 'The job failed unexpectedly.'))
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(handler.call_count, 3)
+
+    def test_job_failed_and_success_are_final(self):
+        def handler(job):
+            if job.params.get('bad'):
+                raise JobFailed('Malformed upload', result={'imported': 2})
+            return {'rows': 5}
+
+        failing, succeeding = enqueue('check', params={'bad': True}), enqueue('check')
+        with mock.patch.dict(JOB_HANDLERS, {'check': handler}):
+            self.assertEqual(self.run_claimed(failing), Job.FAILED)
+            self.assertEqual(self.run_claimed(succeeding), Job.SUCCEEDED)
+
+        failing.refresh_from_db()
+        self.assertEqual((failing.attempts, failing.error, failing.result), (1, 'Malformed upload', {'imported': 2}))
+        succeeding.refresh_from_db()
+        self.assertEqual((succeeding.result, succeeding.error), ({'rows': 5}, ''))
+
+    def test_worker_that_lost_its_lease_records_nothing(self):
+        def handler(job):
+            # Meanwhile the worker looked dead and the job was handed back to the queue
+            Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+            self.assertEqual(recover_stale_jobs(lease=60), 1)
+            return {'rows': 5}
+
+        job = enqueue('check')
+        with mock.patch.dict(JOB_HANDLERS, {'check': handler}):
+            self.assertIsNone(self.run_claimed(job))
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker, job.result), (Job.QUEUED, '', None))
+
+
+class QueryPlanTests(APITestCase):
+    """No query of the hot endpoints falls back to a full table scan
+
+    Runs against the configured database profile, e.g. with DATABASE_BACKEND=postgres.
+    """
+    ENDPOINTS = [
+        '/api/transactions/',
+        '/api/transactions/?type=expense',
+        '/api/transactions/?date_range=month',
+        '/api/transactions/?account={account}',
+        '/api/transactions/?category={category}&type=expense&date_range=year',
+        '/api/dashboard/summary/',
+        '/api/budgets/',
+        '/api/reports/cashflow/?granularity=day',
+        '/api/reports/cashflow/?granularity=week&group_by=category',
+        '/api/reports/cashflow/?group_by=payment_method',
+    ]
+    FULL_SCAN_PATTERNS = {
+        # "SCAN t" without an index is a full table scan; "SCAN t USING INDEX" walks a whole index
+        'sqlite': re.compile(r'\bSCAN (?!CONSTANT ROW)(\w+)\b(?! USING INTEGER PRIMARY KEY)'),
+        'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    }
+
+    def setUp(self):
+        if connection.vendor not in self.FULL_SCAN_PATTERNS:
+            self.skipTest(f'No query plan check for {connection.vendor}')
+        if connection.vendor == 'postgresql':
+            # The fixture is tiny, so make the planner prefer any usable index
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        cache.clear()
+        self.user = make_user()
+        self.client.force_authenticate(self.user)
+        self.account = make_ledger(self.user, categories=1, months=1)
+        make_budgets(self.user)
+
+    @staticmethod
+    def explain(sql):
+        prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql)
+            return ' | '.join(str(row[-1]) for row in cursor.fetchall())
+
+    def test_hot_queries_use_indexes(self):
+        category = Category.objects.get(user=self.user, category_type='expense')
+        for template in self.ENDPOINTS:
+            endpoint = template.format(account=self.account.pk, category=category.pk)
+            with self.subTest(endpoint=endpoint):
+                with CaptureQueriesContext(connection) as queries:
+                    self.assertEqual(self.client.get(endpoint).status_code, 200)
+                for query in queries.captured_queries:
+                    if query['sql'].lstrip().upper().startswith('SELECT'):
+                        plan = self.explain(query['sql'])
+                        full_scan = self.FULL_SCAN_PATTERNS[connection.vendor].search(plan)
+                        self.assertIsNone(full_scan, f"{query['sql']}\n{plan}")
@@ -1,8 +1,9 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from .async_views import dashboard_summary_async
 from .views import (
     RegisterView, UserProfileView, AccountViewSet, CategoryViewSet,
-    TransactionViewSet, BudgetViewSet, GoalViewSet, dashboard_summary
+    TransactionViewSet, RecurringRuleViewSet, BudgetViewSet, GoalViewSet, JobViewSet, cashflow, dashboard_summary, forecast, metrics
 )
 
 # Set up the router
@@ -10,8 +11,10 @@ router = DefaultRouter()
 router.register(r'accounts', AccountViewSet, basename='account')
 router.register(r'categories', CategoryViewSet, basename='category')
 router.register(r'transactions', TransactionViewSet, basename='transaction')
+router.register(r'recurring-rules', RecurringRuleViewSet, basename='recurring-rule')
 router.register(r'budgets', BudgetViewSet, basename='budget')
 router.register(r'goals', GoalViewSet, basename='goal')
+router.register(r'jobs', JobViewSet, basename='job')
 
 urlpatterns = [
     # Authentication endpoints
@@ -20,6 +23,14 @@ urlpatterns = [
 
     # Dashboard data
     path('dashboard/summary/', dashboard_summary, name='dashboard-summary'),
+    path('dashboard/summary/async/', dashboard_summary_async, name='dashboard-summary-async'),
+
+    # Reports
+    path('reports/cashflow/', cashflow, name='reports-cashflow'),
+    path('reports/forecast/', forecast, name='reports-forecast'),
+
+    # Instrumentation (filled in when METRICS_ENABLED is set)
+    path('_metrics/', metrics, name='metrics'),
 
     # Include the router URLs
     path('', include(router.urls)),
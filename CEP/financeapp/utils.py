@@ -0,0 +1,65 @@
+from calendar import monthrange
+from datetime import date
+from decimal import Decimal
+from itertools import islice
+
+# SQLite sums decimals as floats; results are quantized back to cents
+CENT = Decimal('0.01')
+
+
+def add_months(day, months):
+    """Return the first day of the month `months` away from `day`"""
+    month_index = day.year * 12 + day.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def end_of_month(day):
+    """Return the last day of the month containing `day`"""
+    return day.replace(day=monthrange(day.year, day.month)[1])
+
+
+def split_full_months(start_date, end_date=None):
+    """Split a date window into the whole months it covers and the partial edges
+
+    Returns ``(first_month, last_month, edges)`` where the whole months run from
+    ``first_month`` to ``last_month`` inclusive (either may be None; a None
+    ``last_month`` means open-ended) and ``edges`` is a list of ``(start, end)``
+    date ranges that only partially cover a month.
+    """
+    if end_date is not None and end_date < start_date:
+        return None, None, []
+
+    first_month = start_date if start_date.day == 1 else add_months(start_date, 1)
+    edges = []
+
+    if first_month != start_date:
+        edge_end = end_of_month(start_date)
+        if end_date is not None and end_date < edge_end:
+            return None, None, [(start_date, end_date)]
+        edges.append((start_date, edge_end))
+
+    if end_date is None:
+        return first_month, None, edges
+
+    if end_date == end_of_month(end_date):
+        last_month = end_date.replace(day=1)
+    else:
+        last_month = add_months(end_date, -1)
+        edges.append((end_date.replace(day=1), end_date))
+
+    if last_month < first_month:
+        return None, None, edges
+    return first_month, last_month, edges
+
+
+def split_user_ranges(first, last, workers):
+    """Split the user ids ``first..last`` into `workers` contiguous ``[start, end)`` ranges"""
+    step = -(-(last - first + 1) // workers)
+    return [(start, min(start + step, last + 1)) for start in range(first, last + 1, step)]
+
+
+def chunked(rows, size):
+    """Yield lists of up to `size` items from any iterable"""
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
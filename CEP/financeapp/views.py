@@ -1,16 +1,38 @@
-from django.db.models import Sum
 from django.contrib.auth.models import User
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
 from django.utils import timezone
-from rest_framework import viewsets, permissions
-from rest_framework.decorators import api_view, permission_classes
+from django.utils.dateparse import parse_date
+from django.db.models import F
+from rest_framework import viewsets, permissions, status
+from rest_framework.exceptions import ParseError
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.generics import CreateAPIView
-from datetime import timedelta
-from .models import UserProfile, Account, Category, Transaction, Budget, Goal
+from rest_framework.renderers import JSONRenderer
+import io
+import uuid
+from datetime import date, timedelta
+from .budgets import budget_status, evaluate_budgets
+from .cache import dashboard_etag, get_cached_dashboard, get_cached_forecast, get_dashboard_version
+from .dashboard import build_dashboard_summary
+from .export import EXPORT_FORMATS, export_rows
+from .fastpath import FastListMixin
+from .forecast import FORECAST_MONTHS, MAX_FORECAST_MONTHS, build_forecast
+from .ingest import check_ownership, post_transactions, validate_rows
+from .jobs import enqueue, job_storage
+from .metrics import registry
+from .ledger import HISTORY_INTERVALS, MAX_HISTORY_POINTS, balance_history, history_points
+from .search import filter_transactions
+from .statements import StatementImporter, detect_format, parse_statement
+from .pagination import KeysetPagination, TransactionPagination
+from .reports import GRANULARITIES, GROUP_BY, MAX_REPORT_PERIODS, cashflow_report, report_periods
+from .models import UserProfile, Account, Category, Transaction, RecurringRule, Budget, BudgetAlert, Goal, Job
+from .utils import add_months
 from .serializers import (
     UserProfileSerializer, RegisterSerializer, AccountSerializer,
-    CategorySerializer, TransactionSerializer, BudgetSerializer, GoalSerializer
+    CategorySerializer, TransactionSerializer, BudgetSerializer, GoalSerializer,
+    BudgetAlertSerializer, RecurringRuleSerializer, JobSerializer
 )
 
 class RegisterView(CreateAPIView):
@@ -25,7 +47,36 @@ class UserProfileView(APIView):
         serializer = UserProfileSerializer(profile)
         return Response(serializer.data)
 
-class AccountViewSet(viewsets.ModelViewSet):
+# Report and history ranges must lie within these dates
+EARLIEST_DATE = date(1900, 1, 1)
+LATEST_DATE = date(2099, 12, 31)
+
+def date_range_params(request, default_start):
+    """(from, to) query parameters as dates; `to` defaults to today and `from` to default_start(to)"""
+    try:
+        end = parse_date(request.query_params.get('to') or timezone.now().date().isoformat())
+        start = parse_date(request.query_params.get('from') or default_start(end).isoformat())
+    except (TypeError, ValueError):
+        end = start = None
+    if start is None or end is None:
+        raise ParseError('from and to must be dates (YYYY-MM-DD).')
+    if not EARLIEST_DATE <= start <= LATEST_DATE or not EARLIEST_DATE <= end <= LATEST_DATE:
+        raise ParseError(f'from and to must be between {EARLIEST_DATE} and {LATEST_DATE}.')
+    if start > end:
+        raise ParseError('from must not be after to.')
+    return start, end
+
+def prefers_async(request):
+    """Whether the client asked for the work to be queued as a job (``Prefer: respond-async``, RFC 7240)"""
+    return 'respond-async' in request.headers.get('Prefer', '').lower()
+
+def job_accepted(request, job):
+    """202 response describing a queued job, with its status URL in Location"""
+    data = JobSerializer(job, context={'request': request}).data
+    return Response(data, status=status.HTTP_202_ACCEPTED,
+                    headers={'Location': data['url'], 'Preference-Applied': 'respond-async'})
+
+class AccountViewSet(FastListMixin, viewsets.ModelViewSet):
     serializer_class = AccountSerializer
 
     def get_queryset(self):
@@ -34,7 +85,28 @@ class AccountViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class CategoryViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['get'], url_path='balance-history', url_name='balance-history')
+    def balance_history_report(self, request, pk=None):
+        """Closing balance at the end of every day, week or month of a date range"""
+        account = self.get_object()
+        start, end = date_range_params(request, lambda end: end - timedelta(days=30))
+
+        interval = request.query_params.get('interval', 'day')
+        if interval not in HISTORY_INTERVALS:
+            return Response({'detail': f"interval must be one of {', '.join(HISTORY_INTERVALS)}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(history_points(start, end, interval)) > MAX_HISTORY_POINTS:
+            return Response({'detail': f'At most {MAX_HISTORY_POINTS} points per request; use a longer interval.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'account': account.pk,
+            'currency': account.currency,
+            'interval': interval,
+            'history': balance_history(account, start, end, interval),
+        })
+
+class CategoryViewSet(FastListMixin, viewsets.ModelViewSet):
     serializer_class = CategorySerializer
 
     def get_queryset(self):
@@ -49,41 +121,121 @@ class CategoryViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class TransactionViewSet(viewsets.ModelViewSet):
+class TransactionViewSet(FastListMixin, viewsets.ModelViewSet):
     serializer_class = TransactionSerializer
+    pagination_class = TransactionPagination
 
     def get_queryset(self):
-        queryset = Transaction.objects.filter(user=self.request.user)
+        queryset = Transaction.objects.filter(user=self.request.user).select_related('account', 'category')
 
-        # Apply filters
-        account_id = self.request.query_params.get('account', None)
-        category_id = self.request.query_params.get('category', None)
-        transaction_type = self.request.query_params.get('type', None)
-        date_range = self.request.query_params.get('date_range', None)
+        return filter_transactions(queryset, self.request.query_params)
 
-        if account_id and account_id != 'all':
-            queryset = queryset.filter(account_id=account_id)
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
 
-        if category_id and category_id != 'all':
-            queryset = queryset.filter(category_id=category_id)
+    def perform_content_negotiation(self, request, force=False):
+        # ?format= names the export format here, not a DRF renderer; errors are still JSON
+        if self.action == 'export':
+            return JSONRenderer(), JSONRenderer.media_type
+        return super().perform_content_negotiation(request, force)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream every matching transaction as CSV, NDJSON or (with pyarrow) Parquet
+
+        With ``Prefer: respond-async`` the file is written by a background job
+        instead, to be downloaded from the job once it has finished.
+        """
+        export_format = request.query_params.get('format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return Response({'detail': f"format must be one of {', '.join(EXPORT_FORMATS)}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if prefers_async(request):
+            job = enqueue('export_transactions', request.user, {**request.query_params.dict(), 'format': export_format})
+            return job_accepted(request, job)
+
+        content_type, extension, stream = EXPORT_FORMATS[export_format]
+        rows = export_rows(self.filter_queryset(self.get_queryset()), request.user)
+        response = StreamingHttpResponse(stream(rows), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="transactions.{extension}"'
+        return response
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Create a batch of transactions in one request; nothing is saved if any row is invalid"""
+        rows = request.data.get('transactions') if isinstance(request.data, dict) else request.data
+        if not isinstance(rows, list):
+            return Response({'detail': 'Expected a list of transactions.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        validated, errors = validate_rows(rows)
+        if not errors:
+            errors = check_ownership(request.user, validated)
+
+        if errors:
+            return Response({
+                'created': 0,
+                'errors': [{'row': index, 'errors': row_errors} for index, row_errors in sorted(errors.items())]
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        created = post_transactions([Transaction(user=request.user, **row) for row in validated])
+        return Response({'created': created, 'errors': []}, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_statement(self, request):
+        """Stream an uploaded CSV/OFX statement into one of the user's accounts
+
+        With ``Prefer: respond-async`` the upload is stored and imported by a
+        background job; the job's result holds the same stats.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'file': ['No statement uploaded.']}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            account = Account.objects.get(pk=request.data.get('account'), user=request.user)
+        except (Account.DoesNotExist, ValueError):
+            return Response({'account': ['Invalid account.']}, status=status.HTTP_400_BAD_REQUEST)
+
+        file_format = request.data.get('statement_format') or detect_format(upload.name)
+        try:
+            start_row = int(request.data.get('start_row', 0))
+        except ValueError:
+            return Response({'start_row': ['A valid integer is required.']}, status=status.HTTP_400_BAD_REQUEST)
+
+        if prefers_async(request):
+            stored = job_storage().save(f'imports/{uuid.uuid4().hex}', upload)
+            job = enqueue('import_statement', request.user, {
+                'account': account.pk,
+                'file': stored,
+                'statement_format': file_format,
+                'default_category': request.data.get('default_category'),
+                'start_row': start_row,
+            })
+            return job_accepted(request, job)
 
-        if transaction_type and transaction_type != 'all':
-            queryset = queryset.filter(transaction_type=transaction_type)
+        importer = StatementImporter(
+            request.user, account,
+            default_category=request.data.get('default_category'),
+            start_row=start_row
+        )
+        lines = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+        try:
+            stats = importer.run(parse_statement(lines, file_format))
+        except ValueError as exc:
+            return Response({'detail': str(exc), **importer.stats}, status=status.HTTP_400_BAD_REQUEST)
 
-        if date_range:
-            today = timezone.now().date()
+        return Response(stats, status=status.HTTP_201_CREATED)
 
-            if date_range == 'month':
-                start_date = today.replace(day=1)
-                queryset = queryset.filter(date__gte=start_date)
-            elif date_range == 'quarter':
-                start_date = today - timedelta(days=90)
-                queryset = queryset.filter(date__gte=start_date)
-            elif date_range == 'year':
-                start_date = today.replace(month=1, day=1)
-                queryset = queryset.filter(date__gte=start_date)
+ALERTS_PAGE_SIZE = 100
 
-        return queryset.order_by('-date')
+class RecurringRuleViewSet(viewsets.ModelViewSet):
+    """Rules are turned into transactions by `manage.py materialize_recurring`"""
+    serializer_class = RecurringRuleSerializer
+
+    def get_queryset(self):
+        return RecurringRule.objects.filter(user=self.request.user).select_related(
+            'account', 'category'
+        ).order_by(F('next_date').asc(nulls_last=True), 'id')
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -92,11 +244,40 @@ class BudgetViewSet(viewsets.ModelViewSet):
     serializer_class = BudgetSerializer
 
     def get_queryset(self):
-        return Budget.objects.filter(user=self.request.user).order_by('category__name')
+        queryset = Budget.objects.filter(user=self.request.user).select_related('category').order_by('category__name')
+
+        # List endpoints evaluate all budgets in one pass instead
+        if self.action not in ('list', 'status_report', 'alerts'):
+            queryset = queryset.with_spent_amount()
+
+        return queryset
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    def list(self, request, *args, **kwargs):
+        budgets = evaluate_budgets(request.user, self.filter_queryset(self.get_queryset()))
+        return Response(self.get_serializer(budgets, many=True).data)
+
+    @action(detail=False, methods=['get'], url_path='status', url_name='status')
+    def status_report(self, request):
+        """Spent, remaining and threshold state of every budget"""
+        today = timezone.now().date()
+        budgets = evaluate_budgets(request.user, self.get_queryset())
+        return Response([budget_status(budget, today) for budget in budgets])
+
+    @action(detail=False, methods=['get'])
+    def alerts(self, request):
+        """Threshold alerts newer than the `since` alert id, for clients to poll"""
+        alerts = BudgetAlert.objects.filter(user=request.user).select_related('budget__category').order_by('id')
+        since = request.query_params.get('since')
+        if since:
+            try:
+                alerts = alerts.filter(id__gt=int(since))
+            except ValueError:
+                return Response({'detail': 'since must be an alert id.'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(BudgetAlertSerializer(alerts[:ALERTS_PAGE_SIZE], many=True).data)
+
 class GoalViewSet(viewsets.ModelViewSet):
     serializer_class = GoalSerializer
 
@@ -106,100 +287,77 @@ class GoalViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    """Status, progress and result of the user's background jobs, newest first (run by `manage.py run_worker`)"""
+    serializer_class = JobSerializer
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        return Job.objects.filter(user=self.request.user).order_by('-id')
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """The file written by a finished export job"""
+        job = self.get_object()
+        if job.status != Job.SUCCEEDED or not (job.result or {}).get('file'):
+            return Response({'detail': 'This job has no file to download.'}, status=status.HTTP_404_NOT_FOUND)
+        return FileResponse(job_storage().open(job.result['file'], 'rb'), as_attachment=True,
+                            filename=job.result['filename'], content_type=job.result['content_type'])
+
 @api_view(['GET'])
 def dashboard_summary(request):
-    """Get summary data for the dashboard"""
+    """Get summary data for the dashboard, cached per user until their data changes"""
     user = request.user
-
-    # Get account totals
-    accounts = Account.objects.filter(user=user)
-    total_balance = accounts.aggregate(Sum('balance'))['balance__sum'] or 0
-
-    # Get monthly income and expenses
     today = timezone.now().date()
-    start_of_month = today.replace(day=1)
+    version = get_dashboard_version(user.pk)
+    etag = dashboard_etag(user.pk, version, today)
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+
+    if etag in request.headers.get('If-None-Match', ''):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
 
-    month_transactions = Transaction.objects.filter(
-        user=user,
-        date__gte=start_of_month,
-        date__lte=today
-    )
+    data = get_cached_dashboard(user.pk, version, today, lambda: build_dashboard_summary(user, today))
+    return Response(data, headers=headers)
 
-    income = month_transactions.filter(transaction_type='income').aggregate(Sum('amount'))['amount__sum'] or 0
-    expenses = month_transactions.filter(transaction_type='expense').aggregate(Sum('amount'))['amount__sum'] or 0
+@api_view(['GET'])
+def cashflow(request):
+    """Income, expenses and net per day/week/month/quarter/year, optionally split by category, account or payment method"""
+    start, end = date_range_params(request, lambda end: add_months(end, -11))
+
+    granularity = request.query_params.get('granularity', 'month')
+    if granularity not in GRANULARITIES:
+        raise ParseError(f"granularity must be one of {', '.join(GRANULARITIES)}.")
+    group_by = request.query_params.get('group_by') or None
+    if group_by is not None and group_by not in GROUP_BY:
+        raise ParseError(f"group_by must be one of {', '.join(GROUP_BY)}.")
+    if len(report_periods(start, end, granularity)) > MAX_REPORT_PERIODS:
+        raise ParseError(f'At most {MAX_REPORT_PERIODS} periods per report; use a coarser granularity.')
+
+    if prefers_async(request):
+        job = enqueue('cashflow_report', request.user, {
+            'from': start.isoformat(), 'to': end.isoformat(), 'granularity': granularity, 'group_by': group_by,
+        })
+        return job_accepted(request, job)
+
+    return Response(cashflow_report(request.user, start, end, granularity, group_by))
 
-    # Get recent transactions
-    recent_transactions = TransactionSerializer(
-        Transaction.objects.filter(user=user).order_by('-date')[:5],
-        many=True
-    ).data
+@api_view(['GET'])
+def forecast(request):
+    """Projected month-end account balances and goal completion dates, cached until the user's data changes"""
+    try:
+        months = int(request.query_params.get('months', FORECAST_MONTHS))
+    except ValueError:
+        raise ParseError('months must be a whole number.')
+    if not 1 <= months <= MAX_FORECAST_MONTHS:
+        raise ParseError(f'months must be between 1 and {MAX_FORECAST_MONTHS}.')
 
-    # Get spending by category
+    user = request.user
     today = timezone.now().date()
-    start_of_month = today.replace(day=1)
-
-    expense_categories = Category.objects.filter(user=user, category_type='expense')
-    category_spending = []
-
-    for category in expense_categories:
-        amount = Transaction.objects.filter(
-            user=user,
-            category=category,
-            transaction_type='expense',
-            date__gte=start_of_month,
-            date__lte=today
-        ).aggregate(Sum('amount'))['amount__sum'] or 0
-
-        if amount > 0:
-            category_spending.append({
-                'category': category.name,
-                'color': category.color,
-                'amount': amount
-            })
+    version = get_dashboard_version(user.pk)
+    return Response(get_cached_forecast(user.pk, version, today, months, lambda: build_forecast(user, today, months)))
 
-    # Get monthly income/expense data for chart
-    months = []
-    income_data = []
-    expense_data = []
-
-    for i in range(6):
-        # Get data for last 6 months
-        end_date = timezone.now().date().replace(day=1) - timedelta(days=1) if i == 0 else months[-1]
-        start_date = end_date.replace(day=1)
-
-        month_name = start_date.strftime('%b')
-        months.append(month_name)
-
-        month_income = Transaction.objects.filter(
-            user=user,
-            transaction_type='income',
-            date__gte=start_date,
-            date__lte=end_date
-        ).aggregate(Sum('amount'))['amount__sum'] or 0
-        income_data.append(float(month_income))
-
-        month_expenses = Transaction.objects.filter(
-            user=user,
-            transaction_type='expense',
-            date__gte=start_date,
-            date__lte=end_date
-        ).aggregate(Sum('amount'))['amount__sum'] or 0
-        expense_data.append(float(month_expenses))
-
-    # Reverse lists to show chronological order
-    months.reverse()
-    income_data.reverse()
-    expense_data.reverse()
-
-    return Response({
-        'total_balance': float(total_balance),
-        'month_income': float(income),
-        'month_expenses': float(expenses),
-        'recent_transactions': recent_transactions,
-        'category_spending': category_spending,
-        'chart_data': {
-            'months': months,
-            'income': income_data,
-            'expenses': expense_data
-        }
-    })
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def metrics(request):
+    """Per-view request statistics of this process in Prometheus text format (staff only)"""
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
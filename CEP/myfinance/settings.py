@@ -1,4 +1,5 @@
 import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -28,6 +29,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Removes itself at startup unless METRICS_ENABLED is set
+    'financeapp.metrics.MetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -58,12 +61,104 @@ TEMPLATES = [
 WSGI_APPLICATION = 'myfinance.wsgi.application'
 
 # Database
-DATABASES = {
-    'default': {
+# sqlite suits development and a single host; postgres is the production profile.
+DATABASE_BACKEND = os.environ.get('DATABASE_BACKEND', 'sqlite')
+DATABASE_BACKENDS = {
+    'sqlite': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+        'OPTIONS': {
+            # Busy timeout in seconds: wait for a competing writer instead of "database is locked"
+            'timeout': int(os.environ.get('DB_BUSY_TIMEOUT', 20)),
+            'init_command': f"PRAGMA mmap_size={int(os.environ.get('DB_MMAP_SIZE', 256 * 1024 * 1024))};",
+        },
+        # Tests use a file rather than shared-cache memory, which fails concurrent writers instead of queueing them
+        'TEST': {'NAME': os.environ.get('DB_TEST_NAME', BASE_DIR / 'test_db.sqlite3')},
+    },
+    'postgres': {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('DB_NAME', 'myfinance'),
+        'USER': os.environ.get('DB_USER', 'myfinance'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+        'HOST': os.environ.get('DB_HOST', 'localhost'),
+        'PORT': os.environ.get('DB_PORT', '5432'),
+        # Persistent connections, checked before reuse
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        # A local pgbouncer in transaction mode can't hold server-side cursors between transactions
+        'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('DB_PGBOUNCER', '0') == '1',
+        'OPTIONS': {},
+    },
+}
+# Concurrent writers on one SQLite file (the test run, DB_SQLITE_CONCURRENT=1 for benchmarks on a scratch
+# DB_NAME): BEGIN IMMEDIATE takes the write lock up front so writers queue rather than fail on lock upgrade,
+# and WAL lets readers run alongside the writer. IMMEDIATE also makes read-only atomic() blocks take the
+# write lock, and WAL mode is written into the database file, so neither is applied by default.
+SQLITE_CONCURRENT = os.environ.get('DB_SQLITE_CONCURRENT', '0') == '1' or sys.argv[1:2] == ['test']
+if SQLITE_CONCURRENT:
+    DATABASE_BACKENDS['sqlite']['OPTIONS']['transaction_mode'] = 'IMMEDIATE'
+    # NORMAL sync is safe in WAL mode and much faster
+    DATABASE_BACKENDS['sqlite']['OPTIONS']['init_command'] += 'PRAGMA journal_mode=WAL;PRAGMA synchronous=NORMAL;'
+# DB_POOL_SIZE > 0 uses psycopg's in-process pool instead of persistent connections (psycopg 3 only)
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 0))
+if DB_POOL_SIZE:
+    DATABASE_BACKENDS['postgres']['CONN_MAX_AGE'] = 0
+    DATABASE_BACKENDS['postgres']['OPTIONS']['pool'] = {'min_size': 1, 'max_size': DB_POOL_SIZE}
+DATABASES = {
+    'default': DATABASE_BACKENDS[DATABASE_BACKEND],
+}
+
+# Cache
+# locmem is per-process (dev); use file or db for several workers without Redis.
+# The db backend needs `manage.py createcachetable` once.
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'myfinance',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_LOCATION', os.path.join(BASE_DIR, '.cache')),
+    },
+    'db': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'myfinance_cache'),
+    },
+}
+CACHES = {
+    'default': CACHE_BACKENDS[CACHE_BACKEND],
+}
+
+# Seconds a cached dashboard may live; writes invalidate it earlier
+DASHBOARD_CACHE_TIMEOUT = int(os.environ.get('DASHBOARD_CACHE_TIMEOUT', 300))
+
+# Seconds a cached forecast may live; writes invalidate it earlier and it is rebuilt daily
+FORECAST_CACHE_TIMEOUT = int(os.environ.get('FORECAST_CACHE_TIMEOUT', 86400))
+
+# Threads shared by all requests to the async dashboard for running its sections
+DASHBOARD_ASYNC_WORKERS = int(os.environ.get('DASHBOARD_ASYNC_WORKERS', 8))
+
+# Currency that ExchangeRate.rate values are quoted in (see `manage.py load_fx_rates`)
+FX_BASE_CURRENCY = os.environ.get('FX_BASE_CURRENCY', 'USD')
+
+# Per-view query counts and timings, served at /api/_metrics/ and in Server-Timing headers
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '0') == '1'
+
+# Background jobs run by `manage.py run_worker`. Uploaded statements and finished exports are kept
+# in the "jobs" storage, which every worker and web process must share.
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    'jobs': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {'location': os.environ.get('JOB_FILES_ROOT', os.path.join(BASE_DIR, 'job_files'))},
+    },
 }
+# A running job whose worker has not checked in for this many seconds is retried or failed
+JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', 300))
+# Seconds an idle worker waits before looking for queued jobs again
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1))
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [